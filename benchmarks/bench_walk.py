@@ -0,0 +1,71 @@
+"""Compares the scandir walker with the Path based traversals it replaced
+
+    python -m benchmarks.bench_walk [--dirs N] [--files N] [--depth N] [--path DIR]
+
+Without --path a temporary tree of dirs * files files is generated.
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Iterator
+import argparse
+import time
+
+from src.utils.walk_utils import walk, walk_files
+
+
+def iterdir_files(path: Path) -> Iterator[Path]:
+    # grep before the walker
+    for file_path in path.iterdir():
+        if file_path.is_dir():
+            yield from iterdir_files(file_path)
+        else:
+            yield file_path
+
+
+def make_tree(root: Path, dirs: int, files: int, depth: int):
+    for d in range(dirs):
+        folder = root.joinpath(*(f"d{d}_{level}" for level in range(d % depth + 1)))
+        folder.mkdir(parents=True, exist_ok=True)
+        for f in range(files):
+            (folder / f"f{f}.txt").write_bytes(b"")
+
+
+def best_of(func: Callable[[], int], repeat: int = 5) -> tuple[float, int]:
+    best, count = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func()
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def run(root: Path):
+    cases = {
+        "Path.iterdir recursion (old grep)": lambda: sum(1 for _ in iterdir_files(root)),
+        "walk_files (grep)": lambda: sum(1 for _ in walk_files(root)),
+        "Path.rglob('*') (old zip)": lambda: sum(1 for _ in root.rglob("*")),
+        "walk(dirs=True) (zip)": lambda: sum(1 for _ in walk(root, dirs=True)),
+    }
+    for name, func in cases.items():
+        seconds, count = best_of(func)
+        print(f"{name:<36} {seconds * 1000:9.1f} ms  {count} entries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirs", type=int, default=500)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--path", type=Path, help="walk an existing tree instead")
+    args = parser.parse_args()
+
+    if args.path:
+        run(args.path)
+        return
+    with TemporaryDirectory() as tmp:
+        make_tree(Path(tmp), args.dirs, args.files, args.depth)
+        run(Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
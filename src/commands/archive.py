@@ -6,6 +6,7 @@ import logging
 
 from src.commands.base import ArchiveCommand
 from src.utils.path_utils import resolve_path
+from src.utils.walk_utils import walk
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +22,17 @@ class Zip(ArchiveCommand):
         self.ensure_zip(dest)
 
         logger.info(f"Archiving {src} -> {dest}")
-        self.safe_exec(self.zip_dir, src, dest,
-                       msg = f"Error zipping the folder {src.name} into {dest.name}")
+        try:
+            self.safe_exec(self.zip_dir, src, dest,
+                           msg = f"Error zipping the folder {src.name} into {dest.name}")
+        finally:
+            ctx.dir_cache.invalidate(dest)
 
     @staticmethod
     def zip_dir(folder: Path, dest: Path):
         with ZipFile(dest, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
-            for file in folder.rglob('*'):
-                zipf.write(file, arcname=file.relative_to(folder))
+            for entry in walk(folder, dirs=True):
+                zipf.write(entry.path, arcname=Path(entry.path).relative_to(folder))
 
     def undo(self, cmd, ctx):
             return super().undo(cmd, ctx)
@@ -45,8 +49,11 @@ class Unzip(ArchiveCommand):
         self.ensure_zip(src)
 
         logger.info(f"Unarchiving {src} -> {dest_dir}")
-        self.safe_exec(self.unzip_dir, src,
-                        dest_dir, msg=f"Error unzipping the file {src.name} into {dest_dir.name}")
+        try:
+            self.safe_exec(self.unzip_dir, src,
+                            dest_dir, msg=f"Error unzipping the file {src.name} into {dest_dir.name}")
+        finally:
+            ctx.dir_cache.invalidate(dest_dir)
 
     @staticmethod
     def unzip_dir(zipfile: Path, dest_dir: Path):
@@ -69,8 +76,11 @@ class Tar(ArchiveCommand):
         self.ensure_tar(dest)
 
         logger.info(f"Archiving {src} -> {dest}")
-        self.safe_exec(self.tar_dir, src, dest,
-                        msg = f'Error tarring the folder {src.name} into {dest.name}')
+        try:
+            self.safe_exec(self.tar_dir, src, dest,
+                            msg = f'Error tarring the folder {src.name} into {dest.name}')
+        finally:
+            ctx.dir_cache.invalidate(dest)
 
     @staticmethod
     def tar_dir(folder: Path, dest: Path):
@@ -92,8 +102,11 @@ class Untar(ArchiveCommand):
         self.ensure_tar(src)
 
         logger.info(f"Unarchiving {src} -> {dest_dir}")
-        self.safe_exec(self.untar_dir, src, dest_dir,
-                       msg = f'Error untarring the file {src.name} into {dest_dir.name}')
+        try:
+            self.safe_exec(self.untar_dir, src, dest_dir,
+                           msg = f'Error untarring the file {src.name} into {dest_dir.name}')
+        finally:
+            ctx.dir_cache.invalidate(dest_dir)
 
     @staticmethod
     def untar_dir(src_tar: Path, dest_dir: Path):
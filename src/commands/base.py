@@ -1,12 +1,14 @@
 from pathlib import Path
+from typing import Iterator
 import logging
 
 from src.core.models import ParsedCommand
 from src.core.services import Context
 from src.core.errors import ExecutionError
 from src.utils.path_utils import resolve_path
-from src.utils.misc_utils import has_flag
-from src.config import HOME_DIR
+from src.utils.misc_utils import has_flag, get_option, parse_size
+from src.utils.walk_utils import ignore_names, is_empty_dir, walk_files
+from src.config import HOME_DIR, GREP_IGNORE_FILES, GREP_SKIP_DIRS
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +47,26 @@ class Command:
             logger.debug(f"Expected file, got: {path}")
             raise ExecutionError(f"Expected file, got: {path}")
 
+    def int_option(self, cmd: ParsedCommand, *names: str, default: int | None = None) -> int | None:
+        """Option value as int, raises ExecutionError if it is not a number."""
+        value = get_option(cmd, *names)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ExecutionError(f"Option '{names[0]}' expects a number, got '{value}'")
+
+    def size_option(self, cmd: ParsedCommand, *names: str, default: int | None = None) -> int | None:
+        """Option value in bytes (K/M/G/T suffixes), raises ExecutionError if it is not a size."""
+        value = get_option(cmd, *names)
+        if value is None:
+            return default
+        try:
+            return parse_size(value)
+        except ValueError:
+            raise ExecutionError(f"Option '{names[0]}' expects a size like 100K or 2M, got '{value}'")
+
     def safe_exec(self, func, *args, msg: str = "Execution failed", **kwargs):
         """Wrapper to handle common exceptions."""
         try:
@@ -72,7 +94,7 @@ class FileSystemCommand(Command):
     def ensure_recursive(self, path:Path, cmd: ParsedCommand):
         if (path.is_dir()
             and not has_flag(cmd, 'r', 'recursive')
-            and any(path.iterdir())
+            and not is_empty_dir(path)
             ):
             raise ExecutionError("Unable to work with non-empty directories without --recursive/-r tag.")
 
@@ -90,4 +112,8 @@ class SearchCommand(FileSystemCommand):
 
     Uses FileSystemCommand as parent because it also needs ensure_recursive
     """
-    ...
+
+    def iter_files(self, path:Path, use_ignore_files:bool = True) -> Iterator[Path]:
+        """Files under path, without GREP_SKIP_DIRS and what ignore files exclude"""
+        return walk_files(path, ignore=ignore_names(*GREP_SKIP_DIRS),
+                          ignore_files=GREP_IGNORE_FILES if use_ignore_files else ())
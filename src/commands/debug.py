@@ -0,0 +1,35 @@
+import logging
+
+from src.commands.base import Command
+from src.core.errors import ExecutionError
+
+logger = logging.getLogger(__name__)
+
+class Cache(Command):
+    """Shows how the directory cache (ctx.dir_cache) is doing
+
+    cache [stats] - hits, misses and size of the cache
+    cache clear - forget every cached listing
+    """
+
+    def execute(self, cmd, ctx):
+        action = cmd.positionals[0] if cmd.positionals else 'stats'
+        cache = ctx.dir_cache
+
+        if action == 'clear':
+            cache.clear()
+            ctx.out.writeline("Directory cache cleared")
+        elif action == 'stats':
+            stats = cache.stats()
+            ctx.out.writeline(f"Directory cache\n"
+                  f"  dirs: {stats['dirs']}\n"
+                  f"  entries: {stats['entries']} of {stats['max_entries']}\n"
+                  f"  hits: {stats['hits']}, misses: {stats['misses']} "
+                  f"(hit rate {stats['hit_rate']:.1%})\n"
+                  f"  invalidations: {stats['invalidations']}, evictions: {stats['evictions']}")
+        else:
+            raise ExecutionError(f"Unknown cache action '{action}', expected stats or clear")
+        ctx.out.flush()
+
+    def undo(self, cmd, ctx):
+            return super().undo(cmd, ctx)
@@ -1,11 +1,20 @@
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+from typing import Callable, Iterator
+import os
 import shutil
 import time
 import logging
 
 from src.commands.base import FileSystemCommand, RmCommand
-from src.config import TRASH_DIR
+from src.config import COPY_JOBS, TRASH_DIR
+from src.core.errors import ExecutionError
+from src.utils.copy_utils import REFLINK_MODES, CopyProgress, CopyTask, copy_file, copy_tree
+from src.utils.misc_utils import format_size, get_option, has_flag
+from src.utils.output_utils import OutputSink
 from src.utils.path_utils import resolve_path
+from src.utils.sync_utils import SyncPlan, apply_sync, plan_sync, undo_sync
 from src.core.models import ParsedCommand
 from src.core.services import Context
 
@@ -14,30 +23,76 @@ logger = logging.getLogger(__name__)
 class Cp(FileSystemCommand):
     """Copies file from source to destination
     - Undo removes the copy (Calls Rm)
+
+    --recursive/-r - copy a folder: its folders are created first, then
+    files are copied by several threads, with progress on a terminal
+    --jobs/-j N - threads copying files (default: COPY_JOBS)
+    --reflink=auto|always|never - clone files sharing their blocks where
+    the file system can (btrfs, XFS), see copy_utils.copy_data
     """
 
     def execute(self, cmd: ParsedCommand, ctx: Context) -> None:
         copy_from = resolve_path(cmd.positionals[0], ctx)
         copy_to = resolve_path(cmd.positionals[1], ctx)
 
+        jobs = self.int_option(cmd, 'j', 'jobs', default=COPY_JOBS)
+        reflink = get_option(cmd, 'reflink', default='auto')
+
         self.ensure_exists(copy_from)
         self.ensure_recursive(copy_from, cmd)
+        if jobs is None or jobs < 1:
+            raise ExecutionError(f"--jobs must be a positive number, got {jobs}")
+        if reflink not in REFLINK_MODES:
+            raise ExecutionError(f"--reflink must be one of {', '.join(REFLINK_MODES)}, got '{reflink}'")
 
         logger.info(f"Copying {copy_from} -> {copy_to}")
-        self.safe_exec(self.copy_file, copy_from, copy_to, cmd,
-                       msg = f'Error during copying from {copy_from.name} to {copy_to.name}')
+        try:
+            self.safe_exec(self.copy_file, copy_from, copy_to, cmd, jobs, ctx.out, reflink,
+                           msg = f'Error during copying from {copy_from.name} to {copy_to.name}')
+        finally:
+            ctx.dir_cache.invalidate(copy_to)
 
     @staticmethod
-    def copy_file(src:Path, dst:Path, cmd:ParsedCommand):
-        if hasattr(src, 'copy'):
-            src.copy(dst)
+    def copy_file(src:Path, dst:Path, cmd:ParsedCommand, jobs:int = COPY_JOBS,
+                  out:OutputSink | None = None, reflink:str = 'auto'):
+        if src.is_dir():
+            Cp.copy_tree(src, dst, jobs, out, reflink)
         else:
-            if src.is_dir():
-                shutil.copytree(src, dst)
-            else:
-                shutil.copy(src, dst)
+            method = copy_file(str(src), str(dst), reflink, times=False)
+            logger.info(f"Copied {src.name} with {method}")
         cmd.meta["dest"] = str(dst)
 
+    @staticmethod
+    def copy_tree(src:Path, dst:Path, jobs:int = COPY_JOBS, out:OutputSink | None = None, reflink:str = 'auto'):
+        """Same result as shutil.copytree, see copy_utils.copy_tree"""
+        with Cp.progress(out) as report:
+            progress = copy_tree(src, dst, jobs, partial(copy_file, reflink=reflink), report)
+        Cp.log_copied(progress)
+
+    @staticmethod
+    @contextmanager
+    def progress(out:OutputSink | None) -> Iterator[Callable[[CopyProgress], None]]:
+        """Progress callback redrawing one line on a terminal, silent elsewhere"""
+        if out is None or not out.is_tty:
+            yield lambda progress: None
+            return
+        sink = out # not Optional inside report
+
+        def report(progress:CopyProgress):
+            sink.write(f"\rCopied {progress}")
+            sink.flush()
+
+        try:
+            yield report
+        finally:
+            sink.writeline()
+
+    @staticmethod
+    def log_copied(progress:CopyProgress):
+        logger.info(f"Copied {progress.files} files ({format_size(progress.bytes)}) "
+                    f"in {progress.elapsed:.1f}s, {format_size(int(progress.rate))}/s, "
+                    + ", ".join(f"{method}: {n}" for method, n in progress.methods.most_common()))
+
     def undo(self, cmd: ParsedCommand, ctx: Context) -> None:
         rm = Rm()
         rm_cmd = ParsedCommand(
@@ -53,6 +108,90 @@ class Cp(FileSystemCommand):
 
         rm.execute(rm_cmd, ctx)
 
+class Sync(Cp):
+    """Makes dest a copy of the source folder, copying only what changed
+
+    Files are compared by size and mtime, or with --checksum/-c by size
+    and content hash. New and changed files are copied like in cp -r.
+    --delete - also remove what the source doesn't have
+    --dry-run/-n - only list what would change
+    --jobs/-j N, --reflink - as in cp
+
+    Replaced and deleted entries are moved into a trash folder of the run
+    with a manifest of what was done, its path is kept in the history.
+    - Undo removes the copies and moves the trash back; dry runs and runs
+    that changed nothing are skipped by undo
+    """
+
+    def execute(self, cmd: ParsedCommand, ctx: Context) -> None:
+        src = resolve_path(cmd.positionals[0], ctx)
+        dst = resolve_path(cmd.positionals[1], ctx)
+
+        jobs = self.int_option(cmd, 'j', 'jobs', default=COPY_JOBS)
+        reflink = get_option(cmd, 'reflink', default='auto')
+        delete = has_flag(cmd, 'delete')
+        dry_run = has_flag(cmd, 'n', 'dry-run')
+        checksum = has_flag(cmd, 'c', 'checksum')
+
+        self.ensure_dir(src)
+        if dst.exists() and not dst.is_dir():
+            raise ExecutionError(f"{dst} is not a folder")
+        if jobs is None or jobs < 1:
+            raise ExecutionError(f"--jobs must be a positive number, got {jobs}")
+        if reflink not in REFLINK_MODES:
+            raise ExecutionError(f"--reflink must be one of {', '.join(REFLINK_MODES)}, got '{reflink}'")
+
+        plan = self.safe_exec(plan_sync, src, dst, checksum, jobs,
+                              msg = f"Couldn't compare {src.name} with {dst.name}")
+        summary = (f"{len(plan.new)} new, {len(plan.changed)} changed, {plan.unchanged} unchanged, "
+                   f"{len(plan.extraneous)} {'to delete' if delete else 'extraneous'}, "
+                   f"{format_size(plan.bytes)} to copy")
+        if dry_run or plan.is_empty(delete):
+            cmd.meta["undoable"] = False # undo skips it for the command before
+            if dry_run:
+                self.print_plan(plan, dst, delete, ctx.out)
+            ctx.out.writeline(f"{summary} (dry run)" if dry_run else summary)
+            ctx.out.flush()
+            return
+
+        trash = TRASH_DIR / f"{time.time_ns()}_sync_{dst.name}"
+        logger.info(f"Syncing {src} -> {dst}: {summary}")
+        try:
+            with self.progress(ctx.out) as report:
+                progress = self.safe_exec(apply_sync, plan, dst, trash, delete, jobs,
+                                          partial(copy_file, reflink=reflink), report,
+                                          msg = f"Error during syncing {src.name} to {dst.name}")
+        except ExecutionError:
+            logger.warning(f"Sync stopped, what it replaced is in {trash}")
+            raise
+        finally:
+            ctx.dir_cache.invalidate(dst)
+        cmd.meta["dest"] = str(dst)
+        cmd.meta["trash"] = str(trash)
+        self.log_copied(progress)
+        ctx.out.writeline(summary.replace("to delete", "deleted").replace("to copy", "copied"))
+        ctx.out.flush()
+
+    @staticmethod
+    def print_plan(plan:SyncPlan, dst:Path, delete:bool, out:OutputSink):
+        """+ created, ~ replaced, - removed"""
+        def rel(task:CopyTask) -> str:
+            return os.path.relpath(task[1], dst)
+
+        out.writelines(f"- {path}" for path in plan.conflicts)
+        if delete:
+            out.writelines(f"- {path}" for path in plan.extraneous)
+        out.writelines(f"+ {path}{os.sep}" for path in plan.mkdirs if path != ".")
+        out.writelines(f"+ {rel(task)}" for task in plan.new)
+        out.writelines(f"~ {rel(task)}" for task in plan.changed)
+
+    def undo(self, cmd: ParsedCommand, ctx: Context) -> None:
+        dst = Path(cmd.meta["dest"])
+        try:
+            undo_sync(dst, Path(cmd.meta["trash"]))
+        finally:
+            ctx.dir_cache.invalidate(dst)
+
 class Mv(FileSystemCommand):
     """Moves file from source to destination
     - Undo moves the files from destination to source (Calls Mv)
@@ -69,8 +208,12 @@ class Mv(FileSystemCommand):
         self.ensure_recursive(move_from, cmd)
 
         logger.warning(f"Moving {move_from} → {move_to}")
-        self.safe_exec(self.move_file, move_from, move_to, cmd,
-                       msg = f'Error during moving from {move_from.name} to {move_to.name}')
+        try:
+            self.safe_exec(self.move_file, move_from, move_to, cmd,
+                           msg = f'Error during moving from {move_from.name} to {move_to.name}')
+        finally:
+            ctx.dir_cache.invalidate(move_from)
+            ctx.dir_cache.invalidate(move_to)
 
     @staticmethod
     def move_file(src:Path, dst:Path, cmd:ParsedCommand):
@@ -121,8 +264,11 @@ class Rm(RmCommand):
                     agreed = False
                     return
 
-        self.safe_exec(self.remove_file, target, cmd, fully_remove,
-                       msg = f"Couldn't remove {target.name}")
+        try:
+            self.safe_exec(self.remove_file, target, cmd, fully_remove,
+                           msg = f"Couldn't remove {target.name}")
+        finally:
+            ctx.dir_cache.invalidate(target)
 
     @staticmethod
     def remove_file(target:Path, cmd:ParsedCommand, fully_remove:bool):
@@ -1,74 +1,175 @@
+from collections import deque
 from datetime import datetime
+from typing import Iterable
 import logging
 
 from colorama import Fore, Style
 from src.commands.base import Command
+from src.config import HISTORY_DISPLAY_PAGE
 from src.utils.misc_utils import (
-    get_history, remove_entry_from_file, cmd_from_history_entry
+    cmd_from_history_entry, last_history_entry, forget_history_entry, flush_history,
+    iter_history, iter_all_history, tail_history, count_history, search_history, has_flag, get_option
 )
+from src.utils.output_utils import OutputSink
+from src.utils.path_utils import resolve_path
 
 from src.core.errors import ExecutionError
-from src.commands.filesystem import Cp, Mv, Rm
+from src.commands.filesystem import Cp, Mv, Rm, Sync
 
 logger = logging.getLogger(__name__)
 
+# appended to --until so that every timestamp starting with it is included
+PREFIX_END = "\uffff"
+WRITE_BATCH = 4096 # lines per write to the output sink
+
 class History(Command):
-    """Outputs history of commands from .history.json"""
+    """Outputs history of commands
+
+    --all/-a - also streams entries rotated into the history archive
+    -n N - only the newest N entries, read from the end of the history
+    --page P - P-th page of N entries counting from the newest
+    --since/--until DATE - ISO date or datetime bounds, both inclusive
+    --cmd NAME - only entries of this command
+    --cwd PATH - only entries run in this directory
+
+    history search <terms> - entries containing every term (words of raw,
+    positionals and cwd, matched by prefix), looked up in the search index.
+    Takes -n and the filters above
+    """
 
     def execute(self, cmd, ctx):
-        history = get_history()
-        if history:
-            self.display_history(history)
+        if cmd.positionals:
+            return self.execute_subcommand(cmd, ctx)
+
+        filters = self.get_filters(cmd, ctx)
+        count = self.int_option(cmd, 'n')
+        page = self.int_option(cmd, 'page')
+        if page is not None and count is None:
+            count = HISTORY_DISPLAY_PAGE
+        offset = (max(page or 1, 1) - 1) * count if count else 0
+
+        # rows are numbered by their position in the whole listing
+        history: Iterable[dict]
+        first = 1
+        if has_flag(cmd, 'a', 'all'):
+            history = iter_all_history(**filters)
+            if count is not None:
+                # archives are gzip streams, keep a bounded tail while reading
+                window: deque[dict] = deque(maxlen=count + offset)
+                total = 0
+                for total, record in enumerate(history, start=1):
+                    window.append(record)
+                history = list(window)[:max(len(window) - offset, 0)]
+                first = total - offset - len(history) + 1
+        elif count is not None:
+            history = tail_history(count, offset, **filters)
+            first = count_history(**filters) - offset - len(history) + 1
         else:
+            history = iter_history(**filters)
+
+        if not self.display_history(history, ctx.out, first):
             logger.warning('History is empty')
 
+    def execute_subcommand(self, cmd, ctx):
+        subcommand, *terms = cmd.positionals
+        if subcommand != 'search':
+            raise ExecutionError(f"Unknown history subcommand '{subcommand}', expected 'search'")
+        if not terms:
+            raise ExecutionError("history search expects at least one term")
+        if get_option(cmd, 'page') is not None:
+            raise ExecutionError("history search doesn't take --page, use -n")
+
+        results = search_history(terms, self.int_option(cmd, 'n'), **self.get_filters(cmd, ctx))
+        if not self.display_history(results, ctx.out):
+            logger.warning(f"No history entries match {' '.join(terms)}")
+
     def undo(self, cmd, ctx):
             return super().undo(cmd, ctx)
 
+    def get_filters(self, cmd, ctx) -> dict[str, str]:
+        filters = {}
+        if (name := get_option(cmd, 'cmd')) is not None:
+            filters['name'] = name
+        if (cwd := get_option(cmd, 'cwd')) is not None:
+            filters['cwd'] = str(resolve_path(cwd, ctx))
+        if (since := get_option(cmd, 'since')) is not None:
+            filters['since'] = self.check_date(since, 'since')
+        if (until := get_option(cmd, 'until')) is not None:
+            filters['until'] = self.check_date(until, 'until') + PREFIX_END
+        return filters
+
+    @staticmethod
+    def check_date(value:str, option:str) -> str:
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ExecutionError(f"--{option} expects a date like 2025-01-31 "
+                                 f"or 2025-01-31T10:30, got '{value}'")
+        return value
+
     @staticmethod
-    def display_history(history:list[dict]):
+    def display_history(history:Iterable[dict], out:OutputSink, first:int = 1) -> int:
         GREEN = Fore.GREEN + Style.BRIGHT
         YELLOW = Fore.YELLOW + Style.BRIGHT
         RESET = Style.RESET_ALL
 
-        for num, cmd in enumerate(history, start=1):
-            dt = datetime.fromisoformat(cmd['timestamp'])
-            dt_str = dt.strftime("%d %b %H:%M")
-            line = (
+        # entries of the same minute share the formatted time
+        minutes: dict[str, str] = {}
+        lines: list[str] = []
+        num = 0
+        for num, cmd in enumerate(history, start=first):
+            timestamp = cmd['timestamp']
+            dt_str = minutes.get(timestamp[:16])
+            if dt_str is None:
+                dt = datetime.fromisoformat(timestamp)
+                dt_str = minutes[timestamp[:16]] = dt.strftime("%d %b %H:%M")
+            lines.append(
                         f"{GREEN}{num}{RESET}:"
                         f"{YELLOW}{dt_str}{RESET}:"
                         f"{cmd['raw']}"
                     )
-            print(line)
+            if len(lines) >= WRITE_BATCH:
+                out.writelines(lines)
+                lines.clear()
+                minutes.clear()
+
+        out.writelines(lines)
+        out.flush()
+        return num
 
 UNDOABLE_OPERATIONS = {
     'cp': Cp().undo,
     'mv': Mv().undo,
-    'rm': Rm().undo
+    'rm': Rm().undo,
+    'sync': Sync().undo
 }
 
+def is_undoable(meta:dict) -> bool:
+    """Commands that changed nothing (sync -n...) set meta["undoable"] = False"""
+    return meta.get("undoable", True)
+
 class Undo(Command):
     """Executes all undo commands of other classes
 
-    Looks for a command from the end to start and undoes it.
+    Looks for the newest undoable command (in memory first, then in the
+    history store) and undoes it.
     If the undoable command wasn't found just returns user friendly output.
     """
     def execute(self, cmd, ctx):
+        flush_history() # undo must see everything written so far
         # Find the last undoable operation
-        for i in range(len(ctx.history) - 1, -1, -1):
-            entry = ctx.history[i]
-
-            if entry.name in UNDOABLE_OPERATIONS:
-                try:
-                    prev_cmd = cmd_from_history_entry(entry)
-                    UNDOABLE_OPERATIONS[entry.name](prev_cmd, ctx)
-                except Exception as e:
-                    raise ExecutionError(f"Failed to undo {entry.name}. Error: {e}")
-                ctx.history.pop(i)
-                remove_entry_from_file(entry.id)
-                break
-        else:
-            print("No commands to undo")
+        entry = last_history_entry(ctx, UNDOABLE_OPERATIONS, is_undoable)
+        if entry is None:
+            ctx.out.writeline("No commands to undo")
+            ctx.out.flush()
+            return
+
+        try:
+            prev_cmd = cmd_from_history_entry(entry)
+            UNDOABLE_OPERATIONS[entry.name](prev_cmd, ctx)
+        except Exception as e:
+            raise ExecutionError(f"Failed to undo {entry.name}. Error: {e}")
+        forget_history_entry(ctx, entry)
 
     def undo(self, cmd, ctx):
             return super().undo(cmd, ctx)
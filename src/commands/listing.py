@@ -1,12 +1,19 @@
 from datetime import datetime
-from tabulate import tabulate
 from pathlib import Path
+from typing import BinaryIO, Iterable
+import codecs
+import os
 import stat
 import logging
 
 from src.commands.base import Command
+from src.config import DU_JOBS, HEAD_LINES, LS_STAT_JOBS, READ_BLOCK
+from src.core.errors import ExecutionError
 from src.utils.path_utils import resolve_path
-from src.utils.misc_utils import has_flag
+from src.utils.misc_utils import format_size, has_flag
+from src.utils.output_utils import OutputSink, write_table
+from src.utils.du_utils import DuCache, read_tree, totals, usage
+from src.utils.walk_utils import stat_entries
 
 logger = logging.getLogger(__name__)
 
@@ -14,37 +21,115 @@ class Ls(Command):
     """Returns a list of files in the dir
 
     --long/-l - gives full data about files in the dir
+    --all/-a - also show entries starting with a dot
+    --human-readable/-h - sizes like 1.5K, 12M with -l
+    --recursive/-R - list subdirectories too, each under its path
+    -S - largest first, -t - newest first, -X - by extension
+    (otherwise in directory order)
+
+    Entries are written while the directory is read, so huge directories
+    start printing at once; -l columns are sized from the first rows.
+    Sorting has to read the whole directory first. Listings come from
+    ctx.dir_cache while the directory is unchanged.
     """
 
     def execute(self, cmd, ctx):
         directory = resolve_path(cmd.positionals[0], ctx) if cmd.positionals else ctx.cwd
-        long = has_flag(cmd, 'l', 'long')
+        recursive = has_flag(cmd, 'R', 'recursive')
 
         self.ensure_exists(directory)
         self.ensure_dir(directory)
 
-        data = []
         logger.debug(f"Listing directory: {directory}")
-        for entry in directory.iterdir():
-            if long:
-                data.append(self.get_file_stats(entry))
-            else:
-                print(entry.name)
+        stack = [directory]
+        while stack:
+            folder = stack.pop()
+            if recursive:
+                if folder != directory:
+                    ctx.out.writeline()
+                ctx.out.writeline(f"{self.display_path(folder, ctx)}:")
+            try:
+                subdirs = self.list_dir(cmd, folder, ctx)
+            except ExecutionError:
+                if folder == directory:
+                    raise
+                logger.warning(f"Can't read directory {folder}")
+                continue
+            stack.extend(reversed(subdirs))
+        ctx.out.flush()
 
+    def list_dir(self, cmd, folder:Path, ctx) -> list[Path]:
+        """Writes one directory, returns the subdirectories to list with -R"""
+        out = ctx.out
+        long = has_flag(cmd, 'l', 'long')
+        show_all = has_flag(cmd, 'a', 'all')
+        recursive = has_flag(cmd, 'R', 'recursive')
+        sort_key = self.sort_key(cmd)
+        subdirs: list[Path] = []
+
+        sizes_or_times = has_flag(cmd, 'S') or has_flag(cmd, 't')
+        listing = self.safe_exec(ctx.dir_cache.listing, folder, stats = long or sizes_or_times,
+                                 msg=f"Can't read directory {folder}")
+        entries: Iterable[os.DirEntry] = (e for e in listing if show_all or not e.name.startswith('.'))
+        pairs: Iterable[tuple[os.DirEntry, os.stat_result | None]]
+        if long or sizes_or_times:
+            pairs = stat_entries(entries, LS_STAT_JOBS)
+        else:
+            pairs = ((entry, None) for entry in entries)
+
+        if sort_key is not None:
+            # sort small keys and indexes, rows are built afterwards
+            pairs = list(pairs)
+            keys = [sort_key(entry, info) for entry, info in pairs]
+            pairs = [pairs[i] for i in sorted(range(len(keys)), key=keys.__getitem__)]
+
+        if recursive:
+            pairs = self.collect_dirs(pairs, subdirs)
         if long:
-            headers = ['Name', 'Perms', 'Links', 'Size',
-                       'Modified', 'Created']
-            if data and len(data[0]) < len(headers):
-                headers.remove('Created')
-                # on different systems created time might not be recorded
+            human = has_flag(cmd, 'h', 'human-readable')
+            headers = ['Name', 'Perms', 'Links', 'Size', 'Modified', 'Created']
+            # Created is dropped where the system doesn't record it
+            rows = (self.get_file_stats(entry, info, human) for entry, info in pairs if info is not None)
+            write_table(out, rows, headers, right=(3,))
+        else:
+            for entry, _ in pairs:
+                out.writeline(entry.name)
+        return subdirs
 
-            print(tabulate(data, headers=headers, tablefmt='plain'))
+    @staticmethod
+    def collect_dirs(pairs, subdirs:list[Path]):
+        for entry, info in pairs:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(Path(entry.path))
+            except OSError:
+                pass
+            yield entry, info
 
     @staticmethod
-    def get_file_stats(entry:Path):
-        info = entry.stat()
+    def sort_key(cmd):
+        if has_flag(cmd, 'S'):
+            return lambda entry, info: (-(info.st_size if info else 0), entry.name)
+        if has_flag(cmd, 't'):
+            return lambda entry, info: (-(info.st_mtime_ns if info else 0), entry.name)
+        if has_flag(cmd, 'X'):
+            return lambda entry, info: (os.path.splitext(entry.name)[1], entry.name)
+        return None
+
+    @staticmethod
+    def display_path(folder:Path, ctx) -> str:
+        try:
+            return str(folder.relative_to(ctx.cwd)) if folder != ctx.cwd else "."
+        except ValueError:
+            return str(folder)
+
+    @staticmethod
+    def get_file_stats(entry:os.DirEntry, info:os.stat_result | None = None, human:bool = False):
+        # one stat per entry, the type comes from its mode
+        if info is None:
+            info = entry.stat()
         permissions = stat.filemode(info.st_mode)[1:]
-        size = info.st_size
+        size = format_size(info.st_size) if human else info.st_size
         last_modified = datetime.fromtimestamp(info.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
 
         if hasattr(info, "st_birthtime"):
@@ -52,7 +137,7 @@ class Ls(Command):
         else:
             file_created = None # Not avilable on Linux
 
-        is_dir = entry.is_dir()
+        is_dir = stat.S_ISDIR(info.st_mode)
         links = info.st_nlink
         name = entry.name + ' (DIR)' if is_dir else entry.name
 
@@ -64,21 +149,185 @@ class Ls(Command):
     def undo(self, cmd, ctx):
         return super().undo(cmd, ctx)
 
+class Du(Command):
+    """Shows how much disk space a folder takes
+
+    du [flags] [path]
+
+    --summarize/-s - only the total of path
+    --max-depth N - show folders at most N levels below path
+    --human-readable/-h - sizes like 1.5K, 12M instead of KiB
+    --cache - remember folder usages between runs, so only folders whose
+    mtime changed are read again (files changed in place are missed
+    until their folder changes)
+    --jobs/-j N - threads reading folders (default: DU_JOBS)
+
+    Files with several hard links are counted once.
+    """
+
+    def execute(self, cmd, ctx):
+        path_raw = cmd.positionals[0] if cmd.positionals else '.'
+        path = resolve_path(path_raw, ctx)
+        max_depth = 0 if has_flag(cmd, 's', 'summarize') else self.int_option(cmd, 'max-depth')
+        jobs = self.int_option(cmd, 'j', 'jobs', default=DU_JOBS)
+        human = has_flag(cmd, 'h', 'human-readable')
+
+        self.ensure_exists(path)
+        if max_depth is not None and max_depth < 0:
+            raise ExecutionError(f"--max-depth can't be negative, got {max_depth}")
+        if jobs is None or jobs < 1:
+            raise ExecutionError(f"--jobs must be a positive number, got {jobs}")
+
+        if not path.is_dir() or path.is_symlink():
+            info = self.safe_exec(os.lstat, path, msg=f"du can't read {path}")
+            ctx.out.writeline(f"{self.format_usage(usage(info), human)}\t{path_raw}")
+            ctx.out.flush()
+            return
+
+        root = os.fspath(path)
+        sizes = self.safe_exec(self.measure, root, jobs, has_flag(cmd, 'cache'),
+                               msg=f"du can't read {path}")
+        depth0 = root.count(os.sep)
+        for folder, size in sizes.items():
+            if max_depth is None or folder.count(os.sep) - depth0 <= max_depth:
+                display = os.path.normpath(os.path.join(path_raw, os.path.relpath(folder, root)))
+                ctx.out.writeline(f"{self.format_usage(size, human)}\t{display}")
+        ctx.out.flush()
+
+    @staticmethod
+    def measure(root:str, jobs:int, use_cache:bool) -> dict[str, int]:
+        if not use_cache:
+            return totals(root, read_tree(root, jobs))
+        with DuCache() as cache:
+            known = cache.load(root)
+            dirs = read_tree(root, jobs, known)
+            cache.save(root, dirs, known)
+        return totals(root, dirs)
+
+    @staticmethod
+    def format_usage(size:int, human:bool) -> str:
+        return format_size(size) if human else str(-(-size // 1024)) # KiB, rounded up
+
+    def undo(self, cmd, ctx):
+        return super().undo(cmd, ctx)
+
+
 class Cat(Command):
-    """Reads contents of the file"""
+    """Reads contents of the file
+
+    The file is streamed, so memory doesn't depend on its size; into a
+    file or pipe it is copied with os.sendfile where possible.
+    """
+
+    def execute(self, cmd, ctx):
+        target = resolve_path(cmd.positionals[0], ctx)
+
+        self.ensure_exists(target)
+        self.ensure_file(target)
+
+        self.safe_exec(self.read_file, target, ctx.out, msg=f"cat can't read this file. ({target})")
+        ctx.out.flush()
+
+    @staticmethod
+    def read_file(path:Path, out:OutputSink):
+        with open(path, 'rb') as f:
+            last = out.copy_from(f)
+        if last != b"\n":
+            out.writeline() # the prompt starts on its own line
+
+    def undo(self, cmd, ctx):
+            return super().undo(cmd, ctx)
+
+
+class Head(Command):
+    """Prints the first lines of the file
+
+    head [-n N] <file>
+    --lines/-n N - number of lines (default: 10)
+    """
+
+    def execute(self, cmd, ctx):
+        target = resolve_path(cmd.positionals[0], ctx)
+        lines = self.int_option(cmd, 'n', 'lines', default=HEAD_LINES)
+
+        self.ensure_exists(target)
+        self.ensure_file(target)
+        if lines is None or lines < 0:
+            raise ExecutionError(f"--lines can't be negative, got {lines}")
+
+        self.safe_exec(self.read_head, target, lines, ctx.out, msg=f"head can't read this file. ({target})")
+        ctx.out.flush()
+
+    @staticmethod
+    def read_head(path:Path, lines:int, out:OutputSink):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        last = b""
+        with open(path, 'rb') as f:
+            # pieces of READ_BLOCK, so a huge line doesn't have to fit in memory
+            while lines and (piece := f.readline(READ_BLOCK)):
+                out.write(decoder.decode(piece))
+                last = piece[-1:]
+                if last == b"\n":
+                    lines -= 1
+        out.write(decoder.decode(b"", final=True))
+        if last not in (b"", b"\n"):
+            out.writeline()
+
+    def undo(self, cmd, ctx):
+            return super().undo(cmd, ctx)
+
+
+class Tail(Command):
+    """Prints the last lines of the file
+
+    tail [-n N] <file>
+    --lines/-n N - number of lines (default: 10)
+
+    Reads blocks backward from the end until it has enough lines, then
+    streams from there, so only the tail of the file is read.
+    """
 
     def execute(self, cmd, ctx):
         target = resolve_path(cmd.positionals[0], ctx)
+        lines = self.int_option(cmd, 'n', 'lines', default=HEAD_LINES)
 
         self.ensure_exists(target)
         self.ensure_file(target)
+        if lines is None or lines < 0:
+            raise ExecutionError(f"--lines can't be negative, got {lines}")
 
-        self.safe_exec(self.read_file, target, msg=f"cat can't read this file. ({target})")
+        self.safe_exec(self.read_tail, target, lines, ctx.out, msg=f"tail can't read this file. ({target})")
+        ctx.out.flush()
+
+    @staticmethod
+    def read_tail(path:Path, lines:int, out:OutputSink):
+        with open(path, 'rb') as f:
+            f.seek(Tail.tail_offset(f, lines))
+            last = out.copy_from(f)
+        if last not in (b"", b"\n"):
+            out.writeline()
 
     @staticmethod
-    def read_file(path:Path):
-        with open(path, 'r') as f:
-                    print(f.read())
+    def tail_offset(f:BinaryIO, lines:int, block:int = READ_BLOCK) -> int:
+        """Offset where the last `lines` lines of a seekable file start"""
+        end = f.seek(0, os.SEEK_END)
+        if lines == 0 or end == 0:
+            return end
+        f.seek(end - 1)
+        # a final newline ends the last line, it doesn't start one more
+        wanted = lines + 1 if f.read(1) == b"\n" else lines
+        pos = end
+        while pos > 0:
+            size = min(block, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size)
+            cut = len(data)
+            while (cut := data.rfind(b"\n", 0, cut)) >= 0:
+                wanted -= 1
+                if wanted == 0:
+                    return pos + cut + 1
+        return 0
 
     def undo(self, cmd, ctx):
             return super().undo(cmd, ctx)
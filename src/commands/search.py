@@ -1,82 +1,314 @@
+from itertools import chain, islice
 from pathlib import Path
-import re
+from typing import Generator, Iterable
 import logging
-from colorama import Fore, Style
+import os
+import time
 
 from src.commands.base import SearchCommand
+from src.config import FIND_JOBS, GREP_JOBS, GREP_PARALLEL_MIN_FILES
+from src.core.errors import ExecutionError
+from src.utils.grep_utils import (COUNT, FILES_WITH_MATCHES, FILES_WITHOUT_MATCH, LINES, QUIET, FileResult,
+                                  GrepOptions, build_matcher, grep_task, is_archive, parallel_grep,
+                                  search_file)
+from src.utils.find_utils import (Predicate, all_of, mtime_predicate, name_predicate, size_predicate,
+                                  type_predicate)
+from src.utils.index_utils import TrigramIndex, drop_index, index_file_for, trigram_query
+from src.utils.output_utils import OutputSink
 from src.utils.path_utils import resolve_path
-from src.utils.misc_utils import has_flag
+from src.utils.misc_utils import get_options, has_flag
+from src.utils.walk_utils import PathEntry, walk
 
 logger = logging.getLogger(__name__)
 
 class Grep(SearchCommand):
     """Returns all lines of the file matching pattern
 
+    grep [flags] <pattern> <path>
+    grep [flags] -e <pattern> [-e <pattern> ...] [-f <file>] <path>
+
     --recursive/-r - to look inside folder
     --ignore-case/-i - to ignore case when matching pattern
+    --fixed-strings/-F - patterns are plain strings, not regexes
+    --regexp/-e PATTERN - pattern to look for, can be repeated
+    --file/-f FILE - read patterns from FILE, one per line
+    --jobs/-j N - processes used for recursive search (default: CPU count)
+    --index - update the trigram index of the folder and search only the
+    files it can not rule out (see `index`)
+    -I - skip binary files (a NUL in the first block), by default they
+    only get a "Binary file ... matches" line
+    --max-filesize SIZE - skip bigger files, e.g. 512K, 10M, 1G
+    --no-ignore - don't skip what .gitignore/.ignore files exclude
+    (.git is always skipped)
+    --archives/-z - search members of .zip and .tar files without
+    extracting them, reported as archive:member:line (on by itself when
+    the path is an archive)
+    --count/-c - print the number of matching lines of each file
+    --files-with-matches/-l - print only names of files with a match
+    --files-without-match/-L - print only names of files without one
+    --max-count/-m N - stop reading a file after N matching lines
+    --quiet/-q - print nothing, stop at the first match anywhere
+    (the result is kept in history as meta 'matched')
+
+    -l, -L and -q stop reading a file at its first match.
     """
 
     def execute(self, cmd, ctx):
-        pattern_raw = cmd.positionals[0]
-        path = resolve_path(cmd.positionals[1], ctx)
+        patterns = self.read_patterns(cmd, ctx)
+        if patterns:
+            if len(cmd.positionals) != 1:
+                raise ExecutionError("grep takes only a path when patterns are given with -e/-f")
+            path_raw = cmd.positionals[0]
+        else:
+            if len(cmd.positionals) != 2:
+                raise ExecutionError("grep takes a pattern and a path")
+            patterns, path_raw = [cmd.positionals[0]], cmd.positionals[1]
+
+        path = resolve_path(path_raw, ctx)
         case_insensitive = has_flag(cmd, 'i', 'ignore-case')
+        fixed = has_flag(cmd, 'F', 'fixed-strings')
+        jobs = self.int_option(cmd, 'j', 'jobs', default=GREP_JOBS)
+        max_filesize = self.size_option(cmd, 'max-filesize')
+        max_count = self.int_option(cmd, 'm', 'max-count')
 
         self.ensure_exists(path)
         self.ensure_recursive(path, cmd)
+        if jobs is None or jobs < 1:
+            raise ExecutionError(f"--jobs must be a positive number, got {jobs}")
+        if max_count is not None and max_count < 0:
+            raise ExecutionError(f"--max-count can't be negative, got {max_count}")
 
-        flags = 0
-        if case_insensitive:
-            flags |= re.IGNORECASE
-
-        pattern = re.compile(pattern_raw, flags)
+        options = GrepOptions(
+            matcher = build_matcher(patterns, case_insensitive, fixed),
+            skip_binary = has_flag(cmd, 'I'),
+            max_filesize = max_filesize,
+            archives = has_flag(cmd, 'z', 'archives') or (path.is_file() and is_archive(path)),
+            mode = self.output_mode(cmd),
+            max_count = max_count,
+        )
         display_path = path.relative_to(ctx.cwd)
 
-        logger.debug(f"Searching pattern '{pattern_raw}' in {path}")
+        logger.debug(f"Searching {len(patterns)} pattern(s) in {path} with {type(options.matcher).__name__}")
 
         if path.is_dir():
-            self.find_in_dir(pattern, path, display_path, ctx)
+            use_ignore_files = not has_flag(cmd, 'no-ignore')
+            if has_flag(cmd, 'index'):
+                query = trigram_query(patterns, case_insensitive, fixed)
+                files = self.indexed_files(path, query, jobs, use_ignore_files, options.archives)
+            else:
+                files = self.iter_files(path, use_ignore_files)
+            matched = self.find_in_dir(options, path, display_path, ctx, jobs, files)
         else:
-            self.grep_file(pattern, path, ignore_open_errors=True, display_path = display_path)
+            matched = self.grep_file(options, path, ignore_open_errors=True, display_path = display_path,
+                                     out = ctx.out)
+        cmd.meta['matched'] = matched
+        ctx.out.flush()
 
-    def grep_file(self, pattern:re.Pattern, path:Path, ignore_open_errors:bool, display_path:Path):
+    @staticmethod
+    def output_mode(cmd) -> str:
+        # the stronger one wins when several are given, like in GNU grep
+        if has_flag(cmd, 'q', 'quiet'):
+            return QUIET
+        if has_flag(cmd, 'l', 'files-with-matches'):
+            return FILES_WITH_MATCHES
+        if has_flag(cmd, 'L', 'files-without-match'):
+            return FILES_WITHOUT_MATCH
+        if has_flag(cmd, 'c', 'count'):
+            return COUNT
+        return LINES
+
+    def read_patterns(self, cmd, ctx) -> list[str]:
+        patterns = get_options(cmd, 'e', 'regexp')
+        for file_raw in get_options(cmd, 'f', 'file'):
+            file_path = resolve_path(file_raw, ctx)
+            self.ensure_exists(file_path)
+            self.ensure_file(file_path)
+            text = self.safe_exec(file_path.read_text, encoding='utf-8',
+                                  msg = f"Failed to read patterns from {file_path.name}")
+            patterns += [line for line in text.splitlines() if line]
+        return patterns
+
+    def grep_file(self, options:GrepOptions, path:Path, ignore_open_errors:bool, display_path:Path,
+                  out:OutputSink) -> bool:
         if ignore_open_errors:
             try:
-                self.safe_exec(self.print_lines, path, pattern, display_path,
-                            msg = f"Failed to read file {path.name}")
+                return self.safe_exec(self.print_lines, path, options, display_path, out,
+                                      msg = f"Failed to read file {path.name}")
             except Exception:
-                pass
+                return False
+        return self.safe_exec(self.print_lines, path, options, display_path, out,
+                              msg = f"Failed to read file {path.name}")
+
+    @staticmethod
+    def print_lines(path:Path, options:GrepOptions, display_path:Path, out:OutputSink) -> bool:
+        lines, matched = search_file(path, options, display_path)
+        out.writelines(lines)
+        return matched
+
+    def find_in_dir(self, options:GrepOptions, path:Path, display_path, ctx, jobs:int = 1,
+                    files:Iterable[Path] | None = None) -> bool:
+        """Greps every file, True if anything matched
+
+        With QUIET the walk stops at the first match.
+        """
+        if files is None:
+            files = self.iter_files(path)
+        tasks = ((file_path, file_path.relative_to(ctx.cwd)) for file_path in files)
+
+        # a process pool only pays off on bigger trees
+        head = list(islice(tasks, GREP_PARALLEL_MIN_FILES))
+        results: Generator[FileResult, None, None] # closed early by -q
+        if jobs > 1 and len(head) == GREP_PARALLEL_MIN_FILES:
+            logger.debug(f"Searching {path} with {jobs} processes")
+            results = parallel_grep(chain(head, tasks), options, jobs)
+        else:
+            results = (grep_task(task, options) for task in chain(head, tasks))
+
+        any_matched = False
+        try:
+            for lines, matched in results:
+                ctx.out.writelines(lines)
+                any_matched = any_matched or matched
+                if matched and options.mode == QUIET:
+                    logger.debug(f"Match found, stopping the search of {path}")
+                    break
+        finally:
+            results.close() # cancels files still queued in the pool
+        return any_matched
+
+    def indexed_files(self, path:Path, query, jobs:int, use_ignore_files:bool = True,
+                      archives:bool = False) -> list[Path]:
+        """Files of the tree in walk order, minus those the index rules out
+
+        The index holds the compressed bytes of archives, so with archives
+        they are always searched.
+        """
+        files = list(self.iter_files(path, use_ignore_files))
+        with TrigramIndex(path) as index:
+            self.safe_exec(index.update, files, jobs, msg = f"Failed to update index of {path}")
+            candidates = index.candidates(query)
+        if candidates is None:
+            logger.debug("Pattern has no trigrams, searching every file")
+            return files
+        logger.debug(f"Index left {len(candidates)} of {len(files)} files")
+        return [f for f in files if str(f) in candidates or (archives and is_archive(f))]
+
+    def undo(self, cmd, ctx):
+            return super().undo(cmd, ctx)
+
+
+class Index(SearchCommand):
+    """Manages trigram indexes used by `grep --index`
+
+    index build [path] - create or update the index of a folder
+    index status [path] - show what the index holds
+    index drop [path] - delete the index
+
+    --jobs/-j N - processes used to read changed files (default: CPU count)
+    """
+
+    def execute(self, cmd, ctx):
+        action = cmd.positionals[0]
+        path = resolve_path(cmd.positionals[1], ctx) if len(cmd.positionals) > 1 else ctx.cwd
+
+        if action == 'drop':
+            if not drop_index(path):
+                raise ExecutionError(f"No index for {path}")
+            ctx.out.writeline(f"Index of {path} dropped")
+            ctx.out.flush()
+            return
+
+        self.ensure_exists(path)
+        self.ensure_dir(path)
+        if action == 'build':
+            jobs = self.int_option(cmd, 'j', 'jobs', default=GREP_JOBS) or 1
+            with TrigramIndex(path) as index:
+                changed, removed = self.safe_exec(index.update, list(self.iter_files(path)),
+                                                  max(jobs, 1), msg = f"Failed to index {path}")
+            ctx.out.writeline(f"Index of {path}: {changed} files indexed, {removed} removed")
+        elif action == 'status':
+            if not index_file_for(path).exists():
+                raise ExecutionError(f"No index for {path}, run `index build`")
+            with TrigramIndex(path) as index:
+                stats = index.stats()
+            ctx.out.writeline(f"Index of {stats['root']}\n"
+                  f"  files: {stats['files']} ({stats['indexed']} indexed, "
+                  f"{stats['pending']} not in posting lists yet)\n"
+                  f"  trigrams: {stats['trigrams']}\n"
+                  f"  size: {stats['size']} bytes\n"
+                  f"  updated: {stats['updated']}")
         else:
-            self.safe_exec(self.print_lines, path, pattern, display_path,
-                            msg = f"Failed to read file {path.name}")
+            raise ExecutionError(f"Unknown index action '{action}', expected build, status or drop")
+        ctx.out.flush()
+
+    def undo(self, cmd, ctx):
+            return super().undo(cmd, ctx)
+
+
+class Find(SearchCommand):
+    """Prints paths under a folder that match all given tests
+
+    find [path] [tests]
+
+    -name GLOB / -iname GLOB - name matches the glob (-iname ignores case)
+    -type f|d|l - file, directory or symlink, several as f,d
+    -size [+-]N[c|K|M|G|T] - size rounded up to the unit (bytes by default)
+    is more than (+), less than (-) or exactly N
+    -mtime [+-]N - changed more than, less than or exactly N days ago
+    -maxdepth N - don't go deeper than N levels below path
+    -prune - don't descend into directories that match
+    --jobs/-j N - threads reading directories ahead (default: FIND_JOBS)
+
+    Name and type come from scandir, so only -size and -mtime stat files,
+    and only those the other tests kept.
+    """
+
+    def execute(self, cmd, ctx):
+        path_raw = cmd.positionals[0] if cmd.positionals else '.'
+        path = resolve_path(path_raw, ctx)
+        max_depth = self.int_option(cmd, 'maxdepth')
+        jobs = self.int_option(cmd, 'j', 'jobs', default=FIND_JOBS)
+
+        self.ensure_exists(path)
+        if max_depth is not None and max_depth < 0:
+            raise ExecutionError(f"-maxdepth can't be negative, got {max_depth}")
+        if jobs is None or jobs < 1:
+            raise ExecutionError(f"--jobs must be a positive number, got {jobs}")
+        predicate = self.safe_exec(self.compile_predicates, cmd, msg = "Invalid find test")
+        prune = predicate if has_flag(cmd, 'prune') else None
+
+        root = PathEntry(path)
+        if self.matches(predicate, root):
+            ctx.out.writeline(path_raw)
+        if root.is_dir() and max_depth != 0 and not (prune and self.matches(prune, root)):
+            base = os.fspath(path)
+            for entry in walk(path, max_depth=max_depth, dirs=True, prune=prune, jobs=jobs,
+                              on_error=self.log_error):
+                if self.matches(predicate, entry):
+                    ctx.out.writeline(os.path.join(path_raw, os.path.relpath(entry.path, base)))
+        ctx.out.flush()
 
     @staticmethod
-    def print_lines(path:Path, pattern:re.Pattern, display_path:Path):
-        GREEN = Fore.GREEN + Style.BRIGHT
-        YELLOW = Fore.YELLOW + Style.BRIGHT
-        RED = Fore.RED + Style.BRIGHT
-        RESET = Style.RESET_ALL
-
-        with path.open('r', encoding='utf-8', errors="ignore") as f:
-
-            for line_num, line in enumerate(f, start=1):
-                found = re.search(pattern, line)
-                if found:
-                    found_highlighted = pattern.sub(RED + r"\g<0>" + RESET, line.rstrip())
-                    line = (
-                                f"{GREEN}{display_path}{RESET}:"
-                                f"{YELLOW}{line_num}{RESET}:"
-                                f"{found_highlighted}"
-                            )
-                    print(line)
-
-    def find_in_dir(self, pattern:re.Pattern, path:Path, display_path, ctx):
-        for file_path in path.iterdir():
-            display_path = file_path.relative_to(ctx.cwd)
-
-            if file_path.is_dir():
-                self.find_in_dir(pattern, file_path, display_path, ctx) # Goes recursively through each file
-            else:
-                self.grep_file(pattern, file_path, ignore_open_errors = True, display_path = display_path)
+    def compile_predicates(cmd) -> Predicate:
+        # scandir-only tests first, they spare the stat of what they reject
+        predicates = [name_predicate(p) for p in get_options(cmd, 'name')]
+        predicates += [name_predicate(p, ignore_case=True) for p in get_options(cmd, 'iname')]
+        predicates += [type_predicate(t) for t in get_options(cmd, 'type')]
+        predicates += [size_predicate(s) for s in get_options(cmd, 'size')]
+        now = time.time()
+        predicates += [mtime_predicate(m, now) for m in get_options(cmd, 'mtime')]
+        return all_of(predicates)
+
+    @staticmethod
+    def matches(predicate:Predicate, entry) -> bool:
+        try:
+            return predicate(entry)
+        except OSError: # removed while walking
+            return False
+
+    @staticmethod
+    def log_error(e:OSError):
+        logger.warning(f"find: {e}")
 
     def undo(self, cmd, ctx):
             return super().undo(cmd, ctx)
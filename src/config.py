@@ -1,31 +1,58 @@
 from pathlib import Path
+from typing import NotRequired, TypedDict
 import logging
+import os
 
 HOME_DIR = Path.home()
 ROOT = Path(__file__).resolve().parent.parent
 
 LOGS_FILENAME = 'shell.log'
 LOGS_FILE = ROOT / "logs" / LOGS_FILENAME
-HISTORY_FILE = ROOT / ".history.json"
+HISTORY_FILE = ROOT / ".history.jsonl"
+LEGACY_HISTORY_FILE = ROOT / ".history.json"
+HISTORY_DB_FILE = ROOT / ".history.sqlite"
+HISTORY_INDEX_FILE = ROOT / ".history_index.sqlite" # `history search`, rebuilt if missing
+HISTORY_BACKEND = "journal" # "journal" (HISTORY_FILE) or "sqlite" (HISTORY_DB_FILE)
+HISTORY_WINDOW = 1000 # entries loaded into memory at startup
+HISTORY_SYNC_WRITES = False # True writes every entry before the next prompt (--sync-history)
+HISTORY_BATCH_SIZE = 256 # max entries per background write
+HISTORY_FLUSH_INTERVAL = 0.5 # seconds a background batch may wait before it is written
+# Limits of the hot history, None disables a limit. Older entries are rolled
+# into gzip files in HISTORY_ARCHIVE_DIR, `history --all` still shows them
+HISTORY_ARCHIVE_DIR = ROOT / ".history_archive"
+HISTORY_MAX_ENTRIES = 100_000
+HISTORY_MAX_BYTES = 32 * 1024 * 1024
+HISTORY_MAX_AGE_DAYS = 365
+HISTORY_DISPLAY_PAGE = 50 # default page size of `history --page P`
 TRASH_DIR = ROOT / ".trash"
 
 USER_WELCOME_MESSAGE = """Welcome to the shell!
 ========================
 Available commands:
 ========================
-- ls [path] -l
+- ls [path] -l -a -h -R, sorted with -S | -t | -X
 - cd <path>
 - cat <file>
-- cp <source> <dest> -r
+- head <file> -n N, tail <file> -n N
+- du [path] -s -h --max-depth N --cache
+- cp <source> <dest> -r -j N --reflink=auto|always|never
 - mv <source> <dest> -r
 - rm <path> -r
+- sync <source> <dest> --delete -n -c -j N
 - zip <folder> <archive.zip>
 - unzip <archive.zip>
 - tar <folder> <archive.tar>
 - untar <archive.tar>
-- grep <pattern> <path> -i -r
-- history
+- grep <pattern> <path> -i -r -F -I -z -j N --max-filesize SIZE --no-ignore
+- grep -e <pattern> [-e <pattern>] -f <patterns file> <path>
+- grep -r --index <pattern> <path>
+- grep <pattern> <path> -c | -l | -L | -q, -m N
+- index build|status|drop [path]
+- find [path] -name GLOB -iname GLOB -type f|d|l -size [+-]N -mtime [+-]N -maxdepth N -prune
+- history search <terms>
+- history --all -n N --page P --since DATE --until DATE --cmd NAME --cwd PATH
 - undo
+- cache [stats|clear]
 
 Type 'exit' to exit shell.
 ========================
@@ -36,26 +63,74 @@ See you next time!
 ========================
 """
 
+OUTPUT_BUFFER_SIZE = 64 * 1024 # characters buffered before commands' output is written
+OUTPUT_FLUSH = "interactive" # "size", "line" or "interactive" (line on a terminal, size otherwise)
+TABLE_WIDTH_SAMPLE = 1000 # rows measured for column widths of tables (ls -l), the rest is streamed
+
+DIR_CACHE_MAX_ENTRIES = 100_000 # directory entries cached over all directories (ls, completion)
+DIR_CACHE_STAT_TTL = 2.0 # seconds cached stats are trusted (files change without their directory)
+
+HEAD_LINES = 10 # default of head -n and tail -n
+READ_BLOCK = 64 * 1024 # head and tail read files this much at a time
+
+LS_STAT_JOBS = 8 # threads stat-ing entries for ls -l/-S/-t, I/O bound so more than the CPU count
+
+COPY_JOBS = 8 # threads copying files in cp -r, small files are bound by metadata latency
+COPY_PROGRESS_INTERVAL = 0.5 # seconds between progress updates of cp -r
+
+DU_JOBS = 4 # threads reading directories in du, I/O bound
+DU_CACHE_FILE = ROOT / ".du_cache.sqlite" # directory usages kept by du --cache
+FIND_JOBS = 4 # threads reading directories ahead in find, I/O bound
+
+GREP_JOBS = os.cpu_count() or 1 # default of grep -j
+GREP_PARALLEL_MIN_FILES = 64 # smaller trees are searched in-process
+GREP_IGNORE_FILES = (".gitignore", ".ignore") # read per directory by grep -r unless --no-ignore
+GREP_SKIP_DIRS = (".git",) # never searched
+GREP_INDEX_DIR = ROOT / ".grep_index" # trigram indexes of `grep --index` and `index build`
+GREP_INDEX_MAX_FILE_SIZE = 8 * 1024 * 1024 # bigger files are not indexed, always searched
+
 CONSOLE_LOG_LEVEL = logging.INFO
 FILE_LOG_LEVEL = logging.DEBUG
 
-COMMANDS = {
-    'cp': {'flags': {'recursive', 'r'}, 'max_pos': 2, 'min_pos': 2},
+class CommandSpec(TypedDict):
+    flags: set[str]
+    options: NotRequired[set[str]] # take a value: -n 5, --max-depth=2
+    min_pos: int
+    max_pos: int | None # None - any number
+
+COMMANDS: dict[str, CommandSpec] = {
+    'cp': {'flags': {'recursive', 'r'}, 'options': {'j', 'jobs', 'reflink'}, 'max_pos': 2, 'min_pos': 2},
     'mv': {'flags': {'recursive','r'}, 'max_pos': 2, 'min_pos': 2},
     'rm': {'flags': {'recursive', 'r',}, 'max_pos': 1, 'min_pos': 1},
-    'ls': {'flags': {'l', 'long'}, 'max_pos': 1, 'min_pos': 0},
+    'sync': {'flags': {'delete', 'dry-run', 'n', 'checksum', 'c'}, 'options': {'j', 'jobs', 'reflink'},
+             'max_pos': 2, 'min_pos': 2},
+    'ls': {'flags': {'l', 'long', 'R', 'recursive', 'S', 't', 'X', 'a', 'all', 'h', 'human-readable'},
+           'max_pos': 1, 'min_pos': 0},
     'cd': {'flags': set(), 'max_pos': 1, 'min_pos': 1},
     'cat': {'flags': set(), 'max_pos': 1, 'min_pos': 1},
+    'du': {'flags': {'s', 'summarize', 'h', 'human-readable', 'cache'}, 'options': {'max-depth', 'j', 'jobs'},
+           'max_pos': 1, 'min_pos': 0},
+    'head': {'flags': set(), 'options': {'n', 'lines'}, 'max_pos': 1, 'min_pos': 1},
+    'tail': {'flags': set(), 'options': {'n', 'lines'}, 'max_pos': 1, 'min_pos': 1},
 
     'zip': {'flags': set(), 'max_pos': 2, 'min_pos': 2},
     'unzip': {'flags': set(), 'max_pos': 1, 'min_pos': 1},
     'tar': {'flags': set(), 'max_pos': 2, 'min_pos': 2},
     'untar': {'flags': set(), 'max_pos': 1, 'min_pos': 1},
 
-    'grep': {'flags': {'r', 'recursive', 'i', 'ignore-case'}, 'max_pos': 2, 'min_pos': 2},
+    'grep': {'flags': {'r', 'recursive', 'i', 'ignore-case', 'F', 'fixed-strings', 'index',
+                       'I', 'no-ignore', 'z', 'archives', 'c', 'count', 'l', 'files-with-matches',
+                       'L', 'files-without-match', 'q', 'quiet'},
+             'options': {'j', 'jobs', 'e', 'regexp', 'f', 'file', 'max-filesize', 'm', 'max-count'},
+             'max_pos': 2, 'min_pos': 1}, # the pattern may come from -e/-f instead
+    'index': {'flags': set(), 'options': {'j', 'jobs'}, 'max_pos': 2, 'min_pos': 1},
+    'find': {'flags': {'prune'}, 'options': {'name', 'iname', 'type', 'size', 'mtime', 'maxdepth', 'j', 'jobs'},
+             'max_pos': 1, 'min_pos': 0},
 
-    'history': {'flags': set(), 'max_pos': 0, 'min_pos': 0},
+    'history': {'flags': {'a', 'all'}, 'options': {'n', 'page', 'since', 'until', 'cmd', 'cwd'},
+                'max_pos': None, 'min_pos': 0}, # history search <terms...>
     'undo': {'flags': set(), 'max_pos': 0, 'min_pos': 0},
+    'cache': {'flags': set(), 'max_pos': 1, 'min_pos': 0}, # cache [stats|clear]
 }
 
 
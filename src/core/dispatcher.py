@@ -1,9 +1,10 @@
-from src.commands.listing import Ls, Cat
-from src.commands.filesystem import Cp, Mv, Rm
+from src.commands.listing import Ls, Cat, Du, Head, Tail
+from src.commands.filesystem import Cp, Mv, Rm, Sync
 from src.commands.navigation import Cd
 from src.commands.archive import Zip, Unzip, Tar, Untar
-from src.commands.search import Grep
+from src.commands.search import Find, Grep, Index
 from src.commands.history import History, Undo
+from src.commands.debug import Cache
 from src.core.models import HistoryEntry, ParsedCommand
 from src.core.errors import ExecutionError
 from src.core.services import Context
@@ -20,16 +21,23 @@ COMMANDS = {
     "ls": Ls().execute,
     "cd": Cd().execute,
     "cat": Cat().execute,
+    "head": Head().execute,
+    "tail": Tail().execute,
+    "du": Du().execute,
     "cp": Cp().execute,
     "mv": Mv().execute,
     "rm": Rm().execute,
+    "sync": Sync().execute,
     "zip": Zip().execute,
     "unzip": Unzip().execute,
     "tar": Tar().execute,
     "untar": Untar().execute,
     "grep": Grep().execute,
+    "index": Index().execute,
+    "find": Find().execute,
     "history": History().execute,
-    "undo": Undo().execute
+    "undo": Undo().execute,
+    "cache": Cache().execute,
 }
 
 class Dispatcher:
@@ -47,6 +55,7 @@ class Dispatcher:
                 name = cmd.name,
                 flags = set(cmd.flags),
                 positionals = list(cmd.positionals),
+                options = {k: list(v) for k, v in cmd.options.items()},
                 cwd = ctx.cwd,
                 timestamp = datetime.now().isoformat(),
                 meta = dict(cmd.meta)
@@ -64,3 +73,6 @@ class Dispatcher:
         except Exception as e:
             logger.exception(f"Unexpected error in {cmd.name}")
             raise ExecutionError(f"Unexpected error in {cmd.name}: {e}")
+
+        finally:
+            ctx.out.flush() # whatever the command wrote, even if it failed
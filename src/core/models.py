@@ -10,6 +10,7 @@ class ParsedCommand:
     positionals: list[str]
     raw: str = ""
     meta: dict[str, Any] = field(default_factory=dict)
+    options: dict[str, list[str]] = field(default_factory=dict)
 
 @dataclass
 class HistoryEntry:
@@ -21,3 +22,4 @@ class HistoryEntry:
     flags: set[str] = field(default_factory=set)
     positionals: list[str] = field(default_factory=list)
     meta: dict[str, Any] = field(default_factory=dict)
+    options: dict[str, list[str]] = field(default_factory=dict)
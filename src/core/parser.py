@@ -2,7 +2,6 @@ import re
 from src.config import COMMANDS
 from src.core.models import ParsedCommand
 from src.core.errors import ParsingError
-from typing import cast
 
 import shlex
 import logging
@@ -27,14 +26,17 @@ class Parser:
             raise ParsingError(f"Command '{name}' is not supported")
 
         flags, pos = set(), []
-        max_pos = cast(int, spec['max_pos'])
-        min_pos = cast(int, spec['min_pos'])
-        spec_flags = cast(set[str], spec['flags'])
+        options: dict[str, list[str]] = {}
+        max_pos = spec['max_pos']
+        min_pos = spec['min_pos']
+        spec_flags = spec['flags']
+        spec_options = spec.get('options', set())
 
-        for w in words:
-            if not w.startswith('-'):
+        words_iter = iter(words)
+        for w in words_iter:
+            if not w.startswith('-') or w == '-':
                 pos.append(w.strip("'"))
-                if len(pos) > max_pos:
+                if max_pos is not None and len(pos) > max_pos:
                     raise ParsingError('Too many positional arguments: '
                                        f'Must be from {min_pos} to {max_pos} '
                                        f'But {len(pos)} were given')
@@ -42,20 +44,40 @@ class Parser:
 
             if w.startswith('--'):
                 w = w.lstrip('-')
+                opt, has_value, value = w.partition('=')
+                if opt in spec_options:
+                    if not has_value:
+                        value = self._option_value(words_iter, f'--{opt}', name)
+                    options.setdefault(opt, []).append(value.strip("'"))
+                    continue
                 if w not in spec_flags:
                     raise ParsingError(f"No flag '--{w}' for '{name}'")
                 flags.add(w)
             else:
                 w = w.lstrip('-')
-                for flag in w:
-                    if flag not in spec_flags:
-                        raise ParsingError(f"No flag '-{flag}' for '{name}'")
-                    flags.add(flag)
-        cmd = ParsedCommand(name=name, flags=flags,
-                             positionals=pos, raw=self._advanced_strip(string))
+                if w in spec_flags: # single dash long flags like -prune
+                    flags.add(w)
+                elif w in spec_options:
+                    options.setdefault(w, []).append(self._option_value(words_iter, f'-{w}', name))
+                elif w[0] in spec_options: # value glued to the option, like -n5
+                    options.setdefault(w[0], []).append(w[1:].strip("'"))
+                else:
+                    for flag in w:
+                        if flag not in spec_flags:
+                            raise ParsingError(f"No flag '-{flag}' for '{name}'")
+                        flags.add(flag)
+        cmd = ParsedCommand(name=name, flags=flags, positionals=pos,
+                            options=options, raw=self._advanced_strip(string))
         logger.debug(f'{cmd=}')
         return cmd
 
+    @staticmethod
+    def _option_value(words_iter, option:str, name:str) -> str:
+        value = next(words_iter, None)
+        if value is None:
+            raise ParsingError(f"Option '{option}' for '{name}' requires a value")
+        return value.strip("'")
+
     @staticmethod
     def _advanced_strip(string:str):
         return re.sub(r'\s+', ' ', string.strip())
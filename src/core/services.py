@@ -1,7 +1,11 @@
 from pathlib import Path
 from src.core.models import HistoryEntry
+from src.utils.cache_utils import DirCache
+from src.utils.output_utils import OutputSink
 
 class Context:
     def __init__(self) -> None:
         self.cwd: Path = Path.cwd()
         self.history: list[HistoryEntry] = []
+        self.out: OutputSink = OutputSink()
+        self.dir_cache: DirCache = DirCache()
@@ -1,7 +1,6 @@
 from src.core.models import ParsedCommand
 from src.config import COMMANDS
 from src.core.errors import ValidationError
-from typing import cast
 
 class Validator:
     def validate_cmd(self, cmd: ParsedCommand):
@@ -10,9 +9,10 @@ class Validator:
         if spec is None:
             raise ValidationError(f"Unknown command: {cmd.name}")
 
-        min_pos = cast(int, spec['min_pos'])
-        max_pos = cast(int, spec['max_pos'])
+        min_pos = spec['min_pos']
+        max_pos = spec['max_pos']
         n_pos = len(cmd.positionals)
-        if not (min_pos <= n_pos <= max_pos):
-            raise ValidationError(f"{cmd.name} expects from {min_pos} to {max_pos} "
+        if n_pos < min_pos or (max_pos is not None and n_pos > max_pos):
+            expected = f"from {min_pos} to {max_pos}" if max_pos is not None else f"at least {min_pos}"
+            raise ValidationError(f"{cmd.name} expects {expected} "
                                   f"positional arguments, but {n_pos} were given")
@@ -1,13 +1,25 @@
 from src.shell import Shell
 from src.utils.log_utils import setup_logging
 
+import argparse
+import sys
+
 setup_logging()
 
 shell = Shell()
 
-def main():
+def parse_args(argv: list[str]):
+    parser = argparse.ArgumentParser(description="Shell emulator")
+    parser.add_argument("--sync-history", action="store_true",
+                        help="write every history entry to disk before the next prompt")
+    return parser.parse_args(argv)
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv or [])
+    if args.sync_history:
+        shell.sync_history = True
     shell.start_shell()
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1:])
@@ -1,13 +1,22 @@
 from src.core.errors import ExecutionError
-from src.config import USER_WELCOME_MESSAGE, USER_GOODBYE_MESSAGE
+from src.config import USER_WELCOME_MESSAGE, USER_GOODBYE_MESSAGE, HISTORY_SYNC_WRITES
 from src.core.parser import Parser
 from src.core.dispatcher import Dispatcher
 from src.core.validator import Validator
 from src.core.services import Context
-from src.utils.misc_utils import update_history_from_file, setup
+from src.utils.path_utils import complete_path
+from src.utils.misc_utils import (
+    update_history_from_file, setup, start_history_writer, stop_history_writer
+)
 
 import logging
 
+try:
+    import readline
+    HAVE_READLINE = True
+except ImportError: # not on Windows
+    HAVE_READLINE = False
+
 logger = logging.getLogger(__name__)
 setup()
 
@@ -18,8 +27,32 @@ class Shell:
         self.ctx = Context()
         update_history_from_file(self.ctx)
         self.dispatcher = Dispatcher()
+        self.sync_history = HISTORY_SYNC_WRITES
+        self._completions: list[str] = []
+
+    def setup_completion(self):
+        if not HAVE_READLINE:
+            return
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(" \t\n\"'")
+        readline.parse_and_bind("tab: complete")
+
+    def complete(self, text: str, state: int) -> str | None:
+        # readline asks for one match at a time, state 0 starts a new word
+        if state == 0:
+            self._completions = complete_path(text, self.ctx)
+        return self._completions[state] if state < len(self._completions) else None
 
     def start_shell(self):
+        if not self.sync_history:
+            start_history_writer()
+        try:
+            self.loop()
+        finally:
+            stop_history_writer() # flushes queued history entries
+
+    def loop(self):
+        self.setup_completion()
         print(USER_WELCOME_MESSAGE)
         while True:
             try:
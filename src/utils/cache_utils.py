@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator
+import os
+import time
+import logging
+
+from src.config import DIR_CACHE_MAX_ENTRIES, DIR_CACHE_STAT_TTL
+
+logger = logging.getLogger(__name__)
+
+# a directory changed this recently may change again within the same mtime
+# tick (1s on some file systems), so its listing is not trusted yet
+RACY_WINDOW_NS = 1_000_000_000
+
+
+@dataclass
+class CachedDir:
+    mtime_ns: int
+    listed_at: float # time.monotonic() of the scan
+    entries: list[os.DirEntry]
+
+
+class DirCache:
+    """LRU cache of directory listings, kept on Context as ctx.dir_cache
+
+    A listing is reused while the directory's mtime is unchanged, which
+    costs one stat of the directory instead of reading it. DirEntry objects
+    keep their own stat once taken, so cached entries also save the stat
+    of every file. A file can change without its directory changing, so
+    stats are only trusted for stat_ttl seconds after the scan.
+
+    max_entries - entries kept over all directories, the least recently
+        used directories are dropped past it, bigger ones are not cached
+    """
+
+    def __init__(self, max_entries: int = DIR_CACHE_MAX_ENTRIES, stat_ttl: float = DIR_CACHE_STAT_TTL):
+        self.max_entries = max_entries
+        self.stat_ttl = stat_ttl
+        self._dirs: OrderedDict[str, CachedDir] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def listing(self, path: Path | str, stats: bool = False) -> Iterator[os.DirEntry]:
+        """Entries of a directory, from the cache when it is still valid.
+
+        Errors opening the directory are raised here, not while iterating.
+        A miss streams from os.scandir and stores the listing once it has
+        been read to the end.
+        stats - the caller will stat the entries, so a listing older than
+            stat_ttl is read again
+        """
+        key = os.fspath(path)
+        mtime_ns = os.stat(key).st_mtime_ns
+        cached = self._dirs.get(key)
+        if cached is not None and cached.mtime_ns == mtime_ns and (
+                not stats or time.monotonic() - cached.listed_at < self.stat_ttl):
+            self.hits += 1
+            self._dirs.move_to_end(key)
+            return iter(cached.entries)
+
+        self.misses += 1
+        if cached is not None:
+            self._drop(key)
+        return self._scan(key, mtime_ns, os.scandir(key))
+
+    def _scan(self, key: str, mtime_ns: int, it: Any) -> Iterator[os.DirEntry]:
+        listed_at = time.monotonic()
+        entries: list[os.DirEntry] | None = []
+        with it:
+            for entry in it:
+                if entries is not None:
+                    entries.append(entry)
+                    if len(entries) > self.max_entries:
+                        entries = None # too big to cache, keep streaming
+                yield entry
+        if entries is not None and time.time_ns() - mtime_ns > RACY_WINDOW_NS:
+            self._store(key, CachedDir(mtime_ns, listed_at, entries))
+
+    def _store(self, key: str, cached: CachedDir):
+        if key in self._dirs:
+            self._drop(key)
+        self._dirs[key] = cached
+        self._size += len(cached.entries)
+        while self._size > self.max_entries:
+            old_key, _ = next(iter(self._dirs.items()))
+            self._drop(old_key)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        self._size -= len(self._dirs.pop(key).entries)
+
+    def invalidate(self, path: Path | str):
+        """Forgets path, everything cached under it and its parent directory
+
+        Called by commands that change the tree, so their results show up
+        even within one mtime tick.
+        """
+        key = os.fspath(path)
+        prefix = key.rstrip(os.sep) + os.sep
+        parent = os.path.dirname(key.rstrip(os.sep))
+        for cached_key in [k for k in self._dirs if k in (key, parent) or k.startswith(prefix)]:
+            self._drop(cached_key)
+            self.invalidations += 1
+
+    def clear(self):
+        self._dirs.clear()
+        self._size = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "dirs": len(self._dirs),
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
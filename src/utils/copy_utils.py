@@ -0,0 +1,275 @@
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterator
+import errno
+import os
+import shutil
+import stat
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError: # not on Windows
+    fcntl = None # type: ignore[assignment]
+
+from src.config import COPY_JOBS, COPY_PROGRESS_INTERVAL
+from src.utils.misc_utils import format_size
+from src.utils.output_utils import COPY_CHUNK
+from src.utils.walk_utils import walk
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH = 32 # files per pool task, small files cost less than a task each
+RANGE_CHUNK = 1 << 30 # bytes asked of copy_file_range/sendfile per call
+
+FICLONE = 0x40049409 # linux/fs.h, _IOW(0x94, 9, int)
+REFLINK_MODES = ("auto", "always", "never")
+# the file system or kernel can't do it for these files, the next method can
+UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EBADF,
+               errno.EOPNOTSUPP, errno.ENOTSUP, errno.ETXTBSY, errno.EPERM}
+
+# (source, destination, size)
+CopyTask = tuple[str, str, int]
+# returns how the data was copied, like "reflink", logged per file
+CopyFunc = Callable[[str, str], str | None]
+
+
+@dataclass
+class CopyProgress:
+    files_total: int
+    bytes_total: int
+    files: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+    methods: Counter[str] = field(default_factory=Counter) # files by copy method
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second so far"""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.files}/{self.files_total} files, "
+                f"{format_size(self.bytes)}/{format_size(self.bytes_total)}, "
+                f"{format_size(int(self.rate))}/s")
+
+
+def _reflink(fsrc: int, fdst: int) -> bool:
+    """Clones the whole file, sharing its blocks until one copy changes"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst, FICLONE, fsrc)
+    except OSError as e:
+        if e.errno in UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _range_copy(fsrc: int, fdst: int, offset: int, end: int | None, kernel: bool = True) -> str:
+    """Copies [offset, end) or up to the end of the file at the same offset
+
+    Inside the kernel with copy_file_range (also server side on NFS and
+    SMB), else sendfile, else through a buffer. Returns the method used.
+    kernel - False goes straight to the buffer
+    """
+    def remaining() -> int:
+        return RANGE_CHUNK if end is None else min(RANGE_CHUNK, end - offset)
+
+    if kernel and hasattr(os, "copy_file_range"):
+        try:
+            while remaining() > 0 and (n := os.copy_file_range(
+                    fsrc, fdst, remaining(), offset_src=offset, offset_dst=offset)):
+                offset += n
+            return "copy_file_range"
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+
+    os.lseek(fdst, offset, os.SEEK_SET)
+    if kernel and hasattr(os, "sendfile"):
+        try:
+            while remaining() > 0 and (n := os.sendfile(fdst, fsrc, offset, remaining())):
+                offset += n
+            return "sendfile"
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                raise
+            os.lseek(fdst, offset, os.SEEK_SET)
+
+    while remaining() > 0 and (chunk := os.pread(fsrc, min(COPY_CHUNK, remaining()), offset)):
+        offset += os.write(fdst, chunk)
+    return "buffered"
+
+
+def _data_segments(fd: int, size: int) -> Iterator[tuple[int, int]]:
+    """(start, end) of the parts of a sparse file that hold data"""
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO: # only a hole after offset
+                return
+            raise
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        yield start, end
+        offset = end
+
+
+def copy_data(fsrc: int, fdst: int, reflink: str = "auto") -> str:
+    """Copies the contents of one open file into another, empty one
+
+    Tries a reflink clone, then the kernel copy of _range_copy. Files with
+    holes (fewer blocks than their size) are copied segment by segment,
+    so the holes stay holes. Returns the method used.
+    reflink - auto tries a clone first, always fails without one, never
+        doesn't try
+    """
+    if reflink != "never":
+        if _reflink(fsrc, fdst):
+            return "reflink"
+        if reflink == "always":
+            raise OSError(errno.EOPNOTSUPP, "reflink not supported between these files")
+
+    st = os.fstat(fsrc)
+    if st.st_size == 0: # empty, or generated on read like /proc files, which the kernel copies as empty
+        return _range_copy(fsrc, fdst, 0, None, kernel=False)
+    sparse = hasattr(os, "SEEK_DATA") and getattr(st, "st_blocks", None) is not None \
+        and st.st_blocks * 512 < st.st_size
+    if not sparse:
+        return _range_copy(fsrc, fdst, 0, None)
+
+    try:
+        segments = list(_data_segments(fsrc, st.st_size))
+    except OSError as e:
+        if e.errno not in UNSUPPORTED:
+            raise
+        return _range_copy(fsrc, fdst, 0, None) # no SEEK_DATA on this file system
+    method = "buffered"
+    for start, end in segments:
+        method = _range_copy(fsrc, fdst, start, end)
+    os.ftruncate(fdst, st.st_size) # a trailing hole
+    return f"sparse {method}"
+
+
+def copy_file(src: str, dst: str, reflink: str = "auto", times: bool = True) -> str:
+    """Copies one file with copy_data, then its mode, and its times and
+    flags when times is set (like shutil.copy2, else like shutil.copy).
+    dst may be a directory. Returns the method used."""
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+    with open(src, "rb") as fsrc:
+        if stat.S_ISFIFO(os.fstat(fsrc.fileno()).st_mode):
+            raise shutil.SpecialFileError(f"`{src}` is a named pipe")
+        with open(dst, "wb") as fdst:
+            method = copy_data(fsrc.fileno(), fdst.fileno(), reflink)
+    if times:
+        shutil.copystat(src, dst)
+    else:
+        shutil.copymode(src, dst)
+    logger.debug(f"{src} -> {dst}: {method}")
+    return method
+
+
+def _raise(e: OSError):
+    raise e
+
+
+def make_skeleton(src: Path, dst: Path) -> tuple[list[tuple[Path, Path]], list[CopyTask]]:
+    """Creates dst and every directory under it, lists the files to copy
+
+    Symlinked directories become directories, each copied once, like
+    shutil.copytree with symlinks=False. Returns the (source, copy)
+    directory pairs in walk order and the file tasks.
+    """
+    dst.mkdir(parents=True)
+    dirs = [(src, dst)]
+    files: list[CopyTask] = []
+    for entry in walk(src, follow_symlinks=True, dirs=True, on_error=_raise):
+        target = dst / Path(entry.path).relative_to(src)
+        if entry.is_dir():
+            target.mkdir()
+            dirs.append((Path(entry.path), target))
+        else:
+            files.append((entry.path, str(target), entry.stat().st_size))
+    return dirs, files
+
+
+def _copy_batch(batch: list[CopyTask], copy: CopyFunc) -> tuple[int, int, Counter[str]]:
+    methods: Counter[str] = Counter()
+    for src, dst, _ in batch:
+        method = copy(src, dst)
+        if method is not None:
+            methods[method] += 1
+    return len(batch), sum(size for _, _, size in batch), methods
+
+
+def copy_files(files: list[CopyTask], jobs: int = COPY_JOBS, copy: CopyFunc = copy_file,
+               progress: Callable[[CopyProgress], None] | None = None) -> CopyProgress:
+    """Copies the files with jobs threads, in batches of COPY_BATCH
+
+    Copying small files is bound by metadata round trips, not bandwidth,
+    so several in flight keep the disk busy. progress is called at most
+    every COPY_PROGRESS_INTERVAL seconds and once at the end. The first
+    error stops the copy and is raised.
+    """
+    state = CopyProgress(len(files), sum(size for _, _, size in files))
+    last_report = state.started
+
+    def done(counts: tuple[int, int, Counter[str]]):
+        nonlocal last_report
+        state.files += counts[0]
+        state.bytes += counts[1]
+        state.methods += counts[2]
+        if progress is not None and time.monotonic() - last_report >= COPY_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            progress(state)
+
+    tasks = iter(files)
+    batches = iter(lambda: list(islice(tasks, COPY_BATCH)), [])
+    if jobs <= 1:
+        for batch in batches:
+            done(_copy_batch(batch, copy))
+    else:
+        pending: deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            try:
+                for batch in batches:
+                    pending.append(pool.submit(_copy_batch, batch, copy))
+                    if len(pending) >= jobs * 4:
+                        done(pending.popleft().result())
+                while pending:
+                    done(pending.popleft().result())
+            finally:
+                for future in pending: # failed or interrupted
+                    future.cancel()
+
+    if progress is not None:
+        progress(state)
+    return state
+
+
+def copy_tree(src: Path, dst: Path, jobs: int = COPY_JOBS, copy: CopyFunc = copy_file,
+              progress: Callable[[CopyProgress], None] | None = None) -> CopyProgress:
+    """Same result as shutil.copytree: the skeleton first, then the files
+    in parallel, then directory times and modes"""
+    dirs, files = make_skeleton(src, dst)
+    logger.debug(f"Created {len(dirs)} directories under {dst}, copying {len(files)} files")
+    state = copy_files(files, jobs, copy, progress)
+    # after the contents, or copying them would change the mtimes again
+    for src_dir, dst_dir in reversed(dirs):
+        shutil.copystat(src_dir, dst_dir)
+    return state
@@ -0,0 +1,206 @@
+from array import array
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+import os
+import sqlite3
+import stat
+import time
+import logging
+
+from src.config import DU_CACHE_FILE
+from src.utils.cache_utils import RACY_WINDOW_NS
+from src.utils.walk_utils import scan
+
+logger = logging.getLogger(__name__)
+
+# (device, inode, usage) of a file with several hard links
+Link = tuple[int, int, int]
+
+
+@dataclass
+class DirUsage:
+    """What one directory adds to du, without its subdirectories"""
+    mtime_ns: int
+    own: int # the directory itself and its files, minus hard-linked ones
+    subdirs: list[str] # names
+    links: list[Link] # counted once over the whole walk, by whoever sees them first
+
+
+def usage(st: os.stat_result) -> int:
+    """Bytes on disk, the apparent size where blocks aren't reported"""
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def read_dir(path: str, cached: DirUsage | None = None) -> DirUsage:
+    """Usage of one directory, reusing cached when its mtime didn't change
+
+    A hit costs one stat of the directory instead of a stat per file.
+    Raises OSError when the directory can't be read.
+    """
+    st = os.lstat(path)
+    if cached is not None and cached.mtime_ns == st.st_mtime_ns:
+        return cached
+
+    own, subdirs, links = usage(st), [], []
+    for entry in scan(path):
+        try:
+            est = entry.stat(follow_symlinks=False)
+        except OSError: # removed meanwhile
+            continue
+        if stat.S_ISDIR(est.st_mode):
+            subdirs.append(entry.name)
+        elif est.st_nlink > 1:
+            links.append((est.st_dev, est.st_ino, usage(est)))
+        else:
+            own += usage(est)
+    return DirUsage(st.st_mtime_ns, own, subdirs, links)
+
+
+def _log_error(e: OSError):
+    logger.warning(f"du: {e}")
+
+
+def read_tree(root: str, jobs: int = 1, known: dict[str, DirUsage] | None = None,
+              on_error: Callable[[OSError], None] = _log_error) -> dict[str, DirUsage]:
+    """read_dir of root and every directory under it, by path
+
+    With jobs > 1 directories are read by that many threads as soon as
+    their parent is, which pays off where each read is a round trip.
+    known - cached usages, reused where the mtime still matches
+    """
+    known = known or {}
+    dirs: dict[str, DirUsage] = {}
+
+    def found(path: str, info: DirUsage) -> list[str]:
+        dirs[path] = info
+        return [os.path.join(path, name) for name in info.subdirs]
+
+    if jobs <= 1:
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                stack += found(path, read_dir(path, known.get(path)))
+            except OSError as e:
+                on_error(e)
+        return dirs
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending: dict[Future, str] = {pool.submit(read_dir, root, known.get(root)): root}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        subdirs = found(path, future.result())
+                    except OSError as e:
+                        on_error(e)
+                        continue
+                    for sub in subdirs:
+                        pending[pool.submit(read_dir, sub, known.get(sub))] = sub
+        finally:
+            for future in pending: # interrupted
+                future.cancel()
+    return dirs
+
+
+def post_order(root: str, dirs: dict[str, DirUsage]) -> Iterator[str]:
+    """Directories under root, each after its subdirectories, by name"""
+    stack: list[tuple[str, bool]] = [(root, False)]
+    while stack:
+        path, expanded = stack.pop()
+        if expanded:
+            yield path
+            continue
+        info = dirs.get(path)
+        if info is None: # unreadable
+            continue
+        stack.append((path, True))
+        stack += [(os.path.join(path, name), False) for name in sorted(info.subdirs, reverse=True)]
+
+
+def totals(root: str, dirs: dict[str, DirUsage]) -> dict[str, int]:
+    """Usage of every directory with everything under it, in post order"""
+    seen: set[tuple[int, int]] = set()
+    result: dict[str, int] = {}
+    for path in post_order(root, dirs):
+        info = dirs[path]
+        total = info.own + sum(result.get(os.path.join(path, name), 0) for name in info.subdirs)
+        for dev, ino, size in info.links:
+            if (dev, ino) not in seen:
+                seen.add((dev, ino))
+                total += size
+        result[path] = total
+    return result
+
+
+class DuCache:
+    """Usages of directories kept between runs of du --cache, by path
+
+    A directory is read again only when its mtime changed. Files that
+    change in place don't touch the directory mtime, so their new size is
+    only picked up once something in that directory is added, removed
+    or renamed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            own INTEGER NOT NULL,
+            subdirs TEXT NOT NULL, -- names joined by NUL
+            links BLOB NOT NULL -- array('q') of device, inode, usage
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path) if path is not None else DU_CACHE_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") # can always be rebuilt
+        self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _range(root: str) -> tuple[str, str, str]:
+        # root and the paths under it: root/ up to root0, '0' follows '/'
+        prefix = root.rstrip(os.sep) + os.sep
+        return root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def load(self, root: str) -> dict[str, DirUsage]:
+        rows = self.conn.execute(
+            "SELECT path, mtime_ns, own, subdirs, links FROM dirs "
+            "WHERE path = ? OR (path >= ? AND path < ?)", self._range(root))
+        known = {}
+        for path, mtime_ns, own, subdirs, links in rows:
+            flat = array('q', links)
+            known[path] = DirUsage(mtime_ns, own, subdirs.split("\0") if subdirs else [],
+                                   [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]) # type: ignore[misc]
+        return known
+
+    def save(self, root: str, dirs: dict[str, DirUsage], known: dict[str, DirUsage]):
+        """Stores what was read again and forgets directories under root that are gone"""
+        racy = time.time_ns() - RACY_WINDOW_NS
+        changed = [(path, info.mtime_ns, info.own, "\0".join(info.subdirs),
+                    array('q', [n for link in info.links for n in link]).tobytes())
+                   for path, info in dirs.items()
+                   # changed within the mtime tick, may change again unnoticed
+                   if known.get(path) is not info and info.mtime_ns < racy]
+        gone = [(path,) for path in known.keys() - dirs.keys()]
+        with self.conn:
+            self.conn.executemany("DELETE FROM dirs WHERE path = ?", gone)
+            self.conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)", changed)
+        logger.debug(f"du cache of {root}: {len(changed)} directories updated, {len(gone)} removed")
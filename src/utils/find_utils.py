@@ -0,0 +1,81 @@
+from fnmatch import translate
+from typing import Callable
+import math
+import re
+import time
+
+from src.utils.misc_utils import SIZE_UNITS
+
+# takes an os.DirEntry (or walk_utils.PathEntry), True keeps it
+Predicate = Callable[..., bool]
+
+TYPE_CHECKS: dict[str, Callable[..., bool]] = {
+    "f": lambda entry: entry.is_file(follow_symlinks=False),
+    "d": lambda entry: entry.is_dir(follow_symlinks=False),
+    "l": lambda entry: entry.is_symlink(),
+}
+DAY = 86400
+
+
+def name_predicate(pattern: str, ignore_case: bool = False) -> Predicate:
+    """-name/-iname: the glob is translated to a regex once"""
+    match = re.compile(translate(pattern), re.IGNORECASE if ignore_case else 0).match
+    return lambda entry: match(entry.name) is not None
+
+
+def type_predicate(types: str) -> Predicate:
+    """-type f|d|l, several as f,d. Answered by scandir, no stat."""
+    checks = []
+    for t in types.split(","):
+        if t not in TYPE_CHECKS:
+            raise ValueError(f"unknown type '{t}', expected f, d or l")
+        checks.append(TYPE_CHECKS[t])
+    if len(checks) == 1:
+        return checks[0]
+    return lambda entry: any(check(entry) for check in checks)
+
+
+def _compare(spec: str, what: str) -> tuple[Callable[[int, int], bool], str]:
+    # +N more than N, -N less than N, N exactly
+    if spec[:1] == "+":
+        return (lambda value, n: value > n), spec[1:]
+    if spec[:1] == "-":
+        return (lambda value, n: value < n), spec[1:]
+    if not spec:
+        raise ValueError(f"empty {what}")
+    return (lambda value, n: value == n), spec
+
+
+def size_predicate(spec: str) -> Predicate:
+    """-size [+-]N[c|K|M|G|T]: the size is rounded up to the unit (bytes by
+    default) and compared to N, like find does"""
+    compare, number = _compare(spec, "size")
+    m = re.fullmatch(r"(\d+)([cKMGT]?)", number, re.IGNORECASE)
+    if m is None:
+        raise ValueError(f"invalid size '{spec}', expected like +10K or -2M")
+    n = int(m.group(1))
+    unit = SIZE_UNITS[m.group(2).upper().replace("C", "")]
+    return lambda entry: compare(math.ceil(entry.stat(follow_symlinks=False).st_size / unit), n)
+
+
+def mtime_predicate(spec: str, now: float | None = None) -> Predicate:
+    """-mtime [+-]N: whole days since the last change, compared to N"""
+    compare, number = _compare(spec, "mtime")
+    if not number.isdigit():
+        raise ValueError(f"invalid mtime '{spec}', expected a number of days like -7 or +30")
+    n = int(number)
+    now = time.time() if now is None else now
+    return lambda entry: compare(int((now - entry.stat(follow_symlinks=False).st_mtime) // DAY), n)
+
+
+def all_of(predicates: list[Predicate]) -> Predicate:
+    """One predicate checking the given ones in order, stopping at the first False.
+
+    Callers put the scandir-only checks (name, type) first, so entries
+    they reject are never stat-ed.
+    """
+    if not predicates:
+        return lambda entry: True
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda entry: all(p(entry) for p in predicates)
@@ -0,0 +1,546 @@
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any, Generator, Iterable, Iterator
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import tarfile
+import zipfile
+
+from colorama import Fore, Style
+
+GREEN = Fore.GREEN + Style.BRIGHT
+YELLOW = Fore.YELLOW + Style.BRIGHT
+RED = Fore.RED + Style.BRIGHT
+RESET = Style.RESET_ALL
+
+MMAP_MIN_SIZE = 256 * 1024 # smaller files are cheaper to read() than to map
+BINARY_SNIFF_SIZE = 8192 # a NUL in this many first bytes marks a binary file
+STREAM_BLOCK = 1024 * 1024 # archive members and str-pattern files are scanned this much at a time
+# what zip/tar (src/commands/archive.py) write and untar reads
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+AC_MIN_PATTERNS = 16 # fewer literals are faster as one regex alternation
+AC_CHUNK = 1024 * 1024
+REGEX_META = set(".^$*+?{}[]\\|()")
+UNICODE_ESCAPES = set("wWbBdDsS") # ASCII-only in bytes patterns
+CODE_ESCAPES = set("x0") # \x80 is a byte in bytes patterns, a character in str ones
+OCTAL_ESCAPE = re.compile(r"[0-7]{3}")
+ASCII_FOLD_UNSAFE = set("iksIKS")
+INLINE_IGNORE_CASE = re.compile(r"\(\?[a-zA-Z]*i")
+
+# (file to search, path shown in the output)
+GrepTask = tuple[Path, Path]
+# (line number, line start, line end, match spans) inside a buffer
+LineMatch = tuple[int, int, int, list[tuple[int, int]]]
+Span = tuple[int, int]
+
+
+def bytes_safe(pattern_raw: str, ignore_case: bool = False) -> bool:
+    """Whether a bytes regex matches exactly what the str regex matches.
+
+    Conservative: the pattern must be ASCII, and have no ., no negated
+    class, no \\w \\b \\d \\s class escapes or their negations and no \\x or
+    octal escapes. Those match one byte or ASCII only with bytes, but one
+    character or Unicode with str. Case folding only differs for i, k and
+    s (and classes that may hold them), which str also folds to İ ı K ſ.
+    """
+    if not pattern_raw.isascii():
+        return False
+    if ignore_case or INLINE_IGNORE_CASE.search(pattern_raw):
+        if ASCII_FOLD_UNSAFE.intersection(pattern_raw) or "[" in pattern_raw:
+            return False
+
+    in_class = False
+    i, n = 0, len(pattern_raw)
+    while i < n:
+        c = pattern_raw[i]
+        if c == "\\":
+            escaped = pattern_raw[i + 1:i + 2]
+            if escaped in UNICODE_ESCAPES or escaped in CODE_ESCAPES or OCTAL_ESCAPE.match(pattern_raw, i + 1):
+                return False
+            i += 2
+            continue
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == ".":
+            return False
+        elif c == "[":
+            if pattern_raw[i + 1:i + 2] == "^":
+                return False
+            in_class = True
+            if pattern_raw[i + 1:i + 2] == "]": # a literal ] first in the class
+                i += 1
+        i += 1
+    return True
+
+
+def compile_pattern(pattern_raw: str, ignore_case: bool = False) -> re.Pattern:
+    """Compiles the pattern for scan_buffer.
+
+    Bytes patterns let files be searched without decoding them, they are
+    used only where bytes_safe says the matches are the same. Others get a
+    str pattern and decoded buffers.
+    MULTILINE keeps ^ and $ anchored to lines inside a whole-file buffer.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    if bytes_safe(pattern_raw, ignore_case):
+        try:
+            return re.compile(pattern_raw.encode('utf-8'), flags)
+        except re.error:
+            pass
+    return re.compile(pattern_raw, flags)
+
+
+def is_literal(pattern_raw: str) -> bool:
+    return not REGEX_META.intersection(pattern_raw)
+
+
+class Matcher:
+    """An interface that all grep matchers must follow
+
+    Spans are (start, end) offsets in the searched buffer.
+    """
+
+    is_bytes: bool = True # whether buffers are bytes or decoded str
+
+    def search(self, buf: Any, pos: int) -> Span | None:
+        """The first match starting at or after pos."""
+        raise NotImplementedError
+
+    def spans(self, buf: Any, start: int, end: int) -> list[Span]:
+        """All non-overlapping matches inside buf[start:end]."""
+        raise NotImplementedError
+
+    def line_spans(self, buf: Any, hit: Span, line_start: int, line_end: int) -> list[Span]:
+        """Spans of the line holding hit, reusing the hit when it fits in the line"""
+        start, end = hit
+        if end > line_end:
+            return self.spans(buf, line_start, line_end)
+        return [hit] + self.spans(buf, max(end, start + 1), line_end)
+
+
+class RegexMatcher(Matcher):
+    def __init__(self, pattern_raw: str, ignore_case: bool = False):
+        self.regex = compile_pattern(pattern_raw, ignore_case)
+        self.is_bytes = isinstance(self.regex.pattern, bytes)
+
+    def search(self, buf, pos):
+        m = self.regex.search(buf, pos)
+        return m.span() if m else None
+
+    def spans(self, buf, start, end):
+        return [m.span() for m in self.regex.finditer(buf, start, end)]
+
+
+class LiteralMatcher(Matcher):
+    """Fixed string, found with bytes.find instead of the regex engine"""
+
+    def __init__(self, literal: str):
+        self.literal = literal.encode('utf-8')
+
+    def search(self, buf, pos):
+        i = buf.find(self.literal, pos)
+        return None if i < 0 else (i, i + len(self.literal))
+
+    def spans(self, buf, start, end):
+        result, n = [], len(self.literal)
+        i = buf.find(self.literal, start, end)
+        while i >= 0:
+            result.append((i, i + n))
+            i = buf.find(self.literal, i + n, end)
+        return result
+
+
+class AhoCorasickMatcher(Matcher):
+    """Many fixed strings searched in one pass
+
+    The automaton moves once per byte no matter how many strings there
+    are, unlike a regex alternation which tries every branch at every
+    position. Case folding, if asked, is ASCII only.
+    """
+
+    def __init__(self, literals: list[str], ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.goto: list[dict[int, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[int] = [0] # length of the longest literal ending in a state
+
+        for literal in literals:
+            data = literal.encode('utf-8')
+            if ignore_case:
+                data = data.lower()
+            state = 0
+            for byte in data:
+                nxt = self.goto[state].get(byte)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][byte] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(0)
+                state = nxt
+            self.out[state] = max(self.out[state], len(data))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for byte, nxt in self.goto[state].items():
+                queue.append(nxt)
+                if state:  # children of the root fail back to the root
+                    f = self.fail[state]
+                    while f and byte not in self.goto[f]:
+                        f = self.fail[f]
+                    self.fail[nxt] = self.goto[f].get(byte, 0)
+                self.out[nxt] = max(self.out[nxt], self.out[self.fail[nxt]])
+
+    def _ends(self, buf, start: int, end: int, first_only: bool) -> Iterator[Span]:
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for chunk_start in range(start, end, AC_CHUNK):
+            data = buf[chunk_start:min(chunk_start + AC_CHUNK, end)]
+            if self.ignore_case:
+                data = data.lower()
+            for i, byte in enumerate(data):
+                while state and byte not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(byte, 0)
+                if out[state]:
+                    stop = chunk_start + i + 1
+                    yield stop - out[state], stop
+                    if first_only:
+                        return
+
+    def search(self, buf, pos):
+        return next(self._ends(buf, pos, len(buf), first_only=True), None)
+
+    def line_spans(self, buf, hit, line_start, line_end):
+        # the first hit is the earliest to end, not the leftmost-longest one
+        return self.spans(buf, line_start, line_end)
+
+    def spans(self, buf, start, end):
+        result: list[Span] = []
+        for span in sorted(self._ends(buf, start, end, first_only=False)):
+            if not result or span[0] >= result[-1][1]:
+                result.append(span)
+        return result
+
+
+def build_matcher(patterns: list[str], ignore_case: bool = False, fixed: bool = False) -> Matcher:
+    """Picks the cheapest matcher that gives the same matches.
+
+    fixed (-F) treats patterns as plain strings, patterns without regex
+    metacharacters are treated the same way automatically.
+    """
+    literal = fixed or all(is_literal(p) for p in patterns)
+    as_regex = [re.escape(p) if fixed else p for p in patterns]
+
+    if len(patterns) == 1:
+        if literal and patterns[0] and not ignore_case:
+            return LiteralMatcher(patterns[0])
+        return RegexMatcher(as_regex[0], ignore_case)
+
+    if (literal and len(patterns) >= AC_MIN_PATTERNS and all(patterns)
+            and not (ignore_case and not all(p.isascii() for p in patterns))):
+        return AhoCorasickMatcher(patterns, ignore_case)
+    return RegexMatcher("|".join(f"(?:{p})" for p in as_regex), ignore_case)
+
+
+def _count(buf: Any, sub: Any, start: int, end: int) -> int:
+    if hasattr(buf, 'count'):
+        return buf.count(sub, start, end)
+    return buf[start:end].count(sub) # mmap has no count() before 3.13
+
+
+def scan_buffer(buf: Any, matcher: Matcher) -> Iterator[LineMatch]:
+    """Finds matching lines in a whole buffer (bytes, mmap or str).
+
+    The matcher runs over the buffer instead of line by line, each hit is
+    mapped back to its line, and the spans found there are reused for
+    highlighting. A hit that crosses a newline (e.g. through \\s) is
+    re-checked inside its own line, so results match per-line grep.
+    """
+    newline = b"\n" if matcher.is_bytes else "\n"
+    size = len(buf)
+    pos = 0 # always the start of a line
+    line_num, counted = 1, 0
+
+    while pos <= size:
+        hit = matcher.search(buf, pos)
+        if hit is None:
+            return
+        start = hit[0]
+        nl = buf.rfind(newline, pos, start)
+        line_start = pos if nl < 0 else nl + 1
+        if line_start == size:
+            return # empty match after the last newline (or in an empty buffer) is not a line
+        line_end = buf.find(newline, start)
+        if line_end < 0:
+            line_end = size
+
+        spans = matcher.line_spans(buf, hit, line_start, line_end)
+        if spans:
+            line_num += _count(buf, newline, counted, line_start)
+            counted = line_start
+            yield line_num, line_start, line_end, spans
+        pos = line_end + 1
+
+
+def format_line(buf: Any, match: LineMatch, display_path: Path | str) -> str:
+    """Output line with highlighted spans, only matched lines get decoded"""
+    line_num, line_start, line_end, spans = match
+    is_bytes = isinstance(buf, (bytes, mmap.mmap))
+    red, reset = (RED.encode(), RESET.encode()) if is_bytes else (RED, RESET)
+
+    line = buf[line_start:line_end].rstrip()
+    parts, cur = [], 0
+    for start, end in spans:
+        start, end = start - line_start, min(end - line_start, len(line))
+        if end <= start or start < cur:
+            continue
+        parts += [line[cur:start], red, line[start:end], reset]
+        cur = end
+    parts.append(line[cur:])
+
+    text = b"".join(parts).decode('utf-8', errors='ignore') if is_bytes else "".join(parts)
+    return (
+                f"{GREEN}{display_path}{RESET}:"
+                f"{YELLOW}{line_num}{RESET}:"
+                f"{text}"
+            )
+
+
+# what grep prints for each file
+LINES = "lines"
+COUNT = "count" # -c
+FILES_WITH_MATCHES = "files-with-matches" # -l
+FILES_WITHOUT_MATCH = "files-without-match" # -L
+QUIET = "quiet" # -q
+
+
+@dataclass
+class GrepOptions:
+    """How files are searched, sent to each pool worker once"""
+    matcher: Matcher
+    skip_binary: bool = False # -I, otherwise binary files only get a summary line
+    max_filesize: int | None = None # bigger files (archive members) are skipped
+    archives: bool = False # -z, search members of zip and tar files
+    mode: str = LINES
+    max_count: int | None = None # -m, matching lines read per file
+
+
+# (output lines, whether anything matched) of one file
+FileResult = tuple[list[str], bool]
+
+
+def is_binary(head: bytes) -> bool:
+    return b"\0" in head
+
+
+def _collect(matches: Iterator[tuple[Any, LineMatch]], binary: bool,
+             options: GrepOptions, display_path: Path | str) -> FileResult:
+    """Output of one file in the options' mode.
+
+    matches are produced lazily, modes that need only the first match
+    (and -m) stop reading the file there.
+    """
+    if options.max_count is not None:
+        matches = islice(matches, options.max_count)
+    name = f"{GREEN}{display_path}{RESET}"
+
+    if options.mode == COUNT:
+        n = sum(1 for _ in matches)
+        return [f"{name}:{n}"], n > 0
+    if options.mode == LINES and not binary:
+        lines = [format_line(buf, match, display_path) for buf, match in matches]
+        return lines, bool(lines)
+
+    matched = next(matches, None) is not None
+    if options.mode == LINES:
+        return ([f"Binary file {name} matches"] if matched else []), matched
+    if options.mode == FILES_WITH_MATCHES:
+        return ([name] if matched else []), matched
+    if options.mode == FILES_WITHOUT_MATCH:
+        return ([] if matched else [name]), matched
+    return [], matched # QUIET
+
+
+def scan_file(path: Path, options: GrepOptions, display_path: Path) -> FileResult:
+    """Searches one file on disk
+
+    A NUL in the first block marks a binary file: it is skipped with
+    skip_binary, otherwise only summarized in LINES mode. Bytes patterns
+    scan the whole file (mmapped when big), str ones decode and scan it
+    in STREAM_BLOCK pieces cut at newlines.
+    """
+    with path.open('rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if options.max_filesize is not None and size > options.max_filesize:
+            return [], False
+        head = f.read(BINARY_SNIFF_SIZE)
+        binary = is_binary(head)
+        if binary and options.skip_binary:
+            return [], False
+
+        matcher = options.matcher
+        if not matcher.is_bytes:
+            return _collect(_stream_matches(f, head, matcher), binary, options, display_path)
+        if size < MMAP_MIN_SIZE:
+            buf: Any = head + f.read()
+        else:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            matches = ((buf, match) for match in scan_buffer(buf, matcher))
+            return _collect(matches, binary, options, display_path)
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+
+def is_archive(path: Path | str) -> bool:
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _stream_matches(stream: IO[bytes], block: bytes, matcher: Matcher) -> Iterator[tuple[Any, LineMatch]]:
+    # block is what was already read, carry the part after the last newline
+    carry, line_offset = b"", 0
+    while True:
+        if block:
+            data = carry + block
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                carry = data # the line goes on in the next block
+                block = stream.read(STREAM_BLOCK)
+                continue
+            data, carry = data[:cut], data[cut:]
+        else:
+            data, carry = carry, b""
+
+        buf: Any = data if matcher.is_bytes else data.decode('utf-8', errors='ignore')
+        for line_num, start, end, spans in scan_buffer(buf, matcher):
+            yield buf, (line_num + line_offset, start, end, spans)
+        line_offset += data.count(b"\n")
+        if not block:
+            return
+        block = stream.read(STREAM_BLOCK)
+
+
+def grep_stream(stream: IO[bytes], options: GrepOptions, display_path: Path | str) -> FileResult:
+    """scan_file for a file object that can only be read forward
+
+    Reads STREAM_BLOCK bytes at a time and scans them up to the last
+    newline, the rest is carried to the next block.
+    """
+    head = stream.read(STREAM_BLOCK)
+    binary = is_binary(head[:BINARY_SNIFF_SIZE])
+    if binary and options.skip_binary:
+        return [], False
+    return _collect(_stream_matches(stream, head, options.matcher), binary, options, display_path)
+
+
+def _archive_members(path: Path, max_filesize: int | None) -> Generator[tuple[str, IO[bytes]], None, None]:
+    if str(path).lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for zip_info in zf.infolist():
+                if zip_info.is_dir() or (max_filesize is not None and zip_info.file_size > max_filesize):
+                    continue
+                with zf.open(zip_info) as zip_member:
+                    yield zip_info.filename, zip_member
+    else:
+        # stream mode reads the (maybe compressed) tar once, front to back
+        with tarfile.open(path, 'r|*') as tf:
+            for tar_info in tf:
+                if not tar_info.isfile() or (max_filesize is not None and tar_info.size > max_filesize):
+                    continue
+                tar_member = tf.extractfile(tar_info)
+                if tar_member is not None:
+                    yield tar_info.name, tar_member
+
+
+def grep_archive(path: Path, options: GrepOptions, display_path: Path) -> FileResult:
+    """Searches the members of a zip or tar file without extracting them
+
+    Members are reported as archive:member.
+    """
+    lines: list[str] = []
+    matched = False
+    members = _archive_members(path, options.max_filesize)
+    try:
+        for name, member in members:
+            member_lines, member_matched = grep_stream(member, options, f"{display_path}:{name}")
+            lines += member_lines
+            matched = matched or member_matched
+            if matched and options.mode == QUIET:
+                break
+    finally:
+        members.close() # closes the archive when stopped early
+    return lines, matched
+
+
+def search_file(path: Path, options: GrepOptions, display_path: Path) -> FileResult:
+    if options.archives and is_archive(path):
+        return grep_archive(path, options, display_path)
+    return scan_file(path, options, display_path)
+
+
+def grep_task(task: GrepTask, options: GrepOptions) -> FileResult:
+    """Greps one file, unreadable files give no matches"""
+    path, display_path = task
+    try:
+        return search_file(path, options, display_path)
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile, tarfile.TarError):
+        return [], False
+
+
+_worker_options: GrepOptions | None = None
+
+def _init_worker(options: GrepOptions):
+    # the matcher (maybe a big automaton) is sent once per worker, not per file
+    global _worker_options
+    _worker_options = options
+    # Ctrl-C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _worker_task(task: GrepTask) -> FileResult:
+    assert _worker_options is not None
+    return grep_task(task, _worker_options)
+
+
+def _pool_context() -> BaseContext:
+    # by now the shell runs threads (history writer, walk read-ahead), a
+    # forked worker could inherit a lock one of them holds, so workers
+    # start from a fresh interpreter instead. The fork server imports
+    # __main__ once, its workers are forked from it ready to run
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def parallel_grep(tasks: Iterable[GrepTask], options: GrepOptions, jobs: int) -> Generator[FileResult, None, None]:
+    """Runs grep_task in a process pool, yields results in task order.
+
+    At most jobs * 4 files are in flight, so results stream while the
+    walk goes on and memory does not depend on the tree size.
+    """
+    pool = ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(),
+                               initializer=_init_worker, initargs=(options,))
+    pending: deque[Future] = deque()
+    finished = False
+    try:
+        for task in tasks:
+            pending.append(pool.submit(_worker_task, task))
+            if len(pending) >= jobs * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+        finished = True
+    finally:
+        # interrupted (KeyboardInterrupt or the consumer stopped): drop the rest
+        pool.shutdown(wait=finished, cancel_futures=True)
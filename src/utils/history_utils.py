@@ -0,0 +1,656 @@
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Generator, Iterable, Iterator
+import threading
+import queue
+import re
+import time
+import gzip
+import os
+import sqlite3
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_OP = "remove"
+MAX_ID = 2 ** 63 - 1 # ids are time.time_ns(), SQLite integers are 64-bit
+ARCHIVE_GLOB = "history-*.jsonl.gz"
+
+
+@dataclass
+class HistoryLimits:
+    """Quota of the hot history, None disables a limit.
+
+    Records over the quota are rolled into gzip files in archive_dir.
+    """
+    archive_dir: Path
+    max_entries: int | None = None
+    max_bytes: int | None = None
+    max_age_days: float | None = None
+
+    def cutoff(self) -> str | None:
+        """Records with an older timestamp are over the age limit."""
+        if self.max_age_days is None:
+            return None
+        return (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+
+
+class HistoryStore:
+    """An interface that all history backends must follow
+
+    Records are plain dicts in the format of entry_to_dict,
+    returned from oldest to newest.
+    """
+
+    lock: threading.RLock
+    limits: HistoryLimits | None = None
+
+    def append(self, records: list[dict[str, Any]]):
+        """Durably appends records, one fsync per call."""
+        raise NotImplementedError
+
+    def remove(self, entry_id: int):
+        raise NotImplementedError
+
+    def entries(self) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
+    def iter_reversed(self) -> Iterator[dict[str, Any]]:
+        """Yields records from newest to oldest, reading lazily if possible."""
+        return reversed(self.entries())
+
+    def last_of(self, names: Iterable[str],
+                accept_meta: Callable[[dict[str, Any]], bool] | None = None) -> dict[str, Any] | None:
+        """Returns the newest record whose name is one of names.
+        accept_meta - skips records whose meta it returns False for"""
+        names = set(names)
+        for record in self.iter_reversed():
+            if record.get("name") in names and (accept_meta is None or accept_meta(record.get("meta", {}))):
+                return record
+        return None
+
+    def iter_entries(self) -> Iterator[dict[str, Any]]:
+        """Streams records from oldest to newest."""
+        return iter(self.entries())
+
+    def iter_query(self, name: str | None = None, cwd: str | None = None,
+                   since: str | None = None, until: str | None = None) -> Iterator[dict[str, Any]]:
+        """Streams records matching all given filters, oldest first.
+
+        since/until are inclusive bounds compared with ISO timestamps.
+        """
+        for record in self.iter_entries():
+            if _matches(record, name, cwd, since, until):
+                yield record
+
+    def count(self, **filters) -> int:
+        """How many records match filters, see iter_query"""
+        return sum(1 for _ in self.iter_query(**filters))
+
+    def tail(self, n: int, offset: int = 0, **filters) -> list[dict[str, Any]]:
+        """The newest n records matching filters, skipping the offset newest
+        ones. Reads from the end, returns oldest first."""
+        result: list[dict[str, Any]] = []
+        if n <= 0:
+            return result
+        for record in self.iter_reversed():
+            if not _matches(record, **filters):
+                continue
+            if offset > 0:
+                offset -= 1
+                continue
+            result.append(record)
+            if len(result) >= n:
+                break
+        result.reverse()
+        return result
+
+    def stats(self) -> tuple[int, int, str | None]:
+        """Stored records, bytes on disk and the oldest timestamp.
+        Must be cheap, it is checked after every append."""
+        raise NotImplementedError
+
+    def over_limits(self) -> bool:
+        if self.limits is None:
+            return False
+        records, size, oldest = self.stats()
+        cutoff = self.limits.cutoff()
+        return ((self.limits.max_entries is not None and records > self.limits.max_entries)
+                or (self.limits.max_bytes is not None and size > self.limits.max_bytes)
+                or (cutoff is not None and oldest is not None and oldest < cutoff))
+
+    def rotate(self) -> int:
+        """Rolls records over the limits into a compressed archive and
+        compacts the rest. Returns how many records were archived.
+
+        Trims to half of the entry/byte limits, so rotation stays rare.
+        """
+        if self.limits is None:
+            return 0
+
+        with self.lock:
+            records = self.entries()
+            n = len(records)
+            split = 0
+
+            cutoff = self.limits.cutoff()
+            if cutoff is not None:
+                while split < n and records[split].get("timestamp", "") < cutoff:
+                    split += 1
+            if self.limits.max_entries is not None and n - split > self.limits.max_entries:
+                split = n - self.limits.max_entries // 2
+            _, size, _ = self.stats()
+            if self.limits.max_bytes is not None and size > self.limits.max_bytes:
+                keep = int(n * self.limits.max_bytes / 2 / size)
+                split = max(split, n - keep)
+
+            if split:
+                write_archive(self.limits.archive_dir, records[:split])
+            self._compact(records[:split], records[split:])
+
+        logger.info(f"History rotated: {split} entries archived, {n - split} kept")
+        return split
+
+    def rotate_if_needed(self):
+        if self.over_limits():
+            self.rotate()
+
+    def _compact(self, archived: list[dict[str, Any]], kept: list[dict[str, Any]]):
+        """Drops archived records (and tombstones) from the hot storage."""
+        raise NotImplementedError
+
+
+def _matches(record: dict[str, Any], name=None, cwd=None, since=None, until=None) -> bool:
+    if name is not None and record.get("name") != name:
+        return False
+    if cwd is not None and record.get("cwd") != cwd:
+        return False
+    timestamp = record.get("timestamp", "")
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp > until:
+        return False
+    return True
+
+
+class JournalHistoryStore(HistoryStore):
+    """Append-only JSONL journal, one record per line.
+
+    Removal appends a tombstone record instead of rewriting the file.
+    """
+
+    def __init__(self, path: Path, limits: HistoryLimits | None = None):
+        self.path = Path(path)
+        self.limits = limits
+        self.lock = threading.RLock()
+        self._entries: int | None = None # counted lazily, see stats
+        self._oldest: str | None = None
+
+    def append(self, records):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+            if self._entries is not None:
+                # a tombstone hides one entry
+                self._entries += sum(-1 if r.get("op") == TOMBSTONE_OP else 1 for r in records)
+                if self._oldest is None:
+                    self._oldest = next((r.get("timestamp") for r in records
+                                         if r.get("op") != TOMBSTONE_OP), None)
+            self.rotate_if_needed()
+
+    def remove(self, entry_id):
+        self.append([{"op": TOMBSTONE_OP, "id": entry_id}])
+
+    def entries(self):
+        return list(self.iter_entries())
+
+    def iter_entries(self):
+        # first pass collects tombstones, they are written as '{"op": ...'
+        # so entries don't even need to be parsed for it
+        removed = set()
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+
+        with f:
+            for line in f:
+                if line.startswith(b'{"op"'):
+                    try:
+                        removed.add(json.loads(line).get("id"))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        continue
+            f.seek(0)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue # torn or foreign line, skip it
+                if (isinstance(record, dict) and record.get("op") != TOMBSTONE_OP
+                        and record.get("id") not in removed):
+                    yield record
+
+    def iter_reversed(self):
+        # tombstones always come after their entry, so reading backward
+        # we see the tombstone first and can skip the entry
+        removed = set()
+        lines = _read_lines_reversed(self.path)
+        with closing(lines): # the file closes with this reader, not when it is collected
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                if record.get("op") == TOMBSTONE_OP:
+                    removed.add(record.get("id"))
+                elif record.get("id") not in removed:
+                    yield record
+
+    def stats(self):
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return 0, 0, None
+
+        if self._entries is None:
+            # once per session, later appends keep the count up to date
+            self._entries, self._oldest = 0, None
+            for record in self.iter_entries(): # tombstones and removed entries skipped
+                if self._oldest is None:
+                    self._oldest = record.get("timestamp")
+                self._entries += 1
+        return self._entries, size, self._oldest
+
+    def _compact(self, archived, kept):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in kept))
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+        self._entries = len(kept)
+        self._oldest = kept[0].get("timestamp") if kept else None
+
+
+def _read_lines_reversed(path: Path, block_size: int = 64 * 1024) -> Generator[bytes, None, None]:
+    """Yields non-empty lines of a file from the last to the first,
+    seeking backward block by block."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + tail).split(b"\n")
+            tail = lines.pop(0) # may continue in the previous block
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if tail:
+            yield tail
+
+
+class SqliteHistoryStore(HistoryStore):
+    """SQLite history in WAL mode
+
+    Name, timestamp and cwd are indexed, so undo and filtered history
+    are answered by the database instead of scanning every entry.
+    """
+
+    PAGE_SIZE = 1000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            cwd TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_name ON history(name, id);
+        CREATE INDEX IF NOT EXISTS history_timestamp ON history(timestamp);
+        CREATE INDEX IF NOT EXISTS history_cwd ON history(cwd, id);
+    """
+
+    def __init__(self, path: Path, limits: HistoryLimits | None = None):
+        self.path = Path(path)
+        self.limits = limits
+        self.lock = threading.RLock()
+        self._count: int | None = None # counted lazily, see stats
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL") # fsync on every commit
+        self.conn.executescript(self.SCHEMA)
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None
+
+    def append(self, records):
+        rows = [
+            (r.get("id"), r.get("name", ""), r.get("cwd", ""), r.get("timestamp", ""),
+             json.dumps(r, ensure_ascii=False))
+            for r in records
+        ]
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO history (id, name, cwd, timestamp, record) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+            self._count = None if self._count is None else self._count + len(rows)
+            self.rotate_if_needed()
+
+    def remove(self, entry_id):
+        with self.lock, self.conn:
+            deleted = self.conn.execute("DELETE FROM history WHERE id = ?", (entry_id,)).rowcount
+            if self._count is not None:
+                self._count -= deleted
+
+    def stats(self):
+        with self.lock:
+            if self._count is None:
+                self._count = self.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            pages = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            oldest = self.conn.execute("SELECT MIN(timestamp) FROM history").fetchone()[0]
+        return self._count, (pages - free) * page_size, oldest
+
+    def _compact(self, archived, kept):
+        with self.lock, self.conn:
+            if archived:
+                self.conn.execute("DELETE FROM history WHERE id <= ?", (archived[-1]["id"],))
+            self._count = len(kept)
+
+    def _select(self, sql: str, params: Iterable[Any] = ()) -> list[dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(sql, tuple(params)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def entries(self):
+        return self._select("SELECT record FROM history ORDER BY id")
+
+    def iter_reversed(self):
+        rows = self._select("SELECT record FROM history ORDER BY id DESC LIMIT ?",
+                            (self.PAGE_SIZE,))
+        while rows:
+            yield from rows
+            rows = self._select("SELECT record FROM history WHERE id < ? "
+                                "ORDER BY id DESC LIMIT ?", (rows[-1]["id"], self.PAGE_SIZE))
+
+    def last_of(self, names, accept_meta=None):
+        names = list(names)
+        if not names:
+            return None
+        placeholders = ", ".join("?" * len(names))
+        query = (f"SELECT record FROM history WHERE name IN ({placeholders}) AND id < ? "
+                 "ORDER BY id DESC LIMIT ?")
+        before, limit = MAX_ID, 1 if accept_meta is None else self.PAGE_SIZE
+        while rows := self._select(query, [*names, before, limit]):
+            for record in rows:
+                if accept_meta is None or accept_meta(record.get("meta", {})):
+                    return record
+            before = rows[-1]["id"]
+        return None
+
+    @staticmethod
+    def _where(name=None, cwd=None, since=None, until=None) -> tuple[list[str], list[Any]]:
+        conditions, params = [], []
+        for column, op, value in (("name", "=", name), ("cwd", "=", cwd),
+                                  ("timestamp", ">=", since), ("timestamp", "<=", until)):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        return conditions, params
+
+    def iter_entries(self):
+        return self.iter_query()
+
+    def iter_query(self, name=None, cwd=None, since=None, until=None):
+        conditions, params = self._where(name, cwd, since, until)
+        last_id = None
+        while True:
+            where = conditions if last_id is None else [*conditions, "id > ?"]
+            page_params = params if last_id is None else [*params, last_id]
+            sql = "SELECT record FROM history"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            rows = self._select(sql + " ORDER BY id LIMIT ?", [*page_params, self.PAGE_SIZE])
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1]["id"]
+
+    def count(self, **filters):
+        conditions, params = self._where(**filters)
+        sql = "SELECT COUNT(*) FROM history"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()[0]
+
+    def tail(self, n, offset=0, **filters):
+        if n <= 0:
+            return []
+        conditions, params = self._where(**filters)
+        sql = "SELECT record FROM history"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        rows = self._select(sql + " ORDER BY id DESC LIMIT ? OFFSET ?", [*params, n, max(offset, 0)])
+        rows.reverse()
+        return rows
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def write_archive(archive_dir: Path, records: list[dict[str, Any]]) -> Path:
+    """Writes records into a gzip JSONL file named after their id range."""
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    first, last = int(records[0].get("id") or 0), int(records[-1].get("id") or 0)
+    path = archive_dir / f"history-{first:020d}-{last:020d}.jsonl.gz"
+
+    tmp = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+    tmp.replace(path)
+    return path
+
+def iter_archived(archive_dir: Path, **filters) -> Iterator[dict[str, Any]]:
+    """Streams archived records matching filters from oldest to newest."""
+    for path in sorted(Path(archive_dir).glob(ARCHIVE_GLOB)):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if _matches(record, **filters):
+                    yield record
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> set[str]:
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class HistoryIndex:
+    """Inverted token index over raw, positionals and cwd of history entries
+
+    Postings are keyed by (token, entry id), so every search term is a
+    range scan over the primary key and terms match as word prefixes.
+    The index can always be rebuilt from the history, so it is not fsynced.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS postings (
+            token TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            PRIMARY KEY (token, entry_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_entry ON postings(entry_id);
+        CREATE TABLE IF NOT EXISTS docs (
+            entry_id INTEGER PRIMARY KEY,
+            record TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.created = not self.path.exists()
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def entry_tokens(record: dict[str, Any]) -> set[str]:
+        text = " ".join([record.get("raw", ""), *map(str, record.get("positionals", [])),
+                         str(record.get("cwd", ""))])
+        return tokenize(text)
+
+    def add(self, records: Iterable[dict[str, Any]]):
+        docs: list[tuple[int, str]] = []
+        postings: list[tuple[str, int]] = []
+        for r in records:
+            if r.get("id") is None:
+                continue
+            docs.append((r["id"], json.dumps(r, ensure_ascii=False)))
+            postings.extend((token, r["id"]) for token in self.entry_tokens(r))
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO docs (entry_id, record) VALUES (?, ?)", docs)
+            self.conn.executemany("INSERT OR IGNORE INTO postings (token, entry_id) VALUES (?, ?)", postings)
+
+    def remove(self, entry_id: int):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM postings WHERE entry_id = ?", (entry_id,))
+            self.conn.execute("DELETE FROM docs WHERE entry_id = ?", (entry_id,))
+
+    def last_id(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT MAX(entry_id) FROM docs").fetchone()[0] or 0
+
+    def catch_up(self, newest_first: Iterable[dict[str, Any]]) -> int:
+        """Indexes records newer than the newest indexed one.
+
+        Takes the history newest first and stops at the first known id.
+        """
+        last_id = self.last_id()
+        missing = []
+        for record in newest_first:
+            if (record.get("id") or 0) <= last_id:
+                break
+            missing.append(record)
+        self.add(missing)
+        return len(missing)
+
+    def search(self, terms: Iterable[str], limit: int | None = None, **filters) -> list[dict[str, Any]]:
+        """Records containing every term (as a word prefix), oldest first.
+
+        filters are those of HistoryStore.iter_query, limit keeps the
+        newest matches.
+        """
+        tokens = sorted(tokenize(" ".join(terms)))
+        if not tokens:
+            return []
+
+        lookup = "SELECT entry_id FROM postings WHERE token >= ? AND token < ?"
+        params: list[Any] = [bound for t in tokens for bound in (t, t + "\uffff")]
+        sql = (f"SELECT record FROM docs WHERE entry_id IN "
+               f"({' INTERSECT '.join([lookup] * len(tokens))}) ORDER BY entry_id DESC")
+
+        with self.lock:
+            rows = self.conn.execute(sql, params)
+            found = (json.loads(row[0]) for row in rows)
+            matching = (record for record in found if _matches(record, **filters))
+            records = list(islice(matching, None if limit is None else max(limit, 0)))
+        records.reverse()
+        return records
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class HistoryWriter:
+    """Background thread that group-commits history records
+
+    Records are queued by submit and passed to write in batches,
+    a batch is closed after max_batch records or max_delay seconds.
+    """
+
+    def __init__(self, write: Callable[[list[dict[str, Any]]], None],
+                 max_batch: int, max_delay: float):
+        self.write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, record: dict[str, Any]):
+        self.queue.put(record)
+
+    def flush(self):
+        """Blocks until everything submitted so far is written."""
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def stop(self):
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch: list[dict[str, Any]] = []
+            deadline = time.monotonic() + self.max_delay
+            # collect the batch until it is full, times out or is interrupted
+            while isinstance(item, dict):
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    item = False
+                    break
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    item = False
+
+            self._write(batch)
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _write(self, batch: list[dict[str, Any]]):
+        if not batch:
+            return
+        try:
+            self.write(batch)
+        except Exception as e:
+            logger.exception(f"Failed to write {len(batch)} history entries: {e}")
@@ -0,0 +1,319 @@
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from hashlib import sha1
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+import re
+import signal
+import sqlite3
+import sys
+import logging
+
+# the regex parser is private and moved in 3.11, it only narrows the
+# candidates: trigram_query falls back to a full search if it changes
+if sys.version_info >= (3, 11):
+    from re import _parser as sre_parse, _constants as sre_constants # type: ignore[attr-defined]
+else:
+    import sre_parse, sre_constants
+
+from src.config import GREP_INDEX_DIR, GREP_INDEX_MAX_FILE_SIZE, GREP_PARALLEL_MIN_FILES
+from src.utils.grep_utils import is_literal
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_TRIGRAMS = 32 # per alternative, more rarely narrows the candidates further
+
+# (path, mtime_ns, size, sorted trigrams packed 3 bytes each or None when not indexed)
+FileTrigrams = tuple[str, int, int, bytes | None]
+
+
+def index_file_for(root: Path) -> Path:
+    return GREP_INDEX_DIR / f"{sha1(str(root).encode('utf-8')).hexdigest()[:16]}.sqlite"
+
+
+def trigrams(data: bytes) -> set[bytes]:
+    """Trigrams of ASCII-lowercased data
+
+    grep matches never span lines, so trigrams don't either and repeated
+    lines are read once.
+    """
+    grams: set[bytes] = set()
+    for line in set(data.lower().split(b"\n")):
+        grams.update(line[i:i + 3] for i in range(len(line) - 2))
+    return grams
+
+
+def file_trigrams(task: tuple[str, int, int]) -> FileTrigrams:
+    path, mtime_ns, size = task
+    if size > GREP_INDEX_MAX_FILE_SIZE:
+        return path, mtime_ns, size, None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return path, mtime_ns, size, None
+    # packed, so results from worker processes are cheap to send back
+    return path, mtime_ns, size, b"".join(sorted(trigrams(data)))
+
+
+def _ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _required_runs(items: Any) -> list[list[str]]:
+    """Alternatives of literal runs, every match contains all runs of one of them"""
+    runs, cur = [], ""
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            cur += chr(av)
+            continue
+        if op is sre_constants.AT: # anchors match no characters
+            continue
+        runs.append(cur)
+        cur = ""
+        if op is sre_constants.SUBPATTERN:
+            inner = _required_runs(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            inner = _required_runs(av[2])
+        elif op is sre_constants.BRANCH:
+            inner = [alt for branch in av[1] for alt in _required_runs(branch)]
+        else:
+            continue
+        if len(inner) == 1:
+            runs += inner[0]
+        elif len(items) == 1:
+            return inner
+    runs.append(cur)
+    return [runs]
+
+
+def trigram_query(patterns: list[str], ignore_case: bool = False,
+                  fixed: bool = False) -> list[set[bytes]] | None:
+    """Trigrams a file must have to match, as alternatives.
+
+    A file can match only if it has every trigram of at least one
+    alternative. None means the patterns give no usable trigrams.
+    """
+    alternatives: list[list[str]] = []
+    for pattern in patterns:
+        if fixed or is_literal(pattern):
+            alternatives.append([pattern])
+            continue
+        try:
+            parsed = sre_parse.parse(pattern)
+            alternatives += _required_runs(parsed)
+        except (re.error, RecursionError):
+            return None
+        except (AttributeError, TypeError, ValueError, IndexError): # parser internals changed
+            logger.debug(f"Can't read trigrams of {pattern!r}, searching every file", exc_info=True)
+            return None
+        ignore_case = ignore_case or "(?" in pattern # inline flags
+
+    query = []
+    for runs in alternatives:
+        grams = set().union(*(trigrams(run.encode('utf-8')) for run in runs))
+        if ignore_case:
+            # the index folds ASCII only, other bytes may differ in case
+            grams = {g for g in grams if g.isascii()}
+        if not grams:
+            return None
+        query.append(set(sorted(grams)[:MAX_QUERY_TRIGRAMS]))
+    return query or None
+
+
+class _Packed:
+    """Sorted trigrams packed 3 bytes each, as a sequence for bisect"""
+
+    def __init__(self, blob: bytes):
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.blob) // 3
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.blob[3 * i:3 * i + 3]
+
+    def __contains__(self, gram: bytes) -> bool:
+        i = bisect_left(self, gram)
+        return i < len(self) and self[i] == gram
+
+
+class TrigramIndex:
+    """Trigrams of every file under root, kept on disk between greps
+
+    Every file row keeps its own packed trigrams. The posting lists
+    (trigram -> file ids) are built from those rows in one pass, files
+    changed since then form a small delta checked row by row, and once the
+    delta grows past COMPACT_RATIO of the tree the posting lists are
+    rebuilt, still without reading any file again.
+    A file is re-read only when its mtime or size changed. Files too big or
+    unreadable are tracked as not indexed and are always candidates.
+    """
+
+    COMPACT_RATIO = 0.125
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            grams BLOB, -- NULL when not indexed
+            in_postings INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            trigram BLOB PRIMARY KEY,
+            file_ids BLOB NOT NULL -- array('I')
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, root: Path, path: Path | None = None):
+        self.root = Path(root)
+        self.path = Path(path) if path is not None else index_file_for(self.root)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") # can always be rebuilt
+        self.conn.executescript(self.SCHEMA)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('root', ?)",
+                              (str(self.root),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, files: Iterable[Path], jobs: int = 1) -> tuple[int, int]:
+        """Re-indexes changed files and forgets missing ones.
+
+        files is the whole tree, returns (re-indexed, removed) counts.
+        """
+        known = {path: (file_id, mtime_ns, size) for file_id, path, mtime_ns, size
+                 in self.conn.execute("SELECT id, path, mtime_ns, size FROM files")}
+        seen, changed = set(), []
+        for file_path in files:
+            if file_path.parent == self.path.parent:
+                continue # the index itself
+            try:
+                st = file_path.stat()
+            except OSError:
+                continue
+            key = str(file_path)
+            seen.add(key)
+            record = known.get(key)
+            if record is None or record[1:] != (st.st_mtime_ns, st.st_size):
+                changed.append((key, st.st_mtime_ns, st.st_size))
+        gone = [(known[key][0],) for key in known.keys() - seen]
+
+        with self.conn:
+            # ids of removed files stay in posting lists until the next
+            # rebuild, candidates() only trusts ids with in_postings set
+            self.conn.executemany("DELETE FROM files WHERE id = ?", gone)
+            self.conn.executemany(
+                "INSERT INTO files (path, mtime_ns, size, grams) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, "
+                "size = excluded.size, grams = excluded.grams, in_postings = 0",
+                self._extract(changed, jobs))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated', ?)",
+                              (datetime.now().isoformat(timespec='seconds'),))
+
+        if changed or gone:
+            logger.debug(f"Index of {self.root}: {len(changed)} files re-indexed, {len(gone)} removed")
+            self.compact_if_needed()
+        return len(changed), len(gone)
+
+    @staticmethod
+    def _extract(changed: list[tuple[str, int, int]], jobs: int) -> Iterator[FileTrigrams]:
+        if jobs <= 1 or len(changed) < GREP_PARALLEL_MIN_FILES:
+            yield from map(file_trigrams, changed)
+            return
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_ignore_sigint) as pool:
+            yield from pool.map(file_trigrams, changed, chunksize=16)
+
+    def compact_if_needed(self):
+        files, delta = self.conn.execute(
+            "SELECT COUNT(*), COUNT(*) - COALESCE(SUM(in_postings), 0) FROM files "
+            "WHERE grams IS NOT NULL").fetchone()
+        if delta > files * self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rebuilds the posting lists from the trigrams of every file row"""
+        postings: dict[bytes, array] = {}
+        for file_id, grams in self.conn.execute("SELECT id, grams FROM files WHERE grams IS NOT NULL"):
+            for i in range(0, len(grams), 3):
+                gram = grams[i:i + 3]
+                ids = postings.get(gram)
+                if ids is None:
+                    ids = postings[gram] = array('I')
+                ids.append(file_id)
+        with self.conn:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.executemany("INSERT INTO postings (trigram, file_ids) VALUES (?, ?)",
+                                  ((gram, ids.tobytes()) for gram, ids in postings.items()))
+            self.conn.execute("UPDATE files SET in_postings = 1 WHERE grams IS NOT NULL")
+        logger.debug(f"Index of {self.root}: posting lists rebuilt, {len(postings)} trigrams")
+
+    def _posted(self, grams: set[bytes]) -> set[int]:
+        """Ids in the posting lists of every trigram"""
+        result: set[int] | None = None
+        for gram in grams:
+            row = self.conn.execute("SELECT file_ids FROM postings WHERE trigram = ?", (gram,)).fetchone()
+            ids = array('I')
+            if row:
+                ids.frombytes(row[0])
+            result = set(ids) if result is None else result.intersection(ids)
+            if not result:
+                return set()
+        return result or set()
+
+    def candidates(self, query: list[set[bytes]] | None) -> set[str] | None:
+        """Paths that may match the query, None if every file may"""
+        if query is None:
+            return None
+        posted_ids: set[int] = set().union(*(self._posted(grams) for grams in query))
+        result = set()
+        for file_id, path, grams, in_postings in self.conn.execute(
+                "SELECT id, path, grams, in_postings FROM files"):
+            if grams is None:
+                result.add(path)
+            elif in_postings:
+                if file_id in posted_ids:
+                    result.add(path)
+            elif any(all(g in _Packed(grams) for g in alt) for alt in query):
+                result.add(path)
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        files, indexed, delta = self.conn.execute(
+            "SELECT COUNT(*), COUNT(grams), COUNT(grams) - COALESCE(SUM(in_postings), 0) "
+            "FROM files").fetchone()
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        return {
+            "root": meta.get("root", str(self.root)),
+            "files": files,
+            "indexed": indexed,
+            "pending": delta,
+            "trigrams": self.conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0],
+            "size": sum(p.stat().st_size for p in self.path.parent.glob(self.path.name + "*")),
+            "updated": meta.get("updated"),
+        }
+
+
+def drop_index(root: Path) -> bool:
+    """Deletes the index of root with its WAL files, False if there was none"""
+    path = index_file_for(root)
+    files = list(path.parent.glob(path.name + "*")) if path.parent.exists() else []
+    for file in files:
+        file.unlink(missing_ok=True)
+    return bool(files)
@@ -1,15 +1,65 @@
 from src.core.models import ParsedCommand, HistoryEntry
 from src.core.services import Context
-from src.config import HISTORY_FILE
+from src.config import (
+    HISTORY_FILE, LEGACY_HISTORY_FILE, HISTORY_BACKEND, HISTORY_DB_FILE,
+    HISTORY_WINDOW, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL,
+    HISTORY_ARCHIVE_DIR, HISTORY_MAX_ENTRIES, HISTORY_MAX_BYTES, HISTORY_MAX_AGE_DAYS,
+    HISTORY_INDEX_FILE
+)
+from src.utils.history_utils import (
+    HistoryStore, JournalHistoryStore, SqliteHistoryStore, HistoryWriter, HistoryLimits,
+    HistoryIndex, iter_archived
+)
 
-from typing import Any
+from contextlib import closing
+from typing import Any, Callable, Iterator
 from pathlib import Path
 from datetime import datetime
+import shutil
+import re
+import sqlite3
+import atexit
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_stores: dict[tuple[str, Path], HistoryStore] = {}
+_indexes: dict[Path, HistoryIndex] = {}
+_writer: HistoryWriter | None = None
 
 def has_flag(cmd:ParsedCommand, *flags):
     return any(f in cmd.flags for f in flags)
 
+def get_options(cmd:ParsedCommand, *names) -> list[str]:
+    """All values given for any of the option names, in order"""
+    return [v for n in names for v in cmd.options.get(n, [])]
+
+def get_option(cmd:ParsedCommand, *names, default:str | None = None) -> str | None:
+    """The last value given for any of the option names"""
+    values = get_options(cmd, *names)
+    return values[-1] if values else default
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def parse_size(text:str) -> int:
+    """Bytes in a size like 512, 10K, 1.5M or 2GiB, raises ValueError"""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", text, re.IGNORECASE)
+    if m is None:
+        raise ValueError(f"invalid size '{text}'")
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+def format_size(size:int) -> str:
+    """Size the way ls -h shows it: 512, 1.5K, 12M"""
+    value, unit = float(size), ""
+    for unit in SIZE_UNITS:
+        if value < 1024 or unit == "T":
+            break
+        value /= 1024
+    if not unit:
+        return str(size)
+    return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+
 def entry_to_dict(e: HistoryEntry) -> dict[str, Any]:
     return {
         "id": e.id,
@@ -20,6 +70,7 @@ def entry_to_dict(e: HistoryEntry) -> dict[str, Any]:
         "cwd": str(e.cwd),
         "timestamp": e.timestamp,
         "meta": e.meta,
+        "options": e.options,
     }
 
 def dict_to_entry(d: dict[str, Any]) -> HistoryEntry:
@@ -32,58 +83,200 @@ def dict_to_entry(d: dict[str, Any]) -> HistoryEntry:
         cwd = Path(d.get("cwd", ".")),
         timestamp = d.get("timestamp", datetime.now().isoformat()),
         meta = d.get("meta", {}),
+        options = d.get("options", {}),
     )
 
-def get_history():
+def get_history_store() -> HistoryStore:
+    """Returns the store selected by HISTORY_BACKEND, one instance per file."""
+    if HISTORY_BACKEND == "sqlite":
+        key = ("sqlite", Path(HISTORY_DB_FILE))
+    else:
+        key = ("journal", Path(HISTORY_FILE))
+
+    store = _stores.get(key)
+    if store is None:
+        limits = HistoryLimits(Path(HISTORY_ARCHIVE_DIR), HISTORY_MAX_ENTRIES,
+                               HISTORY_MAX_BYTES, HISTORY_MAX_AGE_DAYS)
+        if key[0] == "sqlite":
+            store = SqliteHistoryStore(key[1], limits)
+        else:
+            store = JournalHistoryStore(key[1], limits)
+        _stores[key] = store
+    return store
+
+def get_history_index() -> HistoryIndex:
+    """Search index of the history, opened by the first search.
+
+    Built from the history if it is missing, else caught up with it.
+    """
+    path = Path(HISTORY_INDEX_FILE)
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = HistoryIndex(path)
+        store = get_history_store()
+        if index.created:
+            index.add(iter_archived(HISTORY_ARCHIVE_DIR))
+            index.add(store.iter_entries())
+            logger.info(f"Built history search index {path.name}")
+        else:
+            index.catch_up(store.iter_reversed())
+    return index
+
+def _update_index(method: str, *args):
+    # the index is only a cache of the history, it must never break writes.
+    # Until a search opens it, catch_up picks up the added records later
+    path = Path(HISTORY_INDEX_FILE)
+    index = _indexes.get(path)
     try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        data = []
+        if index is not None:
+            getattr(index, method)(*args)
+        elif method == "remove" and path.exists():
+            # removals can't be caught up with, apply them to the file
+            with closing(HistoryIndex(path)) as unopened:
+                unopened.remove(*args)
+    except sqlite3.Error as e:
+        logger.warning(f"History search index update failed: {e}")
+
+def _write_records(records: list[dict[str, Any]]):
+    get_history_store().append(records)
+    _update_index("add", records)
+
+def start_history_writer():
+    """Moves history writes to a background group-commit thread."""
+    global _writer
+    if _writer is not None:
+        return
+    _writer = HistoryWriter(_write_records, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL)
+    _writer.start()
+    atexit.register(stop_history_writer)
+
+def flush_history():
+    """Waits until all queued history entries are on disk."""
+    if _writer is not None:
+        _writer.flush()
+
+def stop_history_writer():
+    """Flushes the queue and goes back to synchronous writes."""
+    global _writer
+    if _writer is None:
+        return
+    _writer.stop()
+    _writer = None
+    atexit.unregister(stop_history_writer)
+
+def get_history():
+    flush_history()
+    return get_history_store().entries()
 
-    return data
+def iter_history(**filters) -> Iterator[dict[str, Any]]:
+    """Streams history matching filters, see HistoryStore.iter_query"""
+    flush_history()
+    return get_history_store().iter_query(**filters)
+
+def iter_all_history(**filters) -> Iterator[dict[str, Any]]:
+    """Archived history followed by the hot store, streamed."""
+    flush_history()
+    yield from iter_archived(HISTORY_ARCHIVE_DIR, **filters)
+    yield from get_history_store().iter_query(**filters)
+
+def tail_history(n: int, offset: int = 0, **filters) -> list[dict[str, Any]]:
+    """The newest n entries matching filters, see HistoryStore.tail"""
+    flush_history()
+    return get_history_store().tail(n, offset, **filters)
+
+def count_history(**filters) -> int:
+    """Entries matching filters in the hot store, see HistoryStore.count"""
+    flush_history()
+    return get_history_store().count(**filters)
+
+def search_history(terms: list[str], limit: int | None = None, **filters) -> list[dict[str, Any]]:
+    """Entries containing all terms and matching filters, see HistoryIndex.search"""
+    flush_history()
+    return get_history_index().search(terms, limit, **filters)
 
 def append_history(ctx:Context, entry: HistoryEntry, append_to_file:bool = True):
     ctx.history.append(entry)
     if not append_to_file:
         return
 
-    try:
-        with open(HISTORY_FILE, "r+", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-            data.append(entry_to_dict(entry))
-            f.seek(0)
-            json.dump(data, f, indent=4, ensure_ascii=False)
-            f.truncate()
-
-    except FileNotFoundError:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump([entry], f, indent=4, ensure_ascii=False)
+    if _writer is not None:
+        _writer.submit(entry_to_dict(entry))
+    else:
+        _write_records([entry_to_dict(entry)])
 
 def remove_entry_from_file(entry_id: int):
-    try:
-        with open(HISTORY_FILE, "r+", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
+    flush_history() # the tombstone must land after the entry itself
+    get_history_store().remove(entry_id)
+    _update_index("remove", entry_id)
 
-            new_data = [e for e in data if e.get("id") != entry_id]
+def update_history_from_file(ctx:Context):
+    """Loads the newest HISTORY_WINDOW entries, older ones stay on disk"""
+    flush_history()
+    ctx.history = [dict_to_entry(e) for e in get_history_store().tail(HISTORY_WINDOW)]
 
-            if len(new_data) != len(data):
-                f.seek(0)
-                json.dump(new_data, f, indent=4, ensure_ascii=False)
-                f.truncate()
-    except FileNotFoundError:
-        pass
+def last_history_entry(ctx:Context, names,
+                       accept_meta: Callable[[dict[str, Any]], bool] | None = None) -> HistoryEntry | None:
+    """Newest entry with one of the given names (and meta accept_meta agrees with).
 
-def update_history_from_file(ctx:Context):
-    data = get_history()
+    Looks through the loaded ctx.history first, then asks the store,
+    which doesn't load the older entries into memory.
+    """
+    for entry in reversed(ctx.history):
+        if entry.name in names and (accept_meta is None or accept_meta(entry.meta)):
+            return entry
+
+    record = get_history_store().last_of(names, accept_meta)
+    return dict_to_entry(record) if record else None
+
+def forget_history_entry(ctx:Context, entry: HistoryEntry):
+    for i in range(len(ctx.history) - 1, -1, -1):
+        if ctx.history[i].id == entry.id:
+            del ctx.history[i]
+            break
+    remove_entry_from_file(entry.id)
+
+def import_journal_into_store():
+    """Fills a fresh SQLite store from the JSONL journal."""
+    store = get_history_store()
+    if not isinstance(store, SqliteHistoryStore) or not store.is_empty():
+        return
+
+    records = JournalHistoryStore(HISTORY_FILE).entries()
+    if records:
+        store.append(records)
+        logger.info(f"Imported {len(records)} history entries into {Path(HISTORY_DB_FILE).name}")
+
+def migrate_legacy_history():
+    """Converts the old .history.json array into the journal format.
+
+    The legacy file is renamed afterwards, so migration only runs once.
+    """
+    legacy = Path(LEGACY_HISTORY_FILE)
+    if not legacy.exists():
+        return
+
+    try:
+        with open(legacy, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError:
+        data = []
+    if not isinstance(data, list):
+        data = []
 
-    ctx.history = [dict_to_entry(e) for e in data]
+    tmp = Path(HISTORY_FILE).with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for record in data:
+            if isinstance(record, dict):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # entries written after the legacy file go after the migrated ones
+        try:
+            with open(HISTORY_FILE, "r", encoding="utf-8") as current:
+                shutil.copyfileobj(current, f)
+        except FileNotFoundError:
+            pass
+    tmp.replace(HISTORY_FILE)
+    legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+    logger.info(f"Migrated {len(data)} history entries from {legacy.name}")
 
 def cmd_from_history_entry(entry:HistoryEntry):
     return ParsedCommand(
@@ -91,10 +284,14 @@ def cmd_from_history_entry(entry:HistoryEntry):
         flags = entry.flags,
         positionals = entry.positionals,
         raw = entry.raw,
-        meta = entry.meta
+        meta = entry.meta,
+        options = entry.options,
     )
 
 def setup():
+    migrate_legacy_history()
     if not Path(HISTORY_FILE).exists():
         with open(HISTORY_FILE, 'w') as f:
             f.write('')
+    import_journal_into_store()
+    get_history_store().rotate_if_needed() # the age limit may pass between sessions
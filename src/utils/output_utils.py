@@ -0,0 +1,156 @@
+from itertools import chain, islice
+from typing import Any, BinaryIO, Container, Iterable, Sequence, TextIO
+import codecs
+import os
+import re
+import shutil
+import sys
+
+from src.config import OUTPUT_BUFFER_SIZE, OUTPUT_FLUSH, TABLE_WIDTH_SAMPLE
+
+ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+FLUSH_POLICIES = ("size", "line", "interactive")
+COPY_CHUNK = 1024 * 1024 # bytes read at a time by copy_from
+
+
+class OutputSink:
+    """Buffered output of commands, kept on Context as ctx.out
+
+    Commands write here instead of calling print, the dispatcher flushes
+    after each command. The stream defaults to sys.stdout looked up when
+    used, so redirecting sys.stdout redirects the sink too.
+
+    flush - "size": write once buffer_size characters pile up,
+    "line": write on every write() that ends a line,
+    "interactive": "line" on a terminal, "size" otherwise
+    color - keep ANSI colour codes, by default only on a terminal
+    """
+
+    def __init__(self, stream: TextIO | None = None, buffer_size: int = OUTPUT_BUFFER_SIZE,
+                 flush: str = OUTPUT_FLUSH, color: bool | None = None):
+        if flush not in FLUSH_POLICIES:
+            raise ValueError(f"flush must be one of {', '.join(FLUSH_POLICIES)}, got '{flush}'")
+        self._stream = stream
+        self.buffer_size = buffer_size
+        self.flush_policy = flush
+        self._color = color
+        self._parts: list[str] = []
+        self._size = 0
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream if self._stream is not None else sys.stdout
+
+    @property
+    def is_tty(self) -> bool:
+        try:
+            return self.stream.isatty()
+        except (AttributeError, ValueError): # no isatty or closed
+            return False
+
+    @property
+    def color(self) -> bool:
+        return self.is_tty if self._color is None else self._color
+
+    @property
+    def line_buffered(self) -> bool:
+        return self.flush_policy == "line" or (self.flush_policy == "interactive" and self.is_tty)
+
+    def write(self, text: str):
+        if "\x1b" in text and not self.color:
+            text = ANSI_RE.sub("", text)
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size or (text.endswith("\n") and self.line_buffered):
+            self.flush()
+
+    def writeline(self, line: str = ""):
+        self.write(line + "\n")
+
+    def writelines(self, lines: Iterable[str]):
+        """Writes each line followed by a newline, in one write"""
+        lines = list(lines)
+        if lines:
+            self.write("\n".join(lines) + "\n")
+
+    def copy_from(self, src: BinaryIO) -> bytes:
+        """Writes the rest of a binary file in COPY_CHUNK pieces, returns its last byte
+
+        Into a file or pipe the bytes go as they are, with os.sendfile
+        when the system allows it. A terminal (or a stream without a
+        descriptor) gets them decoded as UTF-8 through the buffer.
+        """
+        self.flush()
+        fd = self._fileno()
+        if fd is not None and not self.is_tty:
+            return self._copy_raw(src, fd)
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        last = b""
+        while chunk := src.read(COPY_CHUNK):
+            self.write(decoder.decode(chunk))
+            last = chunk[-1:]
+        self.write(decoder.decode(b"", final=True))
+        return last
+
+    def _fileno(self) -> int | None:
+        try:
+            return self.stream.fileno()
+        except (AttributeError, ValueError, OSError): # io.UnsupportedOperation is both
+            return None
+
+    def _copy_raw(self, src: BinaryIO, fd: int) -> bytes:
+        start = offset = src.tell()
+        try:
+            while sent := os.sendfile(fd, src.fileno(), offset, COPY_CHUNK):
+                offset += sent
+        except (AttributeError, OSError): # no sendfile here, or not into this fd
+            src.seek(offset)
+            buffer = getattr(self.stream, "buffer", None)
+            if buffer is None:
+                raise
+            shutil.copyfileobj(src, buffer, COPY_CHUNK)
+            buffer.flush()
+            offset = src.tell()
+        if offset == start:
+            return b""
+        src.seek(offset - 1)
+        return src.read(1)
+
+    def flush(self):
+        if self._parts:
+            data = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            self.stream.write(data)
+        self.stream.flush()
+
+
+def _cell(value: Any, width: int, right: bool) -> str:
+    text = "" if value is None else str(value)
+    return text.rjust(width) if right or isinstance(value, (int, float)) else text.ljust(width)
+
+
+def write_table(out: OutputSink, rows: Iterable[Sequence[Any]], headers: Sequence[str],
+                sample: int = TABLE_WIDTH_SAMPLE, right: Container[int] = ()):
+    """Writes rows as plain aligned columns while they are produced
+
+    Column widths come from the headers and the first `sample` rows, later
+    rows are written with the same widths (longer values just push the
+    line out), so memory does not grow with the row count. Numbers and
+    the columns listed in right are right-aligned. Headers past the
+    length of the rows are dropped.
+    """
+    rows = iter(rows)
+    head = list(islice(rows, sample))
+    if head:
+        headers = headers[:len(head[0])]
+    widths = [len(h) for h in headers]
+    for row in head:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len("" if value is None else str(value)))
+
+    out.writeline("  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip())
+    for row in chain(head, rows):
+        out.writeline("  ".join(_cell(value, w, i in right)
+                                for i, (value, w) in enumerate(zip(row, widths))).rstrip())
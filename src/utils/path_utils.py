@@ -15,3 +15,25 @@ def resolve_path(path_str: str, ctx:Context) -> Path:
         return path.resolve()
     else:
         return (ctx.cwd / path).expanduser().resolve()
+
+
+def complete_path(text: str, ctx:Context) -> list[str]:
+    """Paths starting with text, for tab completion. Directories end with /.
+
+    Listings come from ctx.dir_cache, so pressing tab again is cheap.
+    """
+    head, sep, prefix = text.rpartition("/")
+    base = head + sep
+    try:
+        entries = list(ctx.dir_cache.listing(resolve_path(base or ".", ctx)))
+    except OSError:
+        return []
+    matches = []
+    for entry in entries:
+        if entry.name.startswith(prefix) and (prefix.startswith(".") or not entry.name.startswith(".")):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            matches.append(base + entry.name + ("/" if is_dir else ""))
+    return sorted(matches)
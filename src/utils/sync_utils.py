@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+import hashlib
+import json
+import os
+import shutil
+import logging
+
+from src.config import COPY_JOBS
+from src.utils.copy_utils import CopyFunc, CopyProgress, CopyTask, copy_file, copy_files
+from src.utils.output_utils import COPY_CHUNK
+from src.utils.walk_utils import walk
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json" # in the trash folder of a run, next to "files"
+
+
+@dataclass
+class SyncPlan:
+    """What a sync changes under dest, paths relative to it
+
+    conflicts - entries of another type than in the source (a folder
+        where the source has a file...), moved away before copying
+    extraneous - entries the source doesn't have, only the top-most ones
+    """
+    mkdirs: list[str] = field(default_factory=list) # parents first
+    new: list[CopyTask] = field(default_factory=list)
+    changed: list[CopyTask] = field(default_factory=list)
+    conflicts: list[str] = field(default_factory=list)
+    extraneous: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def bytes(self) -> int:
+        return sum(size for _, _, size in self.new) + sum(size for _, _, size in self.changed)
+
+    def is_empty(self, delete: bool = False) -> bool:
+        """Whether applying the plan would change nothing in dest"""
+        return not (self.mkdirs or self.new or self.changed or self.conflicts
+                    or (delete and self.extraneous))
+
+
+def _raise(e: OSError):
+    raise e
+
+
+def file_digest(path: str) -> bytes:
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_CHUNK):
+            h.update(chunk)
+    return h.digest()
+
+
+def _same_content(pair: tuple[str, str]) -> bool:
+    return file_digest(pair[0]) == file_digest(pair[1])
+
+
+def _prefix_len(root: Path) -> int:
+    # walk paths are root joined with the rest, slicing is cheaper than relpath
+    return len(os.path.join(root, ""))
+
+
+def list_dest(dst: Path) -> dict[str, os.DirEntry]:
+    """Everything under dst by relative path, symlinks not followed"""
+    if not dst.exists():
+        return {}
+    cut = _prefix_len(dst)
+    return {entry.path[cut:]: entry for entry in walk(dst, dirs=True, on_error=_raise)}
+
+
+def plan_sync(src: Path, dst: Path, checksum: bool = False, jobs: int = COPY_JOBS) -> SyncPlan:
+    """Compares src with dst: files of another size or mtime are changed
+
+    A run over an unchanged tree costs a walk of both sides and one stat
+    per file. checksum - files of the same size are compared by their
+    BLAKE2 hashes instead of the mtime, read in jobs threads.
+    """
+    plan = SyncPlan()
+    existing = list_dest(dst)
+    if not existing and not dst.exists():
+        plan.mkdirs.append(".")
+    same_size: list[tuple[str, str, CopyTask]] = []
+    cut = _prefix_len(src)
+
+    # symlinked folders are copied as folders, like cp -r
+    for entry in walk(src, follow_symlinks=True, dirs=True, on_error=_raise, jobs=jobs):
+        rel = entry.path[cut:]
+        target = os.path.join(dst, rel)
+        old = existing.pop(rel, None)
+        if entry.is_dir():
+            if old is None or not old.is_dir(follow_symlinks=False):
+                if old is not None:
+                    plan.conflicts.append(rel)
+                plan.mkdirs.append(rel)
+            continue
+
+        st = entry.stat()
+        task = (entry.path, target, st.st_size)
+        if old is None:
+            plan.new.append(task)
+        elif not old.is_file(follow_symlinks=False):
+            plan.conflicts.append(rel)
+            plan.new.append(task)
+            if old.is_dir(follow_symlinks=False): # its contents go with it
+                prefix = rel + os.sep
+                for key in [k for k in existing if k.startswith(prefix)]:
+                    del existing[key]
+        else:
+            old_st = old.stat(follow_symlinks=False)
+            if old_st.st_size != st.st_size:
+                plan.changed.append(task)
+            elif checksum:
+                same_size.append((entry.path, target, task))
+            elif old_st.st_mtime_ns != st.st_mtime_ns:
+                plan.changed.append(task)
+            else:
+                plan.unchanged += 1
+
+    if same_size:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            same = pool.map(_same_content, [(a, b) for a, b, _ in same_size])
+            for (_, _, task), is_same in zip(same_size, same):
+                if is_same:
+                    plan.unchanged += 1
+                else:
+                    plan.changed.append(task)
+
+    # what is left exists only in dest, listed parents first
+    gone: set[str] = set()
+    for rel in existing:
+        if os.path.dirname(rel) in gone:
+            gone.add(rel)
+            continue
+        gone.add(rel)
+        plan.extraneous.append(rel)
+    return plan
+
+
+def _move(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(src, dst)
+
+
+def apply_sync(plan: SyncPlan, dst: Path, trash: Path, delete: bool = False,
+               jobs: int = COPY_JOBS, copy: CopyFunc = copy_file,
+               progress: Callable[[CopyProgress], None] | None = None) -> CopyProgress:
+    """Carries out the plan, keeping what it replaces or deletes in trash
+
+    Changed files, conflicts and (with delete) extraneous entries are moved
+    to trash/files first, then folders are created and files copied. What
+    was done is written to trash/manifest.json even if the run fails, for
+    undo_sync.
+    """
+    manifest: dict[str, list[str]] = {"moved": [], "created_dirs": [], "created_files": []}
+    files = trash / "files"
+    trash.mkdir(parents=True)
+    try:
+        moves = plan.conflicts + [os.path.relpath(target, dst) for _, target, _ in plan.changed]
+        if delete:
+            moves += plan.extraneous
+        for rel in moves:
+            _move(dst / rel, files / rel)
+            manifest["moved"].append(rel)
+
+        for rel in plan.mkdirs:
+            (dst / rel).mkdir(parents=rel == ".")
+            manifest["created_dirs"].append(rel)
+
+        tasks = plan.new + plan.changed
+        # listed before copying, an interrupted copy leaves some of them
+        manifest["created_files"] = [os.path.relpath(target, dst) for _, target, _ in tasks]
+        return copy_files(tasks, jobs, copy, progress)
+    finally:
+        (trash / MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+
+
+def undo_sync(dst: Path, trash: Path):
+    """Removes what a sync created and moves back what it moved to trash"""
+    manifest = json.loads((trash / MANIFEST).read_text(encoding="utf-8"))
+    for rel in manifest["created_files"]:
+        (dst / rel).unlink(missing_ok=True)
+    for rel in reversed(manifest["created_dirs"]):
+        try:
+            (dst / rel).rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError as e: # something was added to it since
+            logger.warning(f"Keeping {dst / rel}: {e}")
+    for rel in manifest["moved"]:
+        _move(trash / "files" / rel, dst / rel)
+    shutil.rmtree(trash)
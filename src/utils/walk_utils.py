@@ -0,0 +1,341 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from fnmatch import fnmatch
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+import os
+import re
+import stat
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAT_CHUNK = 64 # entries stat-ed by one pool task, a task per entry costs more than a local stat
+PREFETCH_PER_JOB = 8 # directories read ahead by walk(jobs=N), per thread
+
+# takes an entry, True skips it (and everything under it for a directory)
+IgnoreRule = Callable[[os.DirEntry], bool]
+
+
+def ignore_names(*patterns: str) -> IgnoreRule:
+    """Ignore rule skipping entries whose name matches a glob pattern"""
+    return lambda entry: any(fnmatch(entry.name, p) for p in patterns)
+
+
+class IgnoreFile:
+    """Rules of one .gitignore-style file, relative to its directory
+
+    Supports comments, ! negation, trailing / for directories only,
+    patterns anchored by a / and the * ? [] ** wildcards.
+    """
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        # (regex, negated, directories only), later rules win
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            line = line[1:] if negated else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            regex = self._translate(line.lstrip("/"))
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z", re.DOTALL), negated, dir_only))
+
+    @classmethod
+    def read(cls, base: str, path: str) -> "IgnoreFile":
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                return cls(base, f.readlines())
+        except OSError:
+            return cls(base, [])
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        out, i = [], 0
+        while i < len(pattern):
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            if c == "*":
+                out.append("[^/]*")
+            elif c == "?":
+                out.append("[^/]")
+            elif c == "[" and "]" in pattern[i + 1:]:
+                end = pattern.index("]", i + 2 if pattern[i + 1:i + 2] in ("!", "]") else i + 1)
+                body = pattern[i + 1:end]
+                body = "^" + body[1:] if body.startswith("!") else body
+                out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                i = end + 1
+                continue
+            elif c == "\\" and i + 1 < len(pattern):
+                i += 1
+                out.append(re.escape(pattern[i]))
+            else:
+                out.append(re.escape(c))
+            i += 1
+        return "".join(out)
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """True ignores, False re-includes, None when no rule matches"""
+        # walk builds entry paths by joining onto the scanned directory
+        rel = path[len(self.base):].lstrip(os.sep).replace(os.sep, "/")
+        result = None
+        for regex, negated, dir_only in self.rules:
+            if (is_dir or not dir_only) and regex.match(rel):
+                result = not negated
+        return result
+
+
+def _log_error(e: OSError):
+    logger.debug(f"Skipping unreadable directory: {e}")
+
+
+def scan(path: Path | str, on_error: Callable[[OSError], None] | None = None) -> list[os.DirEntry]:
+    """Entries of one directory, read at once so no descriptor stays open.
+
+    Errors are raised unless on_error takes them.
+    """
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError as e:
+        if on_error is None:
+            raise
+        on_error(e)
+        return []
+
+
+def is_empty_dir(path: Path | str) -> bool:
+    """Stops at the first entry instead of listing the whole directory"""
+    with os.scandir(path) as it:
+        return next(it, None) is None
+
+
+def walk(
+        root: Path | str,
+        max_depth: int | None = None,
+        follow_symlinks: bool = False,
+        ignore: IgnoreRule | None = None,
+        dirs: bool = False,
+        on_error: Callable[[OSError], None] = _log_error,
+        ignore_files: Iterable[str] = (),
+        prune: IgnoreRule | None = None,
+        jobs: int = 1,
+    ) -> Iterator[os.DirEntry]:
+    """Entries under root, depth-first, in the order a recursive walk gives.
+
+    Iterative, so tree depth is not bound by the recursion limit, and the
+    file type comes from the DirEntry, so no extra stat per entry.
+
+    max_depth - children of root are depth 1, deeper entries are skipped
+    follow_symlinks - descend into symlinked directories (each real
+        directory once, so links can't loop); otherwise they are yielded
+        like files
+    ignore - rule for entries to skip, directories are not descended
+    dirs - also yield directories (before their contents)
+    on_error - called with the error of a directory that can't be read
+    ignore_files - names of .gitignore-style files, read in every directory
+        and applied to its subtree, so ignored directories are pruned
+    prune - rule for directories that are yielded but not descended
+    jobs - threads reading directories ahead of the walk, which pays off
+        where each read is a round trip (NFS, FUSE); the order stays the same
+    """
+    ignore_files = tuple(ignore_files)
+    visited: set[tuple[int, int]] = set()
+    if follow_symlinks:
+        st = os.stat(root)
+        visited.add((st.st_dev, st.st_ino))
+
+    pool = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    prefetched: dict[str, Future] = {}
+
+    def read_dir(path: Path | str) -> list[os.DirEntry]:
+        future = prefetched.pop(os.fspath(path), None)
+        if future is None:
+            return scan(path, on_error)
+        try:
+            return future.result()
+        except OSError as e:
+            on_error(e)
+            return []
+
+    def prefetch(entries: list[os.DirEntry], depth: int, rules: tuple[IgnoreFile, ...]):
+        # subdirectories the walk will open, as long as the window has room;
+        # skipped ones are left out so every prefetched read gets used
+        assert pool is not None
+        if max_depth is not None and depth >= max_depth:
+            return
+        for entry in entries:
+            if len(prefetched) >= jobs * PREFETCH_PER_JOB:
+                return
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            if ((ignore is None or not ignore(entry)) and (prune is None or not prune(entry))
+                    and not (rules and _ignored(rules, entry.path, True))):
+                prefetched[entry.path] = pool.submit(scan, entry.path)
+
+    def open_dir(path: Path | str, depth: int, rules: tuple[IgnoreFile, ...]):
+        entries = read_dir(path)
+        if ignore_files:
+            found = {e.name: e.path for e in entries if e.name in ignore_files}
+            rules += tuple(IgnoreFile.read(os.fspath(path), found[name])
+                           for name in ignore_files if name in found)
+        if pool is not None:
+            prefetch(entries, depth, rules)
+        stack.append((iter(entries), depth, rules))
+
+    stack: list[tuple[Iterator[os.DirEntry], int, tuple[IgnoreFile, ...]]] = []
+    try:
+        open_dir(root, 1, ())
+        while stack:
+            entries, depth, rules = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            if ignore is not None and ignore(entry):
+                continue
+
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = False
+            if rules and _ignored(rules, entry.path, is_dir):
+                continue
+            if not is_dir:
+                yield entry
+                continue
+
+            if follow_symlinks and entry.is_symlink():
+                try:
+                    st = entry.stat()
+                except OSError as e:
+                    on_error(e)
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if key in visited:
+                    continue
+                visited.add(key)
+            elif follow_symlinks:
+                st = entry.stat(follow_symlinks=False) # cached by the DirEntry on Windows
+                visited.add((st.st_dev, st.st_ino))
+
+            if dirs:
+                yield entry
+            if prune is not None and prune(entry):
+                continue
+            if max_depth is None or depth < max_depth:
+                open_dir(entry.path, depth + 1, rules)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ignored(rules: tuple[IgnoreFile, ...], path: str, is_dir: bool) -> bool:
+    # deeper files override their parents, like later lines in one file
+    for rule in reversed(rules):
+        result = rule.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+def walk_files(root: Path | str, **kwargs) -> Iterator[Path]:
+    """Paths of everything but directories under root, see walk"""
+    for entry in walk(root, **kwargs):
+        yield Path(entry.path)
+
+
+def entry_stat(entry: os.DirEntry) -> os.stat_result | None:
+    """Stat of the entry's target, of the link itself when it is broken,
+    None when the entry is gone"""
+    try:
+        return entry.stat()
+    except OSError:
+        try:
+            return entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+
+
+def _stat_chunk(chunk: list[os.DirEntry]) -> list[os.stat_result | None]:
+    return [entry_stat(entry) for entry in chunk]
+
+
+def stat_entries(entries: Iterable[os.DirEntry], jobs: int = 1) -> Iterator[tuple[os.DirEntry, os.stat_result | None]]:
+    """Entries paired with entry_stat, in order.
+
+    With jobs > 1 the stat calls run in that many threads, which pays off
+    where a stat is a round trip (NFS, FUSE). Only a few chunks are in
+    flight, so entries keep streaming from a scandir iterator.
+    """
+    if jobs <= 1:
+        for entry in entries:
+            yield entry, entry_stat(entry)
+        return
+
+    entries = iter(entries)
+    pending: deque[tuple[list[os.DirEntry], Future]] = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            while chunk := list(islice(entries, STAT_CHUNK)):
+                pending.append((chunk, pool.submit(_stat_chunk, chunk)))
+                if len(pending) >= jobs * 2:
+                    chunk, future = pending.popleft()
+                    yield from zip(chunk, future.result())
+            while pending:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+class PathEntry:
+    """The parts of os.DirEntry walk callbacks use, for a path that didn't
+    come from scandir (like the root of a walk)"""
+
+    def __init__(self, path: Path | str):
+        self.path = os.fspath(path)
+        self.name = os.path.basename(self.path.rstrip(os.sep)) or self.path
+        self._lstat: os.stat_result | None = None
+
+    def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+        if follow_symlinks:
+            return os.stat(self.path)
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        return self._lstat
+
+    def is_symlink(self) -> bool:
+        return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
@@ -3,18 +3,34 @@ import pytest
 from src.core.services import Context
 from src.core.models import ParsedCommand
 import src.commands.filesystem as filesystem_mod  # for TRASH_DIR monkeypatch
+import src.utils.misc_utils as misc_utils  # for history files monkeypatch
+import src.utils.index_utils as index_utils  # for grep index monkeypatch
+import src.utils.du_utils as du_utils  # for du cache monkeypatch
 
-def pc(name, flags=None, pos=None, raw="", meta=None):
+def pc(name, flags=None, pos=None, raw="", meta=None, options=None):
     cmd = ParsedCommand(
         name=name,
         flags=set() if flags is None else set(flags),
         positionals=[] if pos is None else list(pos),
         raw=raw,
+        options={} if options is None else dict(options),
     )
     if meta:
         cmd.meta.update(meta)
     return cmd
 
+@pytest.fixture(autouse=True)
+def isolated_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(misc_utils, "HISTORY_FILE", tmp_path / ".history.jsonl")
+    monkeypatch.setattr(misc_utils, "LEGACY_HISTORY_FILE", tmp_path / ".history.json")
+    monkeypatch.setattr(misc_utils, "HISTORY_DB_FILE", tmp_path / ".history.sqlite")
+    monkeypatch.setattr(misc_utils, "HISTORY_ARCHIVE_DIR", tmp_path / ".history_archive")
+    monkeypatch.setattr(misc_utils, "HISTORY_INDEX_FILE", tmp_path / ".history_index.sqlite")
+    monkeypatch.setattr(misc_utils, "_stores", {})
+    monkeypatch.setattr(misc_utils, "_indexes", {})
+    monkeypatch.setattr(index_utils, "GREP_INDEX_DIR", tmp_path / ".grep_index")
+    monkeypatch.setattr(du_utils, "DU_CACHE_FILE", tmp_path / ".du_cache.sqlite")
+
 @pytest.fixture
 def ctx(tmp_path, monkeypatch):
     c = Context()
@@ -0,0 +1,96 @@
+import os
+import time
+from src.utils.cache_utils import DirCache
+from .conftest import pc
+
+
+def _age(*paths):
+    # listings of directories changed within the mtime tick are not cached
+    old = time.time_ns() - 10 * 10**9
+    for p in paths:
+        os.utime(p, ns=(old, old))
+
+
+def _names(cache, path, **kwargs):
+    return sorted(e.name for e in cache.listing(path, **kwargs))
+
+
+def test_listing_is_reused_until_mtime_changes(tmp_path):
+    (tmp_path / "a").write_text("")
+    _age(tmp_path)
+    cache = DirCache()
+    assert _names(cache, tmp_path) == ["a"]
+    assert _names(cache, tmp_path) == ["a"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    (tmp_path / "b").write_text("")
+    assert _names(cache, tmp_path) == ["a", "b"]
+    assert cache.misses == 2
+    # changed just now, so read again until it settles
+    assert _names(cache, tmp_path) == ["a", "b"] and cache.misses == 3
+
+
+def test_stat_ttl_and_partial_reads(tmp_path):
+    (tmp_path / "a").write_text("")
+    (tmp_path / "b").write_text("")
+    _age(tmp_path)
+    cache = DirCache(stat_ttl=0)
+    next(cache.listing(tmp_path)) # not read to the end, not stored
+    assert cache.stats()["dirs"] == 0
+    _names(cache, tmp_path)
+    _names(cache, tmp_path)
+    _names(cache, tmp_path, stats=True)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_invalidate_and_eviction(tmp_path):
+    dirs = [tmp_path / name for name in ("x", "x/y", "z")]
+    for d in dirs:
+        d.mkdir()
+        (d / "f").write_text("")
+    _age(*dirs)
+    cache = DirCache(max_entries=4) # x holds f and y
+    for d in dirs:
+        _names(cache, d)
+    assert cache.stats()["dirs"] == 3
+
+    cache.invalidate(tmp_path / "x")
+    assert cache.stats()["dirs"] == 1 and cache.invalidations == 2
+    for d in dirs:
+        _names(cache, d)
+    (tmp_path / "w").mkdir()
+    (tmp_path / "w" / "f").write_text("")
+    _age(tmp_path / "w")
+    _names(cache, tmp_path / "w")
+    assert cache.evictions == 1 and cache.stats()["entries"] == 3
+
+
+def test_commands_invalidate_the_cache(tmp_path, ctx, capsys):
+    from src.commands.debug import Cache
+    from src.commands.filesystem import Rm
+    from src.commands.listing import Ls
+    d = tmp_path / "d"
+    d.mkdir()
+    (d / "a.txt").write_text("")
+    _age(d)
+    Ls().execute(pc("ls", pos=["d"]), ctx)
+    Rm().execute(pc("rm", pos=["d/a.txt"], meta={"non_interactive": True}), ctx)
+    _age(d) # same mtime tick as before the rm
+    Ls().execute(pc("ls", pos=["d"]), ctx)
+    assert capsys.readouterr().out == "a.txt\n"
+
+    Ls().execute(pc("ls", pos=["d"]), ctx)
+    Cache().execute(pc("cache"), ctx)
+    out = capsys.readouterr().out
+    assert "hits: 1, misses: 2" in out and "invalidations: 1" in out
+
+
+def test_complete_path(tmp_path, ctx):
+    from src.utils.path_utils import complete_path
+    (tmp_path / "src" / "core").mkdir(parents=True)
+    (tmp_path / "src" / "config.py").write_text("")
+    (tmp_path / "src" / ".hidden").write_text("")
+    assert complete_path("sr", ctx) == ["src/"]
+    assert complete_path("src/co", ctx) == ["src/config.py", "src/core/"]
+    assert complete_path("src/.h", ctx) == ["src/.hidden"]
+    assert complete_path("nope/x", ctx) == []
@@ -0,0 +1,99 @@
+import errno
+import os
+import pytest
+from src.utils import copy_utils
+from src.utils.copy_utils import copy_file, copy_files, copy_tree
+
+
+def make_tree(root):
+    (root / "x" / "y").mkdir(parents=True)
+    (root / "empty").mkdir()
+    for i in range(70):
+        (root / ("x" if i % 2 else "x/y") / f"{i}.bin").write_bytes(b"a" * i)
+    return root
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_copy_tree_matches_source(tmp_path, jobs):
+    src = make_tree(tmp_path / "src")
+    os.utime(src / "x", (1_000_000, 1_000_000))
+    dst = tmp_path / "dst"
+    state = copy_tree(src, dst, jobs)
+    assert sorted(p.relative_to(dst) for p in dst.rglob("*")) == \
+        sorted(p.relative_to(src) for p in src.rglob("*"))
+    assert (dst / "x" / "69.bin").read_bytes() == b"a" * 69
+    assert (dst / "x").stat().st_mtime == 1_000_000 # set after its files were copied
+    assert (state.files, state.bytes) == (70, sum(range(70)))
+
+
+def test_copy_progress(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_utils, "COPY_PROGRESS_INTERVAL", 0)
+    src = make_tree(tmp_path / "src")
+    seen = []
+    copy_tree(src, tmp_path / "dst", 2, progress=lambda p: seen.append((p.files, p.bytes)))
+    assert seen == sorted(seen)
+    assert len(seen) > 1
+    assert seen[-1] == (70, sum(range(70)))
+
+
+def test_copy_files_raises_first_error(tmp_path):
+    def copy(src, dst):
+        if src.endswith("13"):
+            raise OSError("disk full")
+        open(dst, "w").close()
+
+    files = [(str(tmp_path / f"s{i}"), str(tmp_path / f"d{i}"), 0) for i in range(200)]
+    with pytest.raises(OSError, match="disk full"):
+        copy_files(files, 4, copy)
+
+
+def test_copy_file_falls_back(tmp_path, monkeypatch):
+    src = tmp_path / "a"
+    src.write_bytes(os.urandom(300_000))
+
+    def no_range(*args, **kwargs):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    methods = []
+    monkeypatch.setattr(os, "copy_file_range", no_range, raising=False)
+    methods.append(copy_file(str(src), str(tmp_path / "b"), reflink="never"))
+    monkeypatch.delattr(os, "sendfile", raising=False)
+    methods.append(copy_file(str(src), str(tmp_path / "c"), reflink="never"))
+    assert methods == ["sendfile", "buffered"]
+    assert (tmp_path / "b").read_bytes() == (tmp_path / "c").read_bytes() == src.read_bytes()
+
+
+def test_copy_file_reflink_always(tmp_path):
+    src = tmp_path / "a"
+    src.write_bytes(b"data")
+    try:
+        method = copy_file(str(src), str(tmp_path / "b"), reflink="always")
+    except OSError as e: # the file system can't clone
+        assert e.errno == errno.EOPNOTSUPP
+    else:
+        assert method == "reflink"
+        assert (tmp_path / "b").read_bytes() == b"data"
+
+
+def test_copy_file_keeps_holes(tmp_path):
+    src = tmp_path / "sparse"
+    with open(src, "wb") as f:
+        f.seek(1 << 20)
+        f.write(b"x" * 4096)
+        f.truncate(4 << 20)
+    if not hasattr(os, "SEEK_DATA") or src.stat().st_blocks * 512 >= src.stat().st_size:
+        pytest.skip("no sparse files here")
+    dst = tmp_path / "copy"
+    method = copy_file(str(src), str(dst), reflink="never")
+    assert method.startswith("sparse ")
+    assert dst.stat().st_size == 4 << 20
+    assert dst.stat().st_blocks <= src.stat().st_blocks
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_copy_file_generated_file(tmp_path):
+    # /proc files report size 0, the kernel copies would copy nothing
+    if not os.path.exists("/proc/self/status"):
+        pytest.skip("no procfs")
+    assert copy_file("/proc/self/status", str(tmp_path / "status")) == "buffered"
+    assert (tmp_path / "status").read_text().startswith("Name:")
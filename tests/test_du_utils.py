@@ -0,0 +1,58 @@
+import os
+import time
+import src.utils.du_utils as du_utils
+from src.utils.du_utils import DuCache, read_tree, totals
+
+
+def _make(root):
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "c").mkdir()
+    (root / "a" / "x").write_bytes(b"x" * 10000)
+    os.link(root / "a" / "x", root / "c" / "x")
+    (root / "a" / "b" / "y").write_bytes(b"y" * 5000)
+    old = time.time_ns() - 10 * 10**9 # out of the racy window
+    for d in (root, root / "a", root / "a" / "b", root / "c"):
+        os.utime(d, ns=(old, old))
+
+
+def test_hard_links_count_once_and_threads_agree(tmp_path):
+    _make(tmp_path)
+    root = str(tmp_path)
+    serial = totals(root, read_tree(root))
+    threaded = totals(root, read_tree(root, jobs=3))
+    assert serial == threaded
+    a, c = serial[str(tmp_path / "a")], serial[str(tmp_path / "c")]
+    # a comes first by name and gets the linked file, c only itself
+    assert c == du_utils.usage(os.lstat(tmp_path / "c"))
+    assert a > du_utils.usage(os.lstat(tmp_path / "a" / "x"))
+    assert serial[root] == a + c + du_utils.usage(os.lstat(tmp_path))
+    assert list(serial) == [str(tmp_path / p) for p in ("a/b", "a", "c")] + [root]
+
+
+def test_cache_rereads_only_changed_dirs(tmp_path, monkeypatch):
+    tree = tmp_path / "t"
+    tree.mkdir()
+    _make(tree)
+    root = str(tree)
+    with DuCache() as cache:
+        known = cache.load(root)
+        cache.save(root, read_tree(root, known=known), known)
+
+    scanned = []
+    real_scan = du_utils.scan
+    monkeypatch.setattr(du_utils, "scan", lambda path: scanned.append(path) or real_scan(path))
+    (tree / "a" / "b" / "z").write_bytes(b"z" * 9000)
+    with DuCache() as cache:
+        known = cache.load(root)
+        assert len(known) == 4
+        dirs = read_tree(root, known=known)
+        cache.save(root, dirs, known)
+    assert scanned == [str(tree / "a" / "b")]
+    assert totals(root, dirs) == totals(root, read_tree(root))
+
+    import shutil
+    shutil.rmtree(tree / "c")
+    with DuCache() as cache:
+        known = cache.load(root)
+        cache.save(root, read_tree(root, known=known), known)
+        assert str(tree / "c") not in cache.load(root)
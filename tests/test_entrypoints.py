@@ -13,6 +13,17 @@ def test_main_invokes_shell(monkeypatch):
     assert called["value"] is True
 
 
+def test_main_sync_history_flag(monkeypatch):
+    import src.main as main_mod
+
+    monkeypatch.setattr(main_mod.shell, "start_shell", lambda: None)
+    monkeypatch.setattr(main_mod.shell, "sync_history", False)
+
+    main_mod.main(["--sync-history"])
+
+    assert main_mod.shell.sync_history is True
+
+
 def test_shell_executes_command_and_exits(monkeypatch, capsys, tmp_path):
     inputs = iter(["ls", "exit"])
     monkeypatch.setattr("builtins.input", lambda _: next(inputs))
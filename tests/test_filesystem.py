@@ -1,7 +1,10 @@
+import io
+import os
 import re
 import pytest
-from src.commands.filesystem import Cp, Mv, Rm
+from src.commands.filesystem import Cp, Mv, Rm, Sync
 from src.core.errors import ExecutionError
+from src.utils.output_utils import OutputSink
 from .conftest import pc
 
 def test_cp_file(tmp_path, ctx):
@@ -27,6 +30,72 @@ def test_cp_dir_recursive_ok(tmp_path, ctx):
     Cp().execute(pc("cp", flags={"r"}, pos=[str(src), str(dst)]), ctx)
     assert (dst / "f.txt").read_text() == "1"
 
+def test_cp_dir_parallel_and_undo(tmp_path, ctx):
+    src = tmp_path / "d"
+    (src / "a" / "b").mkdir(parents=True)
+    for i in range(100):
+        (src / ("a" if i % 2 else "a/b") / f"f{i}.txt").write_text(str(i))
+    dst = tmp_path / "d_copy"
+    cmd = pc("cp", flags={"r"}, pos=[str(src), str(dst)], options={"j": ["4"]})
+    Cp().execute(cmd, ctx)
+    assert sorted(p.relative_to(dst) for p in dst.rglob("*")) == \
+        sorted(p.relative_to(src) for p in src.rglob("*"))
+    assert (dst / "a" / "f99.txt").read_text() == "99"
+    assert cmd.meta["dest"] == str(dst)
+    Cp().undo(cmd, ctx)
+    assert not dst.exists()
+
+def test_cp_progress_only_on_terminal(tmp_path, ctx):
+    class Tty(io.StringIO):
+        def isatty(self):
+            return True
+
+    src = tmp_path / "d"
+    src.mkdir()
+    (src / "f.txt").write_text("1")
+    for stream, shown in ((io.StringIO(), False), (Tty(), True)):
+        ctx.out = OutputSink(stream)
+        Cp().execute(pc("cp", flags={"r"}, pos=[str(src), str(tmp_path / f"c{shown}")]), ctx)
+        ctx.out.flush()
+        assert ("\rCopied 1/1 files" in stream.getvalue()) is shown
+
+def test_cp_bad_jobs(tmp_path, ctx):
+    src = tmp_path / "d"
+    src.mkdir()
+    with pytest.raises(ExecutionError):
+        Cp().execute(pc("cp", flags={"r"}, pos=[str(src), str(tmp_path / "c")], options={"j": ["0"]}), ctx)
+
+def test_cp_bad_reflink(tmp_path, ctx):
+    src = tmp_path / "a.txt"
+    src.write_text("x")
+    with pytest.raises(ExecutionError):
+        Cp().execute(pc("cp", pos=[str(src), str(tmp_path / "b.txt")], options={"reflink": ["sometimes"]}), ctx)
+
+def test_sync_dry_run_and_rerun(tmp_path, ctx, capsys):
+    src = tmp_path / "s"
+    (src / "sub").mkdir(parents=True)
+    (src / "sub" / "a.txt").write_text("a")
+    dst = tmp_path / "d"
+    dst.mkdir()
+    (dst / "stale.txt").write_text("x")
+    Sync().execute(pc("sync", flags={"n", "delete"}, pos=[str(src), str(dst)]), ctx)
+    out = capsys.readouterr().out.splitlines()
+    assert "- stale.txt" in out and "+ sub/a.txt".replace("/", os.sep) in out
+    assert out[-1].startswith("1 new, 0 changed, 0 unchanged, 1 to delete")
+    assert sorted(p.name for p in dst.iterdir()) == ["stale.txt"] # nothing done
+
+    Sync().execute(pc("sync", pos=[str(src), str(dst)]), ctx)
+    assert (dst / "sub" / "a.txt").read_text() == "a"
+    assert (dst / "stale.txt").exists() # no --delete
+    capsys.readouterr()
+    Sync().execute(pc("sync", pos=[str(src), str(dst)]), ctx)
+    assert capsys.readouterr().out.startswith("0 new, 0 changed, 1 unchanged, 1 extraneous")
+
+def test_sync_source_must_be_dir(tmp_path, ctx):
+    (tmp_path / "f").write_text("x")
+    with pytest.raises(ExecutionError):
+        Sync().execute(pc("sync", pos=[str(tmp_path / "f"), str(tmp_path / "d")]), ctx)
+
 def test_mv_file_into_dir(tmp_path, ctx):
     f = tmp_path / "x.txt"
     f.write_text("z")
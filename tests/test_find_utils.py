@@ -0,0 +1,25 @@
+import os
+import pytest
+from src.utils.find_utils import all_of, mtime_predicate, name_predicate, size_predicate, type_predicate
+from src.utils.walk_utils import PathEntry
+
+
+def test_predicates(tmp_path):
+    p = tmp_path / "Data.CSV"
+    p.write_bytes(b"x" * 1500)
+    os.utime(p, (0, 10 * 86400))
+    entry = PathEntry(p)
+    now = 13.5 * 86400 # three whole days later
+
+    assert not name_predicate("*.csv")(entry) and name_predicate("*.csv", ignore_case=True)(entry)
+    assert type_predicate("f")(entry) and not type_predicate("d")(entry) and type_predicate("d,f")(entry)
+    assert size_predicate("2K")(entry) and size_predicate("+1k")(entry) and size_predicate("-1501")(entry)
+    assert not size_predicate("-2K")(entry) and size_predicate("1500c")(entry)
+    assert mtime_predicate("3", now)(entry) and mtime_predicate("+2", now)(entry)
+    assert not mtime_predicate("-3", now)(entry)
+    assert all_of([])(entry) and not all_of([type_predicate("f"), type_predicate("l")])(entry)
+    for bad in ("", "+", "1X"):
+        with pytest.raises(ValueError):
+            size_predicate(bad)
+    with pytest.raises(ValueError):
+        mtime_predicate("soon")
@@ -0,0 +1,166 @@
+import re
+
+import pytest
+
+import src.utils.grep_utils as grep_utils
+from src.utils.grep_utils import (AhoCorasickMatcher, GrepOptions, LiteralMatcher, RegexMatcher,
+                                  build_matcher, scan_buffer, scan_file)
+from .conftest import strip_ansi
+
+
+def _scan(buf, matcher):
+    # files are decoded for matchers with str patterns, see scan_file
+    return scan_buffer(buf if matcher.is_bytes else buf.decode("utf-8"), matcher)
+
+
+def _lines(buf, pattern, ignore_case=False):
+    return [m[0] for m in _scan(buf, RegexMatcher(pattern, ignore_case))]
+
+
+def grep_lines(path, matcher, display_path, **kwargs):
+    return scan_file(path, GrepOptions(matcher, **kwargs), display_path)[0]
+
+
+def test_scan_buffer_line_numbers():
+    buf = b"alpha\nbeta\ngamma\nbeta beta\n"
+    assert _lines(buf, "beta") == [2, 4]
+    assert _lines(buf, "^g") == [3]
+    assert _lines(buf, "a$") == [1, 2, 3, 4]
+
+
+def test_scan_buffer_match_does_not_cross_lines():
+    buf = b"foo\nbar\nfoo bar\n"
+    assert _lines(buf, r"foo\s+bar") == [3]
+
+
+def test_scan_buffer_empty_matches_every_line():
+    assert _lines(b"a\n\nb\n", "x*") == [1, 2, 3]
+    assert _lines(b"", "x*") == []
+
+
+def test_spans_are_reused_for_highlighting(tmp_path):
+    p = tmp_path / "h.txt"
+    p.write_text("one two one\n")
+    out = grep_lines(p, build_matcher(["one"]), "h.txt")
+    assert out[0].count(grep_utils.RED) == 2
+    assert strip_ansi(out[0]) == "h.txt:1:one two one"
+
+
+def test_large_files_are_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.setattr(grep_utils, "MMAP_MIN_SIZE", 1)
+    p = tmp_path / "big.txt"
+    p.write_text("x\n" * 1000 + "needle\n")
+    assert [strip_ansi(line) for line in grep_lines(p, build_matcher(["needle"]), "big.txt")] == ["big.txt:1001:needle"]
+
+
+def test_non_ascii_ignore_case_uses_str_pattern(tmp_path):
+    p = tmp_path / "ru.txt"
+    p.write_text("Привет\nмир\n", encoding="utf-8")
+    matcher = build_matcher(["привет"], ignore_case=True)
+    assert not matcher.is_bytes
+    assert [strip_ansi(line) for line in grep_lines(p, matcher, "ru.txt")] == ["ru.txt:1:Привет"]
+
+
+NON_ASCII_TEXT = ("привет мир\nhello world\nKelvin \u212a and long \u017f\n\u0130stanbul \u0131i\n"
+                  "naïve café 42\ntab\there\n\x80ctrl\u00a0nbsp\nплохо\n")
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+@pytest.mark.parametrize("pattern", [
+    r"\w+\s\w+", r"при\w+", "a.b", "caf.", "[^a-z ]", r"\bcafé\b", r"\d+", r"\S+$", r"\x80", r"\200",
+    "k", "s", "i", "[a-z]+", "(?i)K", "hello|world", "ll+", "é", "[é]",
+])
+def test_matches_agree_with_str_regex_on_non_ascii(pattern, ignore_case):
+    # whatever buffer the matcher picks, lines match as re.search on decoded lines
+    flags = re.IGNORECASE if ignore_case else 0
+    expected = [n for n, line in enumerate(NON_ASCII_TEXT.split("\n")[:-1], start=1)
+                if re.search(pattern, line, flags)]
+    assert _lines(NON_ASCII_TEXT.encode("utf-8"), pattern, ignore_case) == expected
+
+
+def test_word_class_on_cyrillic_ignores_case_flag(tmp_path):
+    p = tmp_path / "f2.txt"
+    p.write_text("привет\nмир\nприход\n", encoding="utf-8")
+    plain = grep_lines(p, build_matcher([r"при\w+"]), "f2.txt")
+    folded = grep_lines(p, build_matcher([r"при\w+"], ignore_case=True), "f2.txt")
+    assert [strip_ansi(line) for line in plain] == [strip_ansi(line) for line in folded] \
+        == ["f2.txt:1:привет", "f2.txt:3:приход"]
+
+
+def test_str_patterns_read_files_in_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(grep_utils, "BINARY_SNIFF_SIZE", 4)
+    monkeypatch.setattr(grep_utils, "STREAM_BLOCK", 16)
+    p = tmp_path / "log.txt"
+    p.write_text("ok\n" * 50 + "ERROR: длинный timeout\nok\nERROR timeout\n", encoding="utf-8")
+    reads = []
+    real_open = type(p).open
+
+    def spy_open(self, *args, **kwargs):
+        f = real_open(self, *args, **kwargs)
+        read = f.read
+        f.read = lambda n=-1: reads.append(n) or read(n)
+        return f
+    monkeypatch.setattr(type(p), "open", spy_open)
+    matcher = build_matcher(["ERROR.*timeout"], ignore_case=True)
+    assert not matcher.is_bytes
+    assert [strip_ansi(line) for line in grep_lines(p, matcher, "log.txt")] == \
+        ["log.txt:51:ERROR: длинный timeout", "log.txt:53:ERROR timeout"]
+    assert -1 not in reads # never the whole file at once
+
+
+def test_build_matcher_picks_fast_paths():
+    assert isinstance(build_matcher(["needle"]), LiteralMatcher)
+    assert isinstance(build_matcher(["a.b"], fixed=True), LiteralMatcher)
+    assert isinstance(build_matcher(["ne+dle"]), RegexMatcher)
+    assert isinstance(build_matcher(["one", "two"]), RegexMatcher)
+    assert isinstance(build_matcher([f"w{i}" for i in range(20)]), AhoCorasickMatcher)
+    assert build_matcher(["ne+dle"]).is_bytes
+    assert not build_matcher([r"ne\w+"]).is_bytes
+
+
+def test_fixed_strings_are_not_regexes():
+    buf = b"a.b\naxb\n"
+    assert [m[0] for m in _scan(buf, build_matcher(["a.b"]))] == [1, 2]
+    assert [m[0] for m in _scan(buf, build_matcher(["a.b"], fixed=True))] == [1]
+
+
+def test_aho_corasick_agrees_with_regex():
+    words = ["he", "she", "his", "hers", "ushers", "x"] + [f"w{i}" for i in range(20)]
+    buf = b"ushers\nno match\nthis is his\nw13 and w1\nHERS\n"
+    fast = list(scan_buffer(buf, AhoCorasickMatcher(words)))
+    slow = list(scan_buffer(buf, RegexMatcher("|".join(sorted(words, key=len, reverse=True)))))
+    assert [m[0] for m in fast] == [m[0] for m in slow] == [1, 3, 4]
+    assert [m[0] for m in scan_buffer(buf, AhoCorasickMatcher(words, ignore_case=True))] == [1, 3, 4, 5]
+    # highlighting keeps non-overlapping matches
+    assert fast[0][3] == [(0, 6)]
+
+
+def test_grep_stream_matches_across_blocks(monkeypatch):
+    import io
+    monkeypatch.setattr(grep_utils, "STREAM_BLOCK", 7)
+    data = b"short\na much longer needle line\nx\nneedle\nlast needle"
+    out, matched = grep_utils.grep_stream(io.BytesIO(data), GrepOptions(build_matcher(["needle"])), "s")
+    assert [strip_ansi(line) for line in out] == ["s:2:a much longer needle line", "s:4:needle", "s:5:last needle"]
+    assert matched
+    skip = GrepOptions(build_matcher(["needle"]), skip_binary=True)
+    assert grep_utils.grep_stream(io.BytesIO(b"\x00bin needle"), skip, "b") == ([], False)
+
+
+def test_modes_stop_reading_early(monkeypatch):
+    import io
+    monkeypatch.setattr(grep_utils, "STREAM_BLOCK", 8)
+    data = b"needle\n" + b"padding\n" * 100 + b"needle\n"
+
+    def run(**kwargs):
+        stream = io.BytesIO(data)
+        lines, matched = grep_utils.grep_stream(stream, GrepOptions(build_matcher(["needle"]), **kwargs), "s")
+        return [strip_ansi(line) for line in lines], matched, stream.tell()
+
+    assert run(mode=grep_utils.COUNT) == (["s:2"], True, len(data))
+    assert run(mode=grep_utils.COUNT, max_count=1)[:2] == (["s:1"], True)
+    for mode, lines in ((grep_utils.FILES_WITH_MATCHES, ["s"]), (grep_utils.FILES_WITHOUT_MATCH, []),
+                        (grep_utils.QUIET, []), (grep_utils.LINES, None)):
+        kwargs = {"max_count": 1} if lines is None else {}
+        out, matched, read = run(mode=mode, **kwargs)
+        assert matched and read < len(data) # the rest of the stream is never read
+        assert out == (lines if lines is not None else ["s:1:needle"])
@@ -1,7 +1,10 @@
 from datetime import datetime
+import pytest
 from src.commands.history import History, Undo
-from src.commands.filesystem import Cp, Rm, Mv
+from src.commands.filesystem import Cp, Rm, Mv, Sync
 from src.core.models import HistoryEntry
+from src.core.errors import ExecutionError
+from src.utils.misc_utils import get_history_store
 from .conftest import pc, strip_ansi
 
 def _mk_entry(cmd, ctx, meta=None, eid=1):
@@ -21,11 +24,68 @@ def _mk_entry(cmd, ctx, meta=None, eid=1):
 def test_history_display(ctx, capsys, monkeypatch):
     now = datetime.now().isoformat()
     import src.commands.history as history_mod
-    monkeypatch.setattr(history_mod, "get_history", lambda: [{"raw": "ls -l", "timestamp": now}], raising=False)
+    monkeypatch.setattr(history_mod, "iter_history", lambda **f: [{"raw": "ls -l", "timestamp": now}], raising=False)
     History().execute(pc("history"), ctx)
     out = strip_ansi(capsys.readouterr().out)
     assert "1:" in out and "ls -l" in out
 
+def _store_history(tmp_path, *rows):
+    get_history_store().append([
+        {"id": i, "raw": raw, "name": raw.split()[0], "flags": [], "positionals": [],
+         "cwd": str(tmp_path / cwd), "timestamp": ts, "meta": {}}
+        for i, (raw, cwd, ts) in enumerate(rows, start=1)
+    ])
+
+def _shown(capsys):
+    return [line.split(":", 3)[-1] for line in strip_ansi(capsys.readouterr().out).splitlines()]
+
+def test_history_tail_and_pages(tmp_path, ctx, capsys):
+    now = datetime.now().isoformat()
+    _store_history(tmp_path, *[(f"ls {i}", "", now) for i in range(1, 8)])
+
+    History().execute(pc("history", options={"n": ["3"]}), ctx)
+    assert _shown(capsys) == ["ls 5", "ls 6", "ls 7"]
+
+    History().execute(pc("history", options={"n": ["3"], "page": ["3"]}), ctx)
+    assert _shown(capsys) == ["ls 1"]
+
+def _numbers(capsys):
+    return [int(line.split(":", 1)[0]) for line in strip_ansi(capsys.readouterr().out).splitlines()]
+
+@pytest.mark.parametrize("flags", [set(), {"a"}])
+def test_history_pages_keep_row_numbers(tmp_path, ctx, capsys, flags):
+    now = datetime.now().isoformat()
+    _store_history(tmp_path, *[(f"ls {i}", "", now) for i in range(1, 8)])
+
+    History().execute(pc("history", flags=flags), ctx)
+    everything = _numbers(capsys)
+    History().execute(pc("history", flags=flags, options={"n": ["3"], "page": ["2"]}), ctx)
+    assert _numbers(capsys) == everything[1:4] == [2, 3, 4]
+    History().execute(pc("history", flags=flags, options={"n": ["2"], "cmd": ["ls"]}), ctx)
+    assert _numbers(capsys) == [6, 7]
+
+def test_history_filters(tmp_path, ctx, capsys):
+    (tmp_path / "sub").mkdir()
+    _store_history(
+        tmp_path,
+        ("ls", "", datetime(2026, 1, 1, 10).isoformat()),
+        ("cp a b", "sub", datetime(2026, 1, 2, 10).isoformat()),
+        ("cp c d", "", datetime(2026, 1, 3, 10).isoformat()),
+    )
+
+    History().execute(pc("history", options={"cmd": ["cp"]}), ctx)
+    assert _shown(capsys) == ["cp a b", "cp c d"]
+
+    History().execute(pc("history", options={"cwd": ["sub"]}), ctx)
+    assert _shown(capsys) == ["cp a b"]
+
+    History().execute(pc("history", options={"since": ["2026-01-02"], "until": ["2026-01-02"]}), ctx)
+    assert _shown(capsys) == ["cp a b"]
+
+def test_history_bad_date(ctx):
+    with pytest.raises(ExecutionError):
+        History().execute(pc("history", options={"since": ["yesterday"]}), ctx)
+
 def test_undo_cp(tmp_path, ctx):
     src = tmp_path / "s.txt"
     dst = tmp_path / "d.txt"
@@ -59,3 +119,80 @@ def test_undo_mv(tmp_path, ctx):
     ctx.history.append(_mk_entry(cmd, ctx, eid=303))
     Undo().execute(pc("undo"), ctx)
     assert f.exists() and not moved.exists()
+
+def test_undo_sync(tmp_path, ctx):
+    src = tmp_path / "s"
+    dst = tmp_path / "d"
+    src.mkdir()
+    dst.mkdir()
+    (src / "f.txt").write_text("new")
+    (dst / "f.txt").write_text("old content")
+    (dst / "extra.txt").write_text("extra")
+    cmd = pc("sync", flags={"delete"}, pos=[str(src), str(dst)])
+    Sync().execute(cmd, ctx)
+    assert sorted(p.name for p in dst.iterdir()) == ["f.txt"]
+    ctx.history.append(_mk_entry(cmd, ctx, eid=303))
+    Undo().execute(pc("undo"), ctx)
+    assert (dst / "f.txt").read_text() == "old content"
+    assert (dst / "extra.txt").read_text() == "extra"
+    assert not any(ctx.trash_dir.iterdir())
+
+def test_undo_skips_syncs_that_changed_nothing(tmp_path, ctx):
+    f = tmp_path / "s.txt"
+    f.write_text("x")
+    copied = tmp_path / "c.txt"
+    cp = pc("cp", pos=[str(f), str(copied)])
+    Cp().execute(cp, ctx)
+    ctx.history.append(_mk_entry(cp, ctx, eid=401))
+
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    (src / "a.txt").write_text("a")
+    dry = pc("sync", flags={"n"}, pos=[str(src), str(dst)])
+    Sync().execute(dry, ctx)
+    ctx.history.append(_mk_entry(dry, ctx, eid=402))
+    dst.mkdir()
+    (dst / "a.txt").write_text("a")
+    empty = pc("sync", flags={"c"}, pos=[str(src), str(dst)])
+    Sync().execute(empty, ctx)
+    ctx.history.append(_mk_entry(empty, ctx, eid=403))
+    assert not any(ctx.trash_dir.iterdir()) # nothing done, no trash folder
+
+    Undo().execute(pc("undo"), ctx)
+    assert not copied.exists() # the cp before them was undone
+    assert [e.id for e in ctx.history] == [402, 403]
+
+def test_history_search(tmp_path, ctx, capsys):
+    from src.core.dispatcher import Dispatcher
+    (tmp_path / "data").mkdir()
+    (tmp_path / "report.txt").write_text("r")
+    Dispatcher.dispatch_command(pc("cp", pos=["report.txt", "data/report.txt"], raw="cp report.txt data/report.txt"), ctx)
+    Dispatcher.dispatch_command(pc("ls", pos=["data"], raw="ls data"), ctx)
+    capsys.readouterr()
+
+    History().execute(pc("history", pos=["search", "cp", "dat"]), ctx)
+    assert _shown(capsys) == ["cp report.txt data/report.txt"]
+
+    Undo().execute(pc("undo"), ctx)
+    History().execute(pc("history", pos=["search", "report"]), ctx)
+    assert _shown(capsys) == []
+
+def test_history_search_filters(ctx, capsys):
+    old = datetime(2024, 1, 1).isoformat()
+    get_history_store().append([
+        {"id": 1, "raw": "cp a b", "name": "cp", "cwd": "/x", "timestamp": old},
+        {"id": 2, "raw": "ls b", "name": "ls", "cwd": "/x", "timestamp": old},
+        {"id": 3, "raw": "cp b c", "name": "cp", "cwd": "/y", "timestamp": datetime.now().isoformat()},
+    ])
+    History().execute(pc("history", pos=["search", "b"], options={"cmd": ["cp"]}), ctx)
+    assert _shown(capsys) == ["cp a b", "cp b c"]
+    History().execute(pc("history", pos=["search", "b"], options={"cmd": ["cp"], "until": ["2024-06-01"]}), ctx)
+    assert _shown(capsys) == ["cp a b"]
+    History().execute(pc("history", pos=["search", "b"], options={"cwd": ["/x"], "n": ["1"]}), ctx)
+    assert _shown(capsys) == ["ls b"]
+    with pytest.raises(ExecutionError):
+        History().execute(pc("history", pos=["search", "b"], options={"page": ["2"]}), ctx)
+
+def test_history_unknown_subcommand(ctx):
+    with pytest.raises(ExecutionError):
+        History().execute(pc("history", pos=["grep", "x"]), ctx)
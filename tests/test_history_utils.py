@@ -0,0 +1,252 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.utils.misc_utils as misc_utils
+from src.utils.history_utils import JournalHistoryStore, SqliteHistoryStore
+
+
+def _record(eid, name="ls", cwd="/tmp", timestamp=None):
+    timestamp = timestamp or datetime.now().isoformat()
+    return {"id": eid, "raw": name, "name": name, "flags": [], "positionals": [],
+            "cwd": cwd, "timestamp": timestamp, "meta": {}}
+
+
+@pytest.fixture(params=["journal", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        s = SqliteHistoryStore(tmp_path / "h.sqlite")
+        yield s
+        s.close()
+    else:
+        yield JournalHistoryStore(tmp_path / "h.jsonl")
+
+
+def test_store_append_remove(store):
+    store.append([_record(1), _record(2, "cp"), _record(3)])
+    store.remove(2)
+    assert [r["id"] for r in store.entries()] == [1, 3]
+
+
+def test_store_last_of(store):
+    store.append([_record(1, "cp"), _record(2, "mv"), _record(3, "ls")])
+    assert store.last_of({"cp", "mv", "rm"})["id"] == 2
+    assert store.last_of({"rm"}) is None
+    assert store.last_of({"cp", "mv"}, lambda meta: meta.get("undoable", True)) is not None
+
+
+def test_store_query_filters(store):
+    store.append([
+        _record(1, "ls", "/a", "2025-01-01T10:00:00"),
+        _record(2, "cp", "/a", "2025-01-02T10:00:00"),
+        _record(3, "cp", "/b", "2025-01-03T10:00:00"),
+        _record(4, "cp", "/a", "2025-01-04T10:00:00"),
+    ])
+    assert [r["id"] for r in store.iter_query(name="cp", cwd="/a")] == [2, 4]
+    assert [r["id"] for r in store.iter_query(since="2025-01-02", until="2025-01-03T23:59")] == [2, 3]
+    assert [r["id"] for r in store.tail(2, name="cp")] == [3, 4]
+    assert [r["id"] for r in store.tail(2, offset=1)] == [2, 3]
+
+
+def test_sqlite_backend_imports_journal(monkeypatch, tmp_path):
+    journal = tmp_path / ".history.jsonl"
+    journal.write_text(json.dumps(_record(5, "rm")) + "\n")
+    monkeypatch.setattr(misc_utils, "HISTORY_BACKEND", "sqlite")
+
+    misc_utils.setup()
+
+    assert [r["id"] for r in misc_utils.get_history()] == [5]
+    assert isinstance(misc_utils.get_history_store(), SqliteHistoryStore)
+
+
+def test_store_iter_reversed(store):
+    store.append([_record(i) for i in range(1, 6)])
+    store.remove(4)
+    assert [r["id"] for r in store.iter_reversed()] == [5, 3, 2, 1]
+
+
+def test_journal_iter_reversed_crosses_blocks(tmp_path, monkeypatch):
+    import src.utils.history_utils as history_utils
+    store = JournalHistoryStore(tmp_path / "h.jsonl")
+    store.append([_record(i) for i in range(1, 200)])
+    lines = list(history_utils._read_lines_reversed(store.path, block_size=7))
+    assert [json.loads(line)["id"] for line in lines] == list(range(199, 0, -1))
+
+
+def test_history_window_loads_tail_only(monkeypatch, ctx):
+    monkeypatch.setattr(misc_utils, "HISTORY_WINDOW", 3)
+    misc_utils.get_history_store().append([_record(i) for i in range(1, 11)])
+
+    misc_utils.update_history_from_file(ctx)
+
+    assert [e.id for e in ctx.history] == [8, 9, 10]
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite"])
+def test_undo_finds_older_entries_in_store(monkeypatch, ctx, tmp_path, backend):
+    from src.commands.history import Undo
+    from .conftest import pc
+
+    monkeypatch.setattr(misc_utils, "HISTORY_BACKEND", backend)
+    monkeypatch.setattr(misc_utils, "HISTORY_WINDOW", 2)
+    dst = tmp_path / "copy.txt"
+    dst.write_text("x")
+    record = _record(1, "cp", str(tmp_path))
+    record["positionals"] = ["src.txt", str(dst)]
+    record["meta"] = {"dest": str(dst)}
+    misc_utils.get_history_store().append([record] + [_record(i) for i in range(2, 8)])
+
+    misc_utils.update_history_from_file(ctx)
+    assert len(ctx.history) == 2
+
+    Undo().execute(pc("undo"), ctx)
+
+    assert not dst.exists()
+    assert 1 not in [r["id"] for r in misc_utils.get_history()]
+    assert [e.id for e in ctx.history] == [6, 7] # older entries weren't loaded
+
+
+def test_history_writer_batches_records(tmp_path):
+    from src.utils.history_utils import HistoryWriter
+
+    class CountingStore(JournalHistoryStore):
+        batches = []
+
+        def append(self, records):
+            self.batches.append(len(records))
+            super().append(records)
+
+    store = CountingStore(tmp_path / "h.jsonl")
+    writer = HistoryWriter(store.append, max_batch=4, max_delay=60)
+    writer.start()
+    for i in range(10):
+        writer.submit(_record(i))
+    writer.flush()
+    assert [r["id"] for r in store.entries()] == list(range(10))
+    writer.stop()
+
+    assert sum(store.batches) == 10 and max(store.batches) <= 4
+    assert not writer.thread.is_alive()
+
+
+def test_background_writes_are_flushed_before_undo(ctx, tmp_path):
+    from src.commands.history import Undo
+    from src.core.dispatcher import Dispatcher
+    from .conftest import pc
+
+    misc_utils.start_history_writer()
+    try:
+        src_file = tmp_path / "a.txt"
+        src_file.write_text("a")
+        Dispatcher.dispatch_command(pc("cp", pos=[str(src_file), "b.txt"], raw="cp a.txt b.txt"), ctx)
+        Undo().execute(pc("undo"), ctx)
+        assert not (tmp_path / "b.txt").exists()
+        assert misc_utils.get_history() == []
+    finally:
+        misc_utils.stop_history_writer()
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite"])
+def test_rotation_archives_over_entry_limit(monkeypatch, backend, tmp_path):
+    monkeypatch.setattr(misc_utils, "HISTORY_BACKEND", backend)
+    monkeypatch.setattr(misc_utils, "HISTORY_MAX_ENTRIES", 10)
+    store = misc_utils.get_history_store()
+
+    store.append([_record(i) for i in range(1, 11)])
+    assert len(misc_utils.get_history()) == 10
+
+    store.append([_record(11)])
+
+    assert [r["id"] for r in misc_utils.get_history()] == list(range(7, 12))
+    archives = list((tmp_path / ".history_archive").glob("history-*.jsonl.gz"))
+    assert len(archives) == 1
+    with gzip.open(archives[0], "rt") as f:
+        assert [json.loads(line)["id"] for line in f] == list(range(1, 7))
+    assert [r["id"] for r in misc_utils.iter_all_history()] == list(range(1, 12))
+
+
+def test_rotation_by_age_compacts_tombstones(monkeypatch, tmp_path):
+    old = (datetime.now() - timedelta(days=30)).isoformat()
+    monkeypatch.setattr(misc_utils, "HISTORY_MAX_AGE_DAYS", 7)
+    journal = tmp_path / ".history.jsonl"
+    journal.write_text("".join(json.dumps(r) + "\n" for r in [
+        _record(1, timestamp=old), _record(2), {"op": "remove", "id": 2}, _record(3),
+    ]))
+
+    misc_utils.setup()
+
+    assert [json.loads(line)["id"] for line in journal.read_text().splitlines()] == [3]
+    assert [r["id"] for r in misc_utils.iter_all_history()] == [1, 3]
+
+
+def test_journal_stats_skip_tombstones(monkeypatch, tmp_path):
+    old = (datetime.now() - timedelta(days=30)).isoformat()
+    monkeypatch.setattr(misc_utils, "HISTORY_MAX_AGE_DAYS", 7)
+    journal = tmp_path / ".history.jsonl"
+    journal.write_text("".join(json.dumps(r) + "\n" for r in [
+        {"op": "remove", "id": 9}, _record(1), {"op": "remove", "id": 1}, _record(2, timestamp=old), _record(3),
+    ]))
+    store = JournalHistoryStore(journal)
+    records, _, oldest = store.stats()
+    assert (records, oldest) == (2, old) # 9 was rotated away before, only its tombstone is left
+
+    misc_utils.setup()
+
+    assert [json.loads(line)["id"] for line in journal.read_text().splitlines()] == [3]
+
+
+def test_history_all_streams_archive(monkeypatch, ctx, capsys):
+    from src.commands.history import History
+    from src.utils.history_utils import write_archive
+    from .conftest import pc, strip_ansi
+
+    write_archive(misc_utils.HISTORY_ARCHIVE_DIR, [_record(1, "cd")])
+    misc_utils.get_history_store().append([_record(2, "ls")])
+
+    History().execute(pc("history"), ctx)
+    assert "cd" not in strip_ansi(capsys.readouterr().out)
+
+    History().execute(pc("history", flags={"all"}), ctx)
+    out = strip_ansi(capsys.readouterr().out)
+    assert "1:" in out and "cd" in out and "2:" in out and "ls" in out
+
+
+def test_index_rebuilds_when_missing(tmp_path):
+    from src.utils.history_utils import write_archive
+
+    write_archive(misc_utils.HISTORY_ARCHIVE_DIR, [_record(1, "cp", "/data/old")])
+    misc_utils.get_history_store().append([_record(2, "cp", "/data/new"), _record(3, "ls", "/data")])
+
+    assert [r["id"] for r in misc_utils.search_history(["cp", "data"])] == [1, 2]
+    assert [r["id"] for r in misc_utils.search_history(["data"], limit=1)] == [3]
+
+
+def test_index_is_built_by_the_first_search(tmp_path):
+    misc_utils.get_history_store().append([_record(1, "cp"), _record(2, "cp", "/data")])
+    misc_utils.setup()
+    assert not misc_utils.HISTORY_INDEX_FILE.exists() # startup stays O(window)
+
+    assert [r["id"] for r in misc_utils.search_history(["cp"], cwd="/data")] == [2]
+    assert misc_utils.HISTORY_INDEX_FILE.exists()
+
+
+def test_removal_reaches_an_unopened_index(tmp_path):
+    misc_utils.get_history_store().append([_record(1, "cp"), _record(2, "cp")])
+    assert len(misc_utils.search_history(["cp"])) == 2
+    misc_utils._indexes.clear() # a later session, no search yet
+
+    misc_utils.remove_entry_from_file(2)
+
+    assert [r["id"] for r in misc_utils.search_history(["cp"])] == [1]
+
+
+def test_index_catches_up_with_store(tmp_path):
+    misc_utils.get_history_store().append([_record(1, "cp")])
+    assert len(misc_utils.search_history(["cp"])) == 1
+
+    misc_utils.get_history_store().append([_record(2, "cp")]) # written behind the index
+    misc_utils._indexes.clear()
+
+    assert [r["id"] for r in misc_utils.search_history(["cp"])] == [1, 2]
@@ -0,0 +1,63 @@
+import os
+from src.utils.index_utils import TrigramIndex, trigram_query, trigrams
+
+
+def _grams(*words):
+    return set().union(*(trigrams(w.encode()) for w in words))
+
+
+def test_trigram_query_from_patterns():
+    assert trigram_query(["Hello"]) == [_grams("hello")]
+    assert trigram_query(["a.b"], fixed=True) == [_grams("a.b")]
+    assert trigram_query([r"foo\d+bar"]) == [_grams("foo", "bar")]
+    assert trigram_query(["(abc|xyz)"]) == [_grams("abc"), _grams("xyz")]
+    assert trigram_query(["ab.cd"]) is None
+    assert trigram_query(["abc", "x"]) is None
+
+
+def test_index_updates_only_changed_files(tmp_path):
+    root = tmp_path / "tree"
+    root.mkdir()
+    a, b = root / "a.txt", root / "b.txt"
+    a.write_text("needle here\n")
+    b.write_text("nothing\n")
+
+    with TrigramIndex(root, tmp_path / "idx" / "i.sqlite") as index:
+        assert index.update([a, b]) == (2, 0)
+        assert index.update([a, b]) == (0, 0)
+        assert index.candidates(trigram_query(["needle"])) == {str(a)}
+
+        b.write_text("a needle too\n")
+        os.utime(b, ns=(b.stat().st_mtime_ns + 10**9,) * 2)
+        assert index.update([a, b]) == (1, 0)
+        assert index.candidates(trigram_query(["NEEDLE"], ignore_case=True)) == {str(a), str(b)}
+
+        assert index.update([b]) == (0, 1)
+        assert index.candidates(trigram_query(["needle"])) == {str(b)}
+        assert index.candidates(None) is None
+        assert index.stats()["files"] == 1
+
+
+def test_unindexed_files_are_always_candidates(tmp_path, monkeypatch):
+    import src.utils.index_utils as index_utils
+    monkeypatch.setattr(index_utils, "GREP_INDEX_MAX_FILE_SIZE", 4)
+    big = tmp_path / "big.txt"
+    big.write_text("needle\n")
+    with TrigramIndex(tmp_path, tmp_path / "idx" / "i.sqlite") as index:
+        index.update([big])
+        assert index.candidates(trigram_query(["other"])) == {str(big)}
+
+
+def test_changed_files_are_searched_before_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(TrigramIndex, "COMPACT_RATIO", 1.0)
+    files = [tmp_path / f"f{i}.txt" for i in range(4)]
+    for f in files:
+        f.write_text("plain text\n")
+    with TrigramIndex(tmp_path, tmp_path / "idx" / "i.sqlite") as index:
+        index.update(files)
+        index.compact()
+        files[2].write_text("now a needle\n")
+        index.update(files)
+        assert index.stats()["pending"] == 1
+        assert index.candidates(trigram_query(["needle"])) == {str(files[2])}
+        assert index.candidates(trigram_query(["plain"])) == {str(f) for f in files if f != files[2]}
@@ -1,5 +1,5 @@
 import pytest
-from src.commands.listing import Ls, Cat
+from src.commands.listing import Ls, Cat, Head, Tail
 from src.core.errors import ExecutionError
 from .conftest import pc
 
@@ -36,3 +36,109 @@ def test_cat_dir_raises(tmp_path, ctx):
 def test_cat_missing_raises(ctx):
     with pytest.raises(ExecutionError):
         Cat().execute(pc("cat", pos=["missing.txt"]), ctx)
+
+def test_ls_long_streams_rows(tmp_path, ctx, capsys, monkeypatch):
+    import src.utils.output_utils as output_utils
+    monkeypatch.setattr(output_utils.write_table, "__defaults__", (3, ()))
+    d = tmp_path / "big"
+    (d / "sub").mkdir(parents=True)
+    (d / "broken").symlink_to(d / "missing")
+    for i in range(10):
+        (d / f"f{i}.txt").write_text("x" * i)
+    Ls().execute(pc("ls", flags={"l"}, pos=["big"]), ctx)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("Name") and len(lines) == 13
+    names = {line.split()[0] for line in lines[1:]}
+    assert "sub" in names and "broken" in names and "f9.txt" in names
+    assert any(line.startswith("sub (DIR)") for line in lines)
+
+def _names(capsys):
+    return [line.split()[0] for line in capsys.readouterr().out.splitlines()]
+
+def test_ls_sorting_and_hidden(tmp_path, ctx, capsys):
+    import os
+    d = tmp_path / "s"
+    d.mkdir()
+    for i, name in enumerate(["b.txt", "a.py", "c", ".hidden"]):
+        (d / name).write_text("x" * (i * 10))
+        os.utime(d / name, ns=(0, i * 10**9))
+    Ls().execute(pc("ls", flags={"S"}, pos=["s"]), ctx)
+    assert _names(capsys) == ["c", "a.py", "b.txt"]
+    Ls().execute(pc("ls", flags={"t", "a"}, pos=["s"]), ctx)
+    assert _names(capsys) == [".hidden", "c", "a.py", "b.txt"]
+    Ls().execute(pc("ls", flags={"X"}, pos=["s"]), ctx)
+    assert _names(capsys) == ["c", "a.py", "b.txt"]
+    Ls().execute(pc("ls", flags={"l", "h", "S"}, pos=["s"]), ctx)
+    assert _names(capsys) == ["Name", "c", "a.py", "b.txt"]
+
+def test_ls_recursive(tmp_path, ctx, capsys):
+    d = tmp_path / "r"
+    (d / "x" / "deep").mkdir(parents=True)
+    (d / ".git").mkdir()
+    (d / "x" / "deep" / "f.txt").write_text("")
+    (d / "y.txt").write_text("")
+    Ls().execute(pc("ls", flags={"R", "X"}, pos=["r"]), ctx)
+    assert capsys.readouterr().out.split("\n\n") == ["r:\nx\ny.txt", "r/x:\ndeep", "r/x/deep:\nf.txt\n"]
+
+
+def test_cat_streams_in_chunks(tmp_path, ctx, capsys, monkeypatch):
+    import src.utils.output_utils as output_utils
+    monkeypatch.setattr(output_utils, "COPY_CHUNK", 3)
+    p = tmp_path / "u.txt"
+    p.write_text("привет\nмир", encoding="utf-8") # characters split between chunks
+    Cat().execute(pc("cat", pos=[str(p)]), ctx)
+    assert capsys.readouterr().out == "привет\nмир\n"
+
+def test_cat_into_a_file_copies_bytes(tmp_path, ctx):
+    from src.utils.output_utils import OutputSink
+    data = bytes(range(256)) * 1000 + b"\n"
+    (tmp_path / "bin").write_bytes(data)
+    with open(tmp_path / "out", "w") as stream:
+        ctx.out = OutputSink(stream)
+        ctx.out.write("before\n")
+        Cat().execute(pc("cat", pos=["bin"]), ctx)
+    assert (tmp_path / "out").read_bytes() == b"before\n" + data
+
+def test_head(tmp_path, ctx, capsys, monkeypatch):
+    import src.commands.listing as listing_mod
+    monkeypatch.setattr(listing_mod, "READ_BLOCK", 4)
+    p = tmp_path / "h.txt"
+    p.write_text("".join(f"line {i}\n" for i in range(20)) + "no newline")
+    Head().execute(pc("head", pos=["h.txt"]), ctx)
+    assert capsys.readouterr().out.splitlines() == [f"line {i}" for i in range(10)]
+    Head().execute(pc("head", pos=["h.txt"], options={"n": ["30"]}), ctx)
+    assert capsys.readouterr().out.endswith("line 19\nno newline\n")
+    Head().execute(pc("head", pos=["h.txt"], options={"n": ["0"]}), ctx)
+    assert capsys.readouterr().out == ""
+    with pytest.raises(ExecutionError):
+        Head().execute(pc("head", pos=["h.txt"], options={"n": ["-1"]}), ctx)
+
+def test_tail_reads_backward(tmp_path, ctx, capsys):
+    import io
+    p = tmp_path / "t.txt"
+    p.write_text("".join(f"line {i}\n" for i in range(100)))
+    Tail().execute(pc("tail", pos=["t.txt"], options={"n": ["3"]}), ctx)
+    assert capsys.readouterr().out == "line 97\nline 98\nline 99\n"
+
+    for data in (b"a\nb\nc\n", b"a\nb\nc", b"\n\n\n", b"abc", b""):
+        for n in range(5):
+            expected = b"".join(data.splitlines(keepends=True)[-n:]) if n else b""
+            f = io.BytesIO(data)
+            assert data[Tail.tail_offset(f, n, block=2):] == expected, (data, n)
+
+def test_du(tmp_path, ctx, capsys):
+    from src.commands.listing import Du
+    (tmp_path / "d" / "sub").mkdir(parents=True)
+    (tmp_path / "d" / "sub" / "f").write_bytes(b"x" * 50000)
+    Du().execute(pc("du", pos=["d"]), ctx)
+    lines = [line.split("\t") for line in capsys.readouterr().out.splitlines()]
+    assert [name for _, name in lines] == ["d/sub", "d"]
+    assert int(lines[0][0]) >= 48 and int(lines[1][0]) > int(lines[0][0])
+
+    Du().execute(pc("du", flags={"s", "h", "cache"}, pos=["d"]), ctx)
+    size, name = capsys.readouterr().out.strip().split("\t")
+    assert name == "d" and size.endswith("K")
+    Du().execute(pc("du", pos=["d/sub/f"]), ctx)
+    assert capsys.readouterr().out.strip().endswith("\td/sub/f")
+    with pytest.raises(ExecutionError):
+        Du().execute(pc("du", pos=["d"], options={"max-depth": ["-1"]}), ctx)
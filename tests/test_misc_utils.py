@@ -2,6 +2,7 @@ import json
 from datetime import UTC, datetime
 from pathlib import Path
 
+import pytest
 import src.utils.misc_utils as misc_utils
 from src.core.models import HistoryEntry
 from src.core.services import Context
@@ -56,8 +57,8 @@ def test_get_history_bad_json(monkeypatch, tmp_path):
 
 
 def test_append_history_updates_context_and_file(monkeypatch, tmp_path):
-    history_path = tmp_path / "history.json"
-    history_path.write_text("[]")
+    history_path = tmp_path / "history.jsonl"
+    history_path.write_text("")
     monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
 
     ctx = Context()
@@ -68,7 +69,7 @@ def test_append_history_updates_context_and_file(monkeypatch, tmp_path):
 
     assert ctx.history[-1] == entry
 
-    saved = json.loads(history_path.read_text())
+    saved = [json.loads(line) for line in history_path.read_text().splitlines()]
     assert saved and saved[-1]["name"] == entry.name
     assert saved[-1]["id"] == entry.id
 
@@ -88,25 +89,42 @@ def test_append_history_skips_file_when_disabled(monkeypatch, tmp_path):
     assert json.loads(history_path.read_text()) == []
 
 
+def _write_journal(path: Path, records: list[dict]):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+
 def test_remove_entry_from_file(monkeypatch, tmp_path):
-    history_path = tmp_path / "history.json"
-    history_path.write_text(json.dumps([
+    history_path = tmp_path / "history.jsonl"
+    _write_journal(history_path, [
         {"id": 1, "name": "ls", "raw": "ls", "flags": [], "positionals": [], "cwd": str(tmp_path), "timestamp": "t", "meta": {}},
         {"id": 2, "name": "cat", "raw": "cat f", "flags": [], "positionals": ["f"], "cwd": str(tmp_path), "timestamp": "t", "meta": {}},
-    ]))
+    ])
     monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
+    before = history_path.read_text()
 
     misc_utils.remove_entry_from_file(1)
 
-    data = json.loads(history_path.read_text())
+    lines = history_path.read_text().splitlines()
+    assert len(lines) == 3 and json.loads(lines[-1]) == {"op": "remove", "id": 1}
+    assert history_path.read_text().startswith(before)
+
+    data = misc_utils.get_history()
     assert len(data) == 1 and data[0]["id"] == 2
 
 
+def test_get_history_skips_torn_line(monkeypatch, tmp_path):
+    history_path = tmp_path / "history.jsonl"
+    history_path.write_text(json.dumps({"id": 1, "raw": "ls"}) + "\n" + '{"id": 2, "ra')
+    monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
+
+    assert [e["id"] for e in misc_utils.get_history()] == [1]
+
+
 def test_update_history_from_file(monkeypatch, tmp_path):
-    history_path = tmp_path / "history.json"
-    history_path.write_text(json.dumps([
+    history_path = tmp_path / "history.jsonl"
+    _write_journal(history_path, [
         {"id": 7, "name": "ls", "raw": "ls", "flags": ["l"], "positionals": [], "cwd": str(tmp_path), "timestamp": "t", "meta": {}}
-    ]))
+    ])
     monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
 
     ctx = Context()
@@ -130,11 +148,49 @@ def test_cmd_from_history_entry(tmp_path):
 
 
 def test_setup_creates_history_file(monkeypatch, tmp_path):
-    history_path = tmp_path / "history.json"
+    history_path = tmp_path / "history.jsonl"
     monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
+    monkeypatch.setattr(misc_utils, "LEGACY_HISTORY_FILE", tmp_path / "history.json")
     assert not history_path.exists()
 
     misc_utils.setup()
 
     assert history_path.exists()
     assert history_path.read_text() == ""
+
+
+def test_setup_migrates_legacy_history(monkeypatch, tmp_path):
+    history_path = tmp_path / "history.jsonl"
+    legacy_path = tmp_path / "history.json"
+    legacy_path.write_text(json.dumps([
+        {"id": 1, "name": "ls", "raw": "ls"},
+        {"id": 2, "name": "cd", "raw": "cd src"},
+    ], indent=4))
+    monkeypatch.setattr(misc_utils, "HISTORY_FILE", history_path)
+    monkeypatch.setattr(misc_utils, "LEGACY_HISTORY_FILE", legacy_path)
+
+    misc_utils.setup()
+
+    assert not legacy_path.exists()
+    assert (tmp_path / "history.json.migrated").exists()
+    assert [e["raw"] for e in misc_utils.get_history()] == ["ls", "cd src"]
+
+    misc_utils.setup()
+    assert len(misc_utils.get_history()) == 2
+
+
+def test_parse_size():
+    from src.utils.misc_utils import parse_size
+    assert parse_size("512") == 512
+    assert parse_size("10K") == 10 * 1024
+    assert parse_size("1.5m") == 1536 * 1024
+    assert parse_size("2GiB") == 2 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size("ten")
+
+def test_format_size():
+    from src.utils.misc_utils import format_size
+    assert format_size(512) == "512"
+    assert format_size(1536) == "1.5K"
+    assert format_size(12 * 1024 ** 2) == "12M"
+    assert format_size(3 * 1024 ** 5) == "3072T"
@@ -0,0 +1,73 @@
+import io
+import pytest
+from src.utils.output_utils import OutputSink
+
+
+class Tty(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_size_policy_buffers_until_full():
+    stream = io.StringIO()
+    out = OutputSink(stream, buffer_size=10, flush="size")
+    out.writeline("abc")
+    assert stream.getvalue() == ""
+    out.writeline("defghij")
+    assert stream.getvalue() == "abc\ndefghij\n"
+    out.write("tail")
+    out.flush()
+    assert stream.getvalue().endswith("tail")
+
+
+def test_line_policy_and_interactive():
+    stream = io.StringIO()
+    out = OutputSink(stream, flush="line")
+    out.write("partial")
+    assert stream.getvalue() == ""
+    out.writeline()
+    assert stream.getvalue() == "partial\n"
+
+    tty = Tty()
+    OutputSink(tty, flush="interactive").writeline("now")
+    assert tty.getvalue() == "now\n"
+    pipe = io.StringIO()
+    OutputSink(pipe, flush="interactive").writeline("later")
+    assert pipe.getvalue() == ""
+
+
+def test_colour_is_dropped_off_terminal():
+    pipe, tty = io.StringIO(), Tty()
+    for stream in (pipe, tty):
+        out = OutputSink(stream)
+        out.writelines(["\x1b[32mgreen\x1b[0m", "plain"])
+        out.flush()
+    assert pipe.getvalue() == "green\nplain\n"
+    assert tty.getvalue() == "\x1b[32mgreen\x1b[0m\nplain\n"
+
+
+def test_default_stream_is_looked_up_lazily(capsys):
+    out = OutputSink()
+    out.writeline("captured")
+    out.flush()
+    assert capsys.readouterr().out == "captured\n"
+
+
+def test_unknown_flush_policy():
+    with pytest.raises(ValueError):
+        OutputSink(flush="never")
+
+
+def test_write_table_sizes_columns_from_a_sample():
+    from src.utils.output_utils import write_table
+    stream = io.StringIO()
+    out = OutputSink(stream, color=False)
+    rows = iter([("a", 1, None), ("bbb", 100, None), ("much longer", 5, None)])
+    write_table(out, rows, ["Name", "Size", "Created", "Extra"], sample=2)
+    out.flush()
+    assert stream.getvalue().splitlines() == [
+        "Name  Size  Created",
+        "a        1",
+        "bbb    100",
+        "much longer     5", # past the sample, keeps the widths
+    ]
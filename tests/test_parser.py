@@ -0,0 +1,36 @@
+import pytest
+from src.core.parser import Parser
+from src.core.errors import ParsingError
+
+
+def test_flags_and_positionals():
+    cmd = Parser().tokenize("grep -ri hello .")
+    assert cmd.flags == {"r", "i"}
+    assert cmd.positionals == ["hello", "."]
+
+
+def test_options_with_values():
+    cmd = Parser().tokenize("history -n 5 --cmd cp --since=2026-01-01 -a")
+    assert cmd.options == {"n": ["5"], "cmd": ["cp"], "since": ["2026-01-01"]}
+    assert cmd.flags == {"a"}
+    assert cmd.positionals == []
+
+
+def test_option_value_glued_to_short_option():
+    assert Parser().tokenize("history -n20").options == {"n": ["20"]}
+
+
+def test_option_values_are_unquoted_like_positionals():
+    cmd = Parser().tokenize("""history --cwd "'my dir'" --cmd='cp' -n'5' 'x'""")
+    assert cmd.options == {"cwd": ["my dir"], "cmd": ["cp"], "n": ["5"]}
+    assert cmd.positionals == ["x"]
+
+
+def test_option_without_value():
+    with pytest.raises(ParsingError):
+        Parser().tokenize("history -n")
+
+
+def test_unknown_flag():
+    with pytest.raises(ParsingError):
+        Parser().tokenize("history --nope")
@@ -24,3 +24,220 @@ def test_grep_case_insensitive(tmp_path, ctx, capsys):
     Grep().execute(pc("grep", flags={"i"}, pos=["hello", str(p)]), ctx)
     out = strip_ansi(capsys.readouterr().out)
     assert "ci.txt:1:Hello" in out and "ci.txt:2:HELLO" in out and "ci.txt:3:heLlo" in out
+
+def _make_tree(root, files):
+    root.mkdir(exist_ok=True)
+    for i in range(files):
+        sub = root / f"d{i % 5}"
+        sub.mkdir(exist_ok=True)
+        (sub / f"f{i:03}.txt").write_text(f"line one\nneedle {i}\nline three\n")
+
+def test_grep_parallel_matches_serial(tmp_path, ctx, capsys, monkeypatch):
+    import src.commands.search as search_mod
+    monkeypatch.setattr(search_mod, "GREP_PARALLEL_MIN_FILES", 4)
+    _make_tree(tmp_path / "tree", 40)
+
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "tree"], options={"j": ["1"]}), ctx)
+    serial = strip_ansi(capsys.readouterr().out)
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "tree"], options={"j": ["3"]}), ctx)
+    parallel = strip_ansi(capsys.readouterr().out)
+
+    assert serial == parallel
+    assert len(parallel.splitlines()) == 40
+
+def test_grep_bad_jobs(tmp_path, ctx):
+    with pytest.raises(ExecutionError):
+        Grep().execute(pc("grep", flags={"r"}, pos=["x", str(tmp_path)], options={"j": ["0"]}), ctx)
+
+def test_parallel_grep_stops_on_interrupt(tmp_path):
+    from src.utils.grep_utils import build_matcher, parallel_grep
+    _make_tree(tmp_path, 20)
+    tasks = [(p, p) for p in sorted(tmp_path.rglob("*.txt"))]
+
+    def interrupted():
+        yield from tasks[:5]
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        list(parallel_grep(interrupted(), build_matcher(["needle"]), 2))
+
+
+def test_parallel_grep_workers_are_not_forked_from_the_shell():
+    from src.utils.grep_utils import _pool_context
+    assert _pool_context().get_start_method() in ("forkserver", "spawn")
+
+
+def test_grep_multiple_patterns(tmp_path, ctx, capsys):
+    p = tmp_path / "a.txt"
+    p.write_text("apple\nbanana\ncherry\n")
+    words = tmp_path / "words.txt"
+    words.write_text("cherry\n\n")
+    Grep().execute(pc("grep", pos=[str(p)], options={"e": ["apple"], "f": [str(words)]}), ctx)
+    out = strip_ansi(capsys.readouterr().out).splitlines()
+    assert [line.split(":", 1)[1] for line in out] == ["1:apple", "3:cherry"]
+
+def test_grep_fixed_strings(tmp_path, ctx, capsys):
+    p = tmp_path / "a.txt"
+    p.write_text("a.c\nabc\n")
+    Grep().execute(pc("grep", flags={"F"}, pos=["a.c", str(p)]), ctx)
+    assert strip_ansi(capsys.readouterr().out).strip().endswith(":1:a.c")
+
+def test_grep_checks_positionals(tmp_path, ctx):
+    with pytest.raises(ExecutionError):
+        Grep().execute(pc("grep", pos=[str(tmp_path)]), ctx)
+    with pytest.raises(ExecutionError):
+        Grep().execute(pc("grep", pos=["x", str(tmp_path)], options={"e": ["y"]}), ctx)
+
+def test_grep_index_matches_full_search(tmp_path, ctx, capsys):
+    _make_tree(tmp_path / "tree", 10)
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "tree"]), ctx)
+    plain = capsys.readouterr().out
+    Grep().execute(pc("grep", flags={"r", "index"}, pos=["needle", "tree"]), ctx)
+    assert capsys.readouterr().out == plain
+
+    f = next((tmp_path / "tree").rglob("*.txt"))
+    f.write_text("brand new needle line\n")
+    Grep().execute(pc("grep", flags={"r", "index"}, pos=["brand new", "tree"]), ctx)
+    assert "brand new needle line" in strip_ansi(capsys.readouterr().out)
+
+def test_index_command(tmp_path, ctx, capsys):
+    from src.commands.search import Index
+    _make_tree(tmp_path / "tree", 3)
+    Index().execute(pc("index", pos=["build", "tree"]), ctx)
+    assert "indexed" in capsys.readouterr().out
+    Index().execute(pc("index", pos=["status", "tree"]), ctx)
+    assert "files:" in capsys.readouterr().out
+    Index().execute(pc("index", pos=["drop", "tree"]), ctx)
+    with pytest.raises(ExecutionError):
+        Index().execute(pc("index", pos=["status", "tree"]), ctx)
+    with pytest.raises(ExecutionError):
+        Index().execute(pc("index", pos=["rebuild", "tree"]), ctx)
+
+def test_grep_binary_files(tmp_path, ctx, capsys):
+    (tmp_path / "bin.dat").write_bytes(b"\x00\x01needle\x02")
+    (tmp_path / "text.txt").write_text("needle\n")
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "."]), ctx)
+    out = strip_ansi(capsys.readouterr().out).splitlines()
+    assert sorted(out) == ["Binary file bin.dat matches", "text.txt:1:needle"]
+
+    Grep().execute(pc("grep", flags={"r", "I"}, pos=["needle", "."]), ctx)
+    assert strip_ansi(capsys.readouterr().out).splitlines() == ["text.txt:1:needle"]
+
+def test_grep_max_filesize(tmp_path, ctx, capsys):
+    (tmp_path / "big.txt").write_text("needle\n" + "x" * 2048)
+    (tmp_path / "small.txt").write_text("needle\n")
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "."], options={"max-filesize": ["1K"]}), ctx)
+    assert strip_ansi(capsys.readouterr().out).splitlines() == ["small.txt:1:needle"]
+    with pytest.raises(ExecutionError):
+        Grep().execute(pc("grep", flags={"r"}, pos=["needle", "."], options={"max-filesize": ["lots"]}), ctx)
+
+def test_grep_prunes_ignored_trees(tmp_path, ctx, capsys):
+    root = tmp_path / "repo"
+    for rel in ["src/a.py", "build/out.py", ".git/objects/x", "logs/app.log", "logs/keep.log"]:
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text("needle\n")
+    (root / ".gitignore").write_text("build/\n*.log\n")
+    (root / "logs" / ".ignore").write_text("!keep.log\n")
+
+    Grep().execute(pc("grep", flags={"r"}, pos=["needle", "repo"]), ctx)
+    found = {line.split(":")[0] for line in strip_ansi(capsys.readouterr().out).splitlines()}
+    assert found == {"repo/src/a.py", "repo/logs/keep.log"}
+
+    Grep().execute(pc("grep", flags={"r", "no-ignore"}, pos=["needle", "repo"]), ctx)
+    found = {line.split(":")[0] for line in strip_ansi(capsys.readouterr().out).splitlines()}
+    assert "repo/build/out.py" in found and "repo/.git/objects/x" not in found
+
+def test_grep_inside_archives(tmp_path, ctx, capsys, monkeypatch):
+    from src.commands.archive import Tar, Zip
+    import src.commands.search as search_mod
+    src = tmp_path / "logs"
+    (src / "app").mkdir(parents=True)
+    (src / "app" / "a.log").write_text("ok\nERROR disk full\n")
+    (src / "b.log").write_text("ERROR again\n")
+    Zip().execute(pc("zip", pos=["logs", "bundle.zip"]), ctx)
+    Tar().execute(pc("tar", pos=["logs", "bundle.tar"]), ctx)
+
+    # explicit archive path turns member search on by itself
+    Grep().execute(pc("grep", pos=["ERROR", "bundle.zip"]), ctx)
+    assert sorted(strip_ansi(capsys.readouterr().out).splitlines()) == [
+        "bundle.zip:app/a.log:2:ERROR disk full", "bundle.zip:b.log:1:ERROR again"]
+
+    monkeypatch.setattr(search_mod, "GREP_PARALLEL_MIN_FILES", 2)
+    (src / "b.log").unlink()
+    Grep().execute(pc("grep", flags={"r", "z"}, pos=["disk", "."], options={"j": ["2"]}), ctx)
+    out = strip_ansi(capsys.readouterr().out).splitlines()
+    assert sorted(out) == ["bundle.tar:logs/app/a.log:2:ERROR disk full",
+                           "bundle.zip:app/a.log:2:ERROR disk full",
+                           "logs/app/a.log:2:ERROR disk full"]
+
+
+def test_grep_output_modes(tmp_path, ctx, capsys):
+    _make_tree(tmp_path / "tree", 4)
+    (tmp_path / "tree" / "d0" / "none.txt").write_text("nothing\n")
+    (tmp_path / "tree" / "d1" / "many.txt").write_text("needle\nneedle\nneedle\n")
+
+    def run(flags=(), options=None):
+        cmd = pc("grep", flags={"r", *flags}, pos=["needle", "tree"], options=options or {})
+        Grep().execute(cmd, ctx)
+        return sorted(strip_ansi(capsys.readouterr().out).splitlines()), cmd.meta["matched"]
+
+    counts, _ = run({"c"})
+    assert "tree/d0/none.txt:0" in counts and "tree/d1/many.txt:3" in counts and len(counts) == 6
+    assert "tree/d1/many.txt:2" in run({"c"}, {"m": ["2"]})[0]
+    assert run(options={"m": ["1"]})[0].count("tree/d1/many.txt:1:needle") == 1
+    assert len(run(options={"m": ["1"]})[0]) == 5
+    files, _ = run({"l"})
+    assert "tree/d1/many.txt" in files and "tree/d0/none.txt" not in files and len(files) == 5
+    assert run({"L"}) == (["tree/d0/none.txt"], True)
+    assert run({"q"}) == ([], True)
+
+def test_grep_quiet_stops_the_walk(tmp_path, ctx, capsys, monkeypatch):
+    import src.commands.search as search_mod
+    _make_tree(tmp_path / "tree", 10)
+    searched = []
+    real = search_mod.grep_task
+    monkeypatch.setattr(search_mod, "grep_task", lambda task, options: searched.append(task) or real(task, options))
+
+    cmd = pc("grep", flags={"r", "q"}, pos=["needle", "tree"], options={"j": ["1"]})
+    Grep().execute(cmd, ctx)
+    assert cmd.meta["matched"] and len(searched) == 1 and capsys.readouterr().out == ""
+
+    cmd = pc("grep", flags={"r", "q"}, pos=["missing", "tree"], options={"j": ["1"]})
+    Grep().execute(cmd, ctx)
+    assert not cmd.meta["matched"] and len(searched) == 11
+
+def test_grep_bad_max_count(tmp_path, ctx):
+    p = tmp_path / "a.txt"
+    p.write_text("x\n")
+    with pytest.raises(ExecutionError):
+        Grep().execute(pc("grep", pos=["x", str(p)], options={"m": ["-1"]}), ctx)
+
+def test_find(tmp_path, ctx, capsys):
+    from src.commands.search import Find
+    root = tmp_path / "ft"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "node_modules" / "x").mkdir(parents=True)
+    (root / "a" / "f.py").write_text("x" * 2000)
+    (root / "a" / "b" / "g.py").write_text("")
+    (root / "node_modules" / "x" / "h.py").write_text("")
+    (root / "README.md").write_text("")
+
+    def run(**options):
+        flags = {"prune"} if options.pop("prune", False) else set()
+        opts = {k: [v] for k, v in options.items()}
+        Find().execute(pc("find", flags=flags, pos=["ft"], options=opts), ctx)
+        return sorted(capsys.readouterr().out.splitlines())
+
+    assert run(name="*.py") == ["ft/a/b/g.py", "ft/a/f.py", "ft/node_modules/x/h.py"]
+    assert run(iname="readme*", type="f") == ["ft/README.md"]
+    assert run(type="d", maxdepth="1") == ["ft", "ft/a", "ft/node_modules"]
+    assert run(name="node_modules", prune=True) == ["ft/node_modules"]
+    assert run(size="+1K", type="f") == ["ft/a/f.py"] # 2000 bytes round up to 2K
+    assert run(size="2k", type="f") == ["ft/a/f.py"]
+    assert run(mtime="-1", name="*.md") == ["ft/README.md"]
+    assert run(mtime="+1") == []
+    assert len(run(j="3")) == 9
+    with pytest.raises(ExecutionError):
+        run(type="x")
+    with pytest.raises(ExecutionError):
+        run(size="big")
@@ -0,0 +1,82 @@
+import os
+from src.utils.sync_utils import apply_sync, plan_sync, undo_sync
+
+
+def snapshot(root):
+    return {str(p.relative_to(root)): (p.read_bytes() if p.is_file() else None)
+            for p in sorted(root.rglob("*"))}
+
+
+def make_pair(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    (src / "a").mkdir(parents=True)
+    (src / "a" / "same.txt").write_text("same")
+    (src / "a" / "grown.txt").write_text("longer now")
+    (src / "touched.txt").write_text("abc")
+    (src / "new.txt").write_text("new")
+    (src / "was_dir").write_text("file now")
+    (dst / "a").mkdir(parents=True)
+    (dst / "a" / "same.txt").write_text("same")
+    (dst / "a" / "grown.txt").write_text("short")
+    (dst / "touched.txt").write_text("xyz")
+    (dst / "was_dir" / "inner").mkdir(parents=True)
+    (dst / "old").mkdir()
+    (dst / "old" / "f").write_text("old")
+    os.utime(dst / "touched.txt", (1_000_000, 1_000_000))
+    for name in ("a/same.txt",):
+        st = (src / name).stat()
+        os.utime(dst / name, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return src, dst
+
+
+def test_plan(tmp_path):
+    src, dst = make_pair(tmp_path)
+    plan = plan_sync(src, dst, jobs=2)
+    rel = lambda tasks: sorted(os.path.relpath(t, dst) for _, t, _ in tasks)
+    assert rel(plan.new) == ["new.txt", "was_dir"]
+    assert rel(plan.changed) == [os.path.join("a", "grown.txt"), "touched.txt"]
+    assert plan.conflicts == ["was_dir"]
+    assert plan.extraneous == ["old"] # not old/f, it goes with old
+    assert plan.unchanged == 1 and plan.mkdirs == []
+
+
+def test_checksum_ignores_mtime(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    (src / "f").write_text("abc")
+    (dst / "f").write_text("abc")
+    (src / "g").write_text("abc")
+    (dst / "g").write_text("abd")
+    os.utime(dst / "f", (1_000_000, 1_000_000))
+    os.utime(dst / "g", ns=((src / "g").stat().st_atime_ns, (src / "g").stat().st_mtime_ns))
+    assert len(plan_sync(src, dst).changed) == 1
+    plan = plan_sync(src, dst, checksum=True)
+    assert [os.path.basename(t) for _, t, _ in plan.changed] == ["g"]
+    assert plan.unchanged == 1
+
+
+def test_apply_then_undo(tmp_path):
+    src, dst = make_pair(tmp_path)
+    before = snapshot(dst)
+    trash = tmp_path / "trash" / "run"
+    apply_sync(plan_sync(src, dst), dst, trash, delete=True, jobs=2)
+    assert snapshot(dst) == snapshot(src)
+    again = plan_sync(src, dst)
+    assert (again.new, again.changed, again.extraneous) == ([], [], [])
+
+    undo_sync(dst, trash)
+    assert snapshot(dst) == before
+    assert not trash.exists()
+
+
+def test_into_missing_dest(tmp_path):
+    src, dst = make_pair(tmp_path)
+    target = tmp_path / "fresh" / "copy"
+    trash = tmp_path / "trash" / "run"
+    plan = plan_sync(src, target)
+    assert plan.mkdirs[0] == "."
+    apply_sync(plan, target, trash)
+    assert snapshot(target) == snapshot(src)
+    undo_sync(target, trash)
+    assert not target.exists()
@@ -0,0 +1,92 @@
+import os
+import pytest
+from pathlib import Path
+import src.utils.walk_utils as walk_utils
+from src.utils.walk_utils import ignore_names, is_empty_dir, scan, walk, walk_files
+
+
+def _rel(root, entries):
+    return sorted(Path(e.path).relative_to(root).as_posix() for e in entries)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for rel in ["a.txt", "sub/b.txt", "sub/deep/c.txt", "skip/d.txt"]:
+        p = tmp_path / "root" / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(rel)
+    return tmp_path / "root"
+
+
+def test_walk_matches_recursive_listing(tree):
+    expected = sorted(p.relative_to(tree).as_posix() for p in tree.rglob("*"))
+    assert _rel(tree, walk(tree, dirs=True)) == expected
+    assert sorted(p.name for p in walk_files(tree)) == ["a.txt", "b.txt", "c.txt", "d.txt"]
+
+
+def test_walk_yields_dirs_before_contents(tree):
+    order = [Path(e.path).relative_to(tree).as_posix() for e in walk(tree, dirs=True)]
+    assert order.index("sub") < order.index("sub/deep") < order.index("sub/deep/c.txt")
+
+
+def test_walk_depth_and_ignore(tree):
+    assert _rel(tree, walk(tree, max_depth=1, dirs=True)) == ["a.txt", "skip", "sub"]
+    assert _rel(tree, walk(tree, ignore=ignore_names("skip", "*.txt"), dirs=True)) == ["sub", "sub/deep"]
+
+
+def test_walk_symlink_policy(tree):
+    os.symlink(tree, tree / "sub" / "loop")
+    assert "sub/loop" in _rel(tree, walk(tree))
+    # followed links still visit every real directory once
+    assert _rel(tree, walk(tree, follow_symlinks=True)) == ["a.txt", "skip/d.txt", "sub/b.txt", "sub/deep/c.txt"]
+
+
+def test_walk_deeper_than_recursion_limit(tmp_path):
+    import sys
+    deep = tmp_path
+    for _ in range(300):
+        deep = deep / "d"
+        deep.mkdir()
+    (deep / "leaf.txt").write_text("x")
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(150) # a recursive walk would need one frame per level
+    try:
+        files = [p.name for p in walk_files(tmp_path)]
+    finally:
+        sys.setrecursionlimit(limit)
+    assert files == ["leaf.txt"]
+
+
+def test_scan_and_is_empty_dir(tmp_path):
+    assert is_empty_dir(tmp_path)
+    (tmp_path / "x").write_text("")
+    assert not is_empty_dir(tmp_path)
+    with pytest.raises(OSError):
+        scan(tmp_path / "missing")
+    assert scan(tmp_path / "missing", on_error=lambda e: None) == []
+
+
+def test_stat_entries_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(walk_utils, "STAT_CHUNK", 3)
+    for i in range(20):
+        (tmp_path / f"f{i}").write_text("x" * i)
+    (tmp_path / "broken").symlink_to(tmp_path / "missing")
+    with os.scandir(tmp_path) as it:
+        entries = list(it)
+    serial = [(e.name, st.st_size) for e, st in walk_utils.stat_entries(entries)]
+    threaded = [(e.name, st.st_size) for e, st in walk_utils.stat_entries(iter(entries), jobs=4)]
+    assert serial == threaded and len(threaded) == 21
+
+
+def test_walk_prune_and_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(walk_utils, "PREFETCH_PER_JOB", 1)
+    for d in ("a/x/y", "b/x", "c", "skip/deep"):
+        (tmp_path / d).mkdir(parents=True)
+        (tmp_path / d / "f.txt").write_text("")
+    prune = lambda entry: entry.name == "skip"
+    serial = [e.path for e in walk(tmp_path, dirs=True, prune=prune)]
+    threaded = [e.path for e in walk(tmp_path, dirs=True, prune=prune, jobs=3)]
+    assert serial == threaded
+    assert _rel(tmp_path, walk(tmp_path, prune=prune, dirs=True)) == [
+        "a", "a/x", "a/x/y", "a/x/y/f.txt", "b", "b/x", "b/x/f.txt", "c", "c/f.txt", "skip"]